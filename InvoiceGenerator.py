@@ -1,5 +1,24 @@
+import argparse
 import random
 import datetime
+import functools
+import json
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from invoice_index import InvoiceIndexWriter, chunk_index
+
+try:
+    import numpy as np
+except ImportError:  # 批量模式需要 NumPy，逐张生成的模式不依赖它
+    np = None
+
+# 每个分片包含的发票数量；分片是随机数流与并行调度的最小单位，与进程数无关
+SHARD_SIZE = 10000
+# 写文件的缓冲区大小（字节）
+WRITE_BUFFER_SIZE = 8 * 1024 * 1024
+# 发票之间的分隔符
+INVOICE_SEPARATOR = "\n" + "=" * 40 + "\n"
 
 # 扩展购买方信息
 buyers = [
@@ -29,9 +48,16 @@ services = [
     {"name": "设备维护费", "unit_price": 1000.00, "tax_rate": 0.06}
 ]
 
+# 模拟开票人
+issuers = ["刘慧敏", "张三", "李四", "赵六", "王五"]
+
+# 批量模式使用的查找表：金额以“分”为单位的整数保存，避免浮点舍入误差
+SERVICE_PRICE_CENTS = [int(round(service["unit_price"] * 100)) for service in services]
+SERVICE_TAX_PERCENT = [int(round(service["tax_rate"] * 100)) for service in services]
+
 # 随机生成发票号
-def generate_invoice_number():
-    return f"{random.randint(2412000000000000, 2412999999999999)}"
+def generate_invoice_number(rng=random):
+    return f"{rng.randint(2412000000000000, 2412999999999999)}"
 
 # 随机生成开票日期
 def generate_invoice_date():
@@ -39,23 +65,23 @@ def generate_invoice_date():
     return today.strftime("%Y年%m月%d日")
 
 # 随机选择购买方信息
-def generate_buyer_info():
-    return random.choice(buyers)
+def generate_buyer_info(rng=random):
+    return rng.choice(buyers)
 
 # 随机选择销售方信息
-def generate_seller_info():
-    return random.choice(sellers)
+def generate_seller_info(rng=random):
+    return rng.choice(sellers)
 
 # 随机生成项目明细
-def generate_service_details():
-    num_services = random.randint(2, 5)  # 每张发票随机选择 2 到 5 项服务
+def generate_service_details(rng=random):
+    num_services = rng.randint(2, 5)  # 每张发票随机选择 2 到 5 项服务
     service_details = []
     total_amount = 0
     total_tax = 0
 
     for _ in range(num_services):
-        service = random.choice(services)
-        quantity = random.randint(1, 10)
+        service = rng.choice(services)
+        quantity = rng.randint(1, 10)
         service_total = service["unit_price"] * quantity
         tax_amount = service_total * service["tax_rate"]
         service_details.append({
@@ -71,32 +97,44 @@ def generate_service_details():
 
     return service_details, round(total_amount, 2), round(total_tax, 2)
 
-# 生成发票文本
-def generate_invoice():
-    invoice_number = generate_invoice_number()
-    invoice_date = generate_invoice_date()
-    buyer_info = generate_buyer_info()
-    seller_info = generate_seller_info()
-    services, subtotal, total_tax = generate_service_details()
-    total_with_tax = round(subtotal + total_tax, 2)
-
-    # 模拟开票人
-    issuer = random.choice(["刘慧敏", "张三", "李四", "赵六", "王五"])
-
-    # 生成发票文本
-    invoice_text = (
-        f"发票号: {invoice_number}\n"
-        f"开票日期: {invoice_date}\n"
+# 随机生成一张发票的结构化记录
+def generate_invoice_record(rng=random, invoice_date=None):
+    invoice_number = generate_invoice_number(rng)
+    if invoice_date is None:
+        invoice_date = generate_invoice_date()
+    buyer_info = generate_buyer_info(rng)
+    seller_info = generate_seller_info(rng)
+    services, subtotal, total_tax = generate_service_details(rng)
+    return {
+        "number": invoice_number,
+        "date": invoice_date,
+        "buyer": buyer_info,
+        "seller": seller_info,
+        "services": services,
+        "subtotal": subtotal,
+        "total_tax": total_tax,
+        "total_with_tax": round(subtotal + total_tax, 2),
+        # 模拟开票人
+        "issuer": rng.choice(issuers),
+    }
+
+# 把结构化记录格式化为发票文本，各段先放入列表，最后一次性拼接
+def format_invoice(record):
+    buyer_info = record["buyer"]
+    seller_info = record["seller"]
+    parts = [
+        f"发票号: {record['number']}\n"
+        f"开票日期: {record['date']}\n"
         f"购买方名称: {buyer_info['name']}\n"
         f"纳税人识别号: {buyer_info['tax_id']}\n"
         f"销售方名称: {seller_info['name']}\n"
         f"纳税人识别号: {seller_info['tax_id']}\n"
         "----------------------------------------\n"
         "项目明细:\n"
-    )
+    ]
 
-    for service in services:
-        invoice_text += (
+    for service in record["services"]:
+        parts.append(
             f"项目名称: {service['name']}\n"
             f"单价: ¥{service['unit_price']:.2f}\n"
             f"数量: {service['quantity']}\n"
@@ -106,25 +144,305 @@ def generate_invoice():
             "----------------------------------------\n"
         )
 
-    invoice_text += (
-        f"金额合计: ¥{subtotal:.2f}\n"
-        f"税额合计: ¥{total_tax:.2f}\n"
-        f"价税合计（大写）: ￥{total_with_tax}\n"
-        f"开票人: {issuer}\n"
+    parts.append(
+        f"金额合计: ¥{record['subtotal']:.2f}\n"
+        f"税额合计: ¥{record['total_tax']:.2f}\n"
+        f"价税合计（大写）: ￥{record['total_with_tax']}\n"
+        f"开票人: {record['issuer']}\n"
     )
 
-    return invoice_text
+    return "".join(parts)
+
+# 紧凑 JSON 编码（保留中文字符）
+def to_json(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+# 单项明细的 JSON 片段，金额保留两位小数
+def format_service_record(service):
+    return (
+        f'{{"name":{to_json(service["name"])},"unit_price":{service["unit_price"]:.2f},'
+        f'"quantity":{service["quantity"]},"amount":{service["service_total"]:.2f},'
+        f'"tax_rate":{service["tax_rate"]},"tax":{service["tax_amount"]:.2f}}}'
+    )
+
+# 把结构化记录编码为一行紧凑 JSON，写入旁路记录文件
+def format_invoice_record(record):
+    items = ",".join(format_service_record(service) for service in record["services"])
+    return (
+        f'{{"number":"{record["number"]}","date":{to_json(record["date"])},'
+        f'"buyer":{to_json(record["buyer"])},"seller":{to_json(record["seller"])},'
+        f'"items":[{items}],"subtotal":{record["subtotal"]:.2f},'
+        f'"total_tax":{record["total_tax"]:.2f},"total":{record["total_with_tax"]:.2f},'
+        f'"issuer":{to_json(record["issuer"])}}}\n'
+    )
+
+# 生成发票文本
+def generate_invoice(rng=random, invoice_date=None):
+    return format_invoice(generate_invoice_record(rng, invoice_date))
+
+# 每个分片使用独立的随机数流，种子只由 (seed, 分片编号) 决定
+def shard_rng(seed, shard_index):
+    return random.Random(f"{seed}:{shard_index}")
+
+# 惰性生成发票：按分片顺序逐张产出，输出只取决于 seed，与进程数无关
+def iter_invoices(count, seed, invoice_date=None, shard_size=SHARD_SIZE):
+    if invoice_date is None:
+        invoice_date = generate_invoice_date()
+    for shard_index, start in enumerate(range(0, count, shard_size)):
+        rng = shard_rng(seed, shard_index)
+        for _ in range(min(shard_size, count - start)):
+            yield generate_invoice(rng, invoice_date)
+
+# 以“分”为单位的整数格式化为两位小数金额
+def format_cents(cents):
+    return f"{cents // 100}.{cents % 100:02d}"
+
+# 单项明细在 (服务, 数量) 组合下的全部取值
+def service_variants():
+    for k, service in enumerate(services):
+        for quantity in range(1, 11):
+            line_cents = SERVICE_PRICE_CENTS[k] * quantity
+            yield {
+                "name": service["name"],
+                "quantity": quantity,
+                "unit_price": service["unit_price"],
+                "service_total": line_cents / 100,
+                "tax_rate": SERVICE_TAX_PERCENT[k],
+                "tax_amount": (line_cents * SERVICE_TAX_PERCENT[k] + 50) // 100 / 100,
+            }
+
+# 批量模式的片段表：发票中每一段文本都只取决于少数几个离散取值，
+# 因此预先编码成字节片段，批量生成时只需用索引数组挑选并拼接。
+# kind="text" 为发票文本，kind="record" 为 JSON 记录；两者的表名和表长一一对应，共用同一个索引矩阵
+@functools.lru_cache(maxsize=8)
+def batch_segments(invoice_date, kind="text"):
+    separator = "----------------------------------------\n"
+    max_yuan = 5 * max(SERVICE_PRICE_CENTS) * 10 * (100 + max(SERVICE_TAX_PERCENT)) // 100 // 100
+    variants = list(service_variants())
+    if kind == "text":
+        line_blocks = [
+            f"项目名称: {service['name']}\n"
+            f"单价: ¥{service['unit_price']:.2f}\n"
+            f"数量: {service['quantity']}\n"
+            f"金额: ¥{service['service_total']:.2f}\n"
+            f"税率: {service['tax_rate']}%\n"
+            f"税额: ¥{service['tax_amount']:.2f}\n"
+            f"{separator}"
+            for service in variants
+        ]
+        tables = {
+            # 发票号 2412 之后的 12 位数字按 3 组 4 位数字拼接
+            "number_head": [f"发票号: 2412{i:04d}" for i in range(10000)],
+            "digits4": [f"{i:04d}" for i in range(10000)],
+            "party": [
+                f"\n开票日期: {invoice_date}\n"
+                f"购买方名称: {buyer['name']}\n"
+                f"纳税人识别号: {buyer['tax_id']}\n"
+                f"销售方名称: {seller['name']}\n"
+                f"纳税人识别号: {seller['tax_id']}\n"
+                f"{separator}"
+                "项目明细:\n"
+                for buyer in buyers for seller in sellers
+            ],
+            # 明细块只取决于 (服务, 数量)；前后两半分别对应首项与后续项，文本中两者相同
+            "line": line_blocks + line_blocks,
+            # 合计部分的标签并入相邻的数字片段，以减少拼接的片段数量
+            "subtotal_yuan": [f"金额合计: ¥{i}." for i in range(max_yuan + 1)],
+            "subtotal_cents": [f"{i:02d}\n税额合计: ¥" for i in range(100)],
+            "yuan": [f"{i}." for i in range(max_yuan + 1)],
+            "tax_cents": [f"{i:02d}\n价税合计（大写）: ￥" for i in range(100)],
+            # 价税合计沿用逐张模式中 str(float) 的写法，例如 4944.0、4944.5、4944.55
+            "total_cents_issuer": [
+                f"{'0' if i == 0 else str(i // 10) if i % 10 == 0 else f'{i:02d}'}\n开票人: {issuer}\n{INVOICE_SEPARATOR}"
+                for issuer in issuers for i in range(100)
+            ],
+        }
+    else:
+        line_records = [format_service_record(service) for service in variants]
+        tables = {
+            "number_head": [f'{{"number":"2412{i:04d}' for i in range(10000)],
+            "digits4": [f"{i:04d}" for i in range(10000)],
+            "party": [
+                f'","date":{to_json(invoice_date)},"buyer":{to_json(buyer)},"seller":{to_json(seller)},"items":['
+                for buyer in buyers for seller in sellers
+            ],
+            # 后续明细项前面带逗号
+            "line": line_records + ["," + record for record in line_records],
+            "subtotal_yuan": [f'],"subtotal":{i}.' for i in range(max_yuan + 1)],
+            "subtotal_cents": [f'{i:02d},"total_tax":' for i in range(100)],
+            "yuan": [f"{i}." for i in range(max_yuan + 1)],
+            "tax_cents": [f'{i:02d},"total":' for i in range(100)],
+            "total_cents_issuer": [
+                f'{i:02d},"issuer":{to_json(issuer)}}}\n' for issuer in issuers for i in range(100)
+            ],
+        }
+    encoded = []
+    bases = {}
+    for name, table in tables.items():
+        bases[name] = len(encoded)
+        encoded.extend(text.encode("utf-8") for text in table)
+    # 以对象数组保存，便于用索引数组一次性取出所有片段
+    segments = np.empty(len(encoded), dtype=object)
+    segments[:] = encoded
+    lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+    return segments, lengths, bases
+
+# 批量抽取一块发票的全部随机字段，并以整数“分”向量化计算金额
+def draw_invoice_batch(count, rng):
+    if np is None:
+        raise RuntimeError("批量生成模式需要安装 NumPy")
+    fields = {
+        "number_digits": rng.integers(0, 10000, size=(count, 3)),
+        "buyer": rng.integers(0, len(buyers), size=count),
+        "seller": rng.integers(0, len(sellers), size=count),
+        "issuer": rng.integers(0, len(issuers), size=count),
+        "num_services": rng.integers(2, 6, size=count),  # 每张发票 2 到 5 项服务
+    }
+    # 所有发票的服务明细拼成一个扁平数组，offsets 记录每张发票的起始位置
+    num_lines = int(fields["num_services"].sum())
+    offsets = np.zeros(count, dtype=np.int64)
+    np.cumsum(fields["num_services"][:-1], out=offsets[1:])
+    service_idx = rng.integers(0, len(services), size=num_lines)
+    quantities = rng.integers(1, 11, size=num_lines)
+
+    price_cents = np.asarray(SERVICE_PRICE_CENTS, dtype=np.int64)[service_idx]
+    tax_percent = np.asarray(SERVICE_TAX_PERCENT, dtype=np.int64)[service_idx]
+    line_cents = price_cents * quantities
+    tax_units = line_cents * tax_percent  # 单位为 0.01 分，仍是精确整数
+    fields.update(
+        offsets=offsets,
+        service=service_idx,
+        quantity=quantities,
+        line_cents=line_cents,
+        line_tax_cents=(tax_units + 50) // 100,  # 四舍五入到分
+        subtotal_cents=np.add.reduceat(line_cents, offsets),
+        total_tax_cents=(np.add.reduceat(tax_units, offsets) + 50) // 100,
+    )
+    fields["total_cents"] = fields["subtotal_cents"] + fields["total_tax_cents"]
+    return fields
+
+# 把批量字段转换成片段索引矩阵，每行对应一张发票，未使用的明细位置填 -1
+def batch_segment_matrix(fields, bases):
+    count = len(fields["buyer"])
+    max_services = 5
+    matrix = np.full((count, 10 + max_services), -1, dtype=np.int64)
+    matrix[:, 0] = bases["number_head"] + fields["number_digits"][:, 0]
+    matrix[:, 1:3] = bases["digits4"] + fields["number_digits"][:, 1:]
+    matrix[:, 3] = bases["party"] + fields["buyer"] * len(sellers) + fields["seller"]
+
+    slot = np.arange(len(fields["service"])) - np.repeat(fields["offsets"], fields["num_services"])
+    rows = np.repeat(np.arange(count), fields["num_services"])
+    matrix[rows, 4 + slot] = (bases["line"] + (slot > 0) * len(services) * 10
+                              + fields["service"] * 10 + fields["quantity"] - 1)
+
+    tail = 4 + max_services
+    matrix[:, tail] = bases["subtotal_yuan"] + fields["subtotal_cents"] // 100
+    matrix[:, tail + 1] = bases["subtotal_cents"] + fields["subtotal_cents"] % 100
+    matrix[:, tail + 2] = bases["yuan"] + fields["total_tax_cents"] // 100
+    matrix[:, tail + 3] = bases["tax_cents"] + fields["total_tax_cents"] % 100
+    matrix[:, tail + 4] = bases["yuan"] + fields["total_cents"] // 100
+    matrix[:, tail + 5] = bases["total_cents_issuer"] + fields["issuer"] * 100 + fields["total_cents"] % 100
+    return matrix
+
+# 按索引矩阵挑选片段并拼接成字节块
+def assemble_segments(matrix, invoice_date, kind="text"):
+    segments, _, _ = batch_segments(invoice_date, kind)
+    return b"".join(segments[matrix[matrix >= 0]].tolist())
+
+# 批量生成一块发票，返回 (以分隔符连接的 UTF-8 文本, 每张一行的 JSON 记录或 None)；
+# 只有最后的拼接按片段进行，不逐张格式化
+def generate_invoice_batch(count, rng, invoice_date=None, with_records=False):
+    if count == 0:
+        return b"", (b"" if with_records else None)
+    if invoice_date is None:
+        invoice_date = generate_invoice_date()
+    fields = draw_invoice_batch(count, rng)
+    _, _, bases = batch_segments(invoice_date)
+    matrix = batch_segment_matrix(fields, bases)
+    text = assemble_segments(matrix, invoice_date)
+    records = assemble_segments(matrix, invoice_date, "record") if with_records else None
+    return text, records
+
+# 生成单个分片（在子进程中执行），返回 (文本字节块, JSON 记录字节块, 分片内相对索引)；
+# with_index=False 时后两项为 None
+def generate_shard(args):
+    seed, shard_index, shard_count, invoice_date, batch, with_index = args
+    if batch:
+        text, records = generate_invoice_batch(
+            shard_count, np.random.default_rng([seed, shard_index]), invoice_date, with_index)
+    else:
+        rng = shard_rng(seed, shard_index)
+        chunk = []
+        record_lines = []
+        for _ in range(shard_count):
+            record = generate_invoice_record(rng, invoice_date)
+            chunk.append(format_invoice(record))
+            chunk.append(INVOICE_SEPARATOR)
+            if with_index:
+                record_lines.append(format_invoice_record(record))
+        text = "".join(chunk).encode("utf-8")
+        records = "".join(record_lines).encode("utf-8") if with_index else None
+    if not with_index:
+        return text, None, None
+    return text, records, chunk_index(text, records, INVOICE_SEPARATOR.encode("utf-8"))
+
+# 按顺序列出所有分片的参数
+def iter_shard_args(count, seed, invoice_date, shard_size=SHARD_SIZE, batch=False, with_index=False):
+    for shard_index, start in enumerate(range(0, count, shard_size)):
+        yield seed, shard_index, min(shard_size, count - start), invoice_date, batch, with_index
+
+# 按分片顺序产出 generate_shard 的结果；workers > 1 时使用进程池，并限制在途分片数量以控制内存
+def iter_shard_chunks(count, seed, invoice_date, workers=1, shard_size=SHARD_SIZE, batch=False, with_index=False):
+    shard_args = iter_shard_args(count, seed, invoice_date, shard_size, batch, with_index)
+    if workers <= 1:
+        for args in shard_args:
+            yield generate_shard(args)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for args in shard_args:
+            pending.append(executor.submit(generate_shard, args))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
 
 # 将发票写入文件
-def generate_invoices_to_file(filename, count):
-    with open(filename, 'w', encoding='utf-8') as f:
-        for _ in range(count):
-            invoice = generate_invoice()
-            f.write(invoice)
-            f.write("\n" + "=" * 40 + "\n")  # 分隔符，用于区分每张发票
+# batch=True 时使用 NumPy 向量化批量生成（随机数流与逐张模式不同，但同样由 seed 唯一决定）；
+# with_index=True 时同时写出 JSON 记录与字节偏移索引（见 invoice_index.py）
+def generate_invoices_to_file(filename, count, seed=None, workers=1, shard_size=SHARD_SIZE, batch=False,
+                              with_index=True):
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    invoice_date = generate_invoice_date()
+    index_writer = InvoiceIndexWriter(filename) if with_index else None
+    try:
+        with open(filename, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+            for text, records, index in iter_shard_chunks(
+                    count, seed, invoice_date, workers, shard_size, batch, with_index):
+                f.write(text)  # 每个分片内的发票以分隔符区分
+                if index_writer is not None:
+                    index_writer.append(text, records, index)
+    finally:
+        if index_writer is not None:
+            index_writer.close()
+    return seed
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="批量生成模拟发票文本")
+    parser.add_argument("--output", default="generated_invoices.txt", help="输出文件路径")
+    parser.add_argument("--count", type=int, default=10000, help="生成的发票数量")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子，相同种子的输出逐字节一致")
+    parser.add_argument("--workers", type=int, default=1, help="并行进程数")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="每个分片的发票数量")
+    parser.add_argument("--batch", action="store_true", help="使用 NumPy 向量化批量生成")
+    parser.add_argument("--no-index", action="store_true", help="不写出 JSON 记录与偏移索引旁路文件")
+    return parser.parse_args()
 
 # 生成并写入10000张发票到文件
 if __name__ == "__main__":
-    output_filename = "generated_invoices.txt"
-    generate_invoices_to_file(output_filename, 10)
-    print(f"已生成 10 张发票，并保存到文件: {output_filename}")
+    args = parse_args()
+    seed = generate_invoices_to_file(args.output, args.count, args.seed, args.workers, args.shard_size, args.batch,
+                                     not args.no_index)
+    print(f"已生成 {args.count} 张发票（种子: {seed}），并保存到文件: {args.output}")
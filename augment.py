@@ -0,0 +1,182 @@
+import math
+import re
+import zlib
+
+try:
+    import numpy as np
+except ImportError:  # 没有 NumPy 时不能做图像增强
+    np = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# =======================
+# 训练样本的图像增强
+# =======================
+#
+# 每个渲染好的 .tif 只读入一次，一次性生成 variants 个变体：同一张图的所有变体堆叠为 (变体, 高, 宽) 的数组，
+# 每种变换对整批数组做一次向量化运算，各变体的参数（角度、模糊程度等）按变体广播。依次应用：
+#   旋转与水平倾斜（反向映射 + 双线性插值，图外填白）
+#   模糊（5 阶二项式核，按变体的强度与原图混合）
+#   对比度与纸张底色（墨迹变淡、背景变灰）
+#   类 JPEG 压缩（8×8 块 DCT 后按亮度量化表量化）
+#   高斯噪声
+# 几何变换后字符框不再准确，变体写出整行的 WordStr 框（lstm.train 只需要行级文本）与 .gt.txt。
+
+AUGMENTED_PATTERN = re.compile(r"_aug\d+$")
+
+DEFAULT_OPTIONS = {
+    "max_rotation": 1.5,  # 旋转角度上限（度）
+    "max_shear": 0.15,  # 水平倾斜上限（每像素行高的横向位移）
+    "max_blur": 1.0,  # 模糊强度上限，1 为完全使用模糊后的图像
+    "min_contrast": 0.6,  # 墨迹对比度下限，1 为不变
+    "max_background": 0.15,  # 纸张底色变暗的上限（相对白色的比例）
+    "max_jpeg": 3.0,  # 量化表缩放上限，0 为不压缩；约等于 JPEG 质量 50 时的 3 倍步长
+    "max_noise": 12.0,  # 高斯噪声标准差上限（灰度级）
+}
+
+# JPEG 标准亮度量化表（质量 50）
+JPEG_LUMA_TABLE = [
+    [16, 11, 10, 16, 24, 40, 51, 61],
+    [12, 12, 14, 19, 26, 58, 60, 55],
+    [14, 13, 16, 24, 40, 57, 69, 56],
+    [14, 17, 22, 29, 51, 87, 80, 62],
+    [18, 22, 37, 56, 68, 109, 103, 77],
+    [24, 35, 55, 64, 81, 104, 113, 92],
+    [49, 64, 78, 87, 103, 121, 120, 101],
+    [72, 92, 95, 98, 112, 100, 103, 99],
+]
+
+
+def available():
+    return np is not None and Image is not None
+
+
+def is_augmented(name):
+    return AUGMENTED_PATTERN.search(name) is not None
+
+
+def source_name(name):
+    """变体对应的原样本名；留出集按原样本划分，同一样本的变体不会分到训练集与评估集两边"""
+    return AUGMENTED_PATTERN.sub("", name)
+
+
+def variant_name(name, index):
+    return f"{name}_aug{index}"
+
+
+def _dct_matrix(size=8):
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    matrix = np.sqrt(2 / size) * np.cos(np.pi * (2 * n + 1) * k / (2 * size))
+    matrix[0] /= np.sqrt(2)
+    return matrix.astype(np.float32)
+
+
+def _per_variant(values):
+    return values.astype(np.float32)[:, None, None]
+
+
+def _warp(batch, angles, shears):
+    """按各变体的旋转角（弧度）与水平倾斜做仿射变换，输出尺寸留出足以容纳最大变换的白边"""
+    variants, height, width = batch.shape
+    max_angle = float(np.max(np.abs(angles))) if variants else 0.0
+    max_shear = float(np.max(np.abs(shears))) if variants else 0.0
+    pad_y = math.ceil(math.sin(max_angle) * width / 2) + 1
+    pad_x = math.ceil(max_shear * height / 2 + math.sin(max_angle) * height / 2) + 1
+    out_h, out_w = height + 2 * pad_y, width + 2 * pad_x
+
+    # 正向变换 A = R(θ)·S(s)，对输出像素做反向映射 A⁻¹
+    cos, sin = np.cos(angles), np.sin(angles)
+    inv = np.empty((variants, 2, 2), dtype=np.float32)
+    inv[:, 0, 0] = cos + shears * sin
+    inv[:, 0, 1] = sin - shears * cos
+    inv[:, 1, 0] = -sin
+    inv[:, 1, 1] = cos
+    u = np.arange(out_w, dtype=np.float32)[None, None, :] - (out_w - 1) / 2
+    v = np.arange(out_h, dtype=np.float32)[None, :, None] - (out_h - 1) / 2
+    src_x = inv[:, 0, 0, None, None] * u + inv[:, 0, 1, None, None] * v + (width - 1) / 2
+    src_y = inv[:, 1, 0, None, None] * u + inv[:, 1, 1, None, None] * v + (height - 1) / 2
+
+    # 双线性插值；四个相邻像素中落在原图之外的按白色计
+    padded = np.full((variants, height + 2, width + 2), 255, dtype=np.float32)
+    padded[:, 1:-1, 1:-1] = batch
+    src_x = np.clip(src_x + 1, 0, width + 0.999)
+    src_y = np.clip(src_y + 1, 0, height + 0.999)
+    x0 = src_x.astype(np.intp)
+    y0 = src_y.astype(np.intp)
+    fx, fy = src_x - x0, src_y - y0
+    k = np.arange(variants)[:, None, None]
+    top = padded[k, y0, x0] * (1 - fx) + padded[k, y0, x0 + 1] * fx
+    bottom = padded[k, y0 + 1, x0] * (1 - fx) + padded[k, y0 + 1, x0 + 1] * fx
+    return top * (1 - fy) + bottom * fy
+
+
+def _blur(batch, strengths):
+    kernel = np.array([1, 4, 6, 4, 1], dtype=np.float32) / 16
+    padded = np.pad(batch, ((0, 0), (2, 2), (2, 2)), mode='edge')
+    rows = sum(kernel[i] * padded[:, i:i + batch.shape[1], :] for i in range(5))
+    blurred = sum(kernel[i] * rows[:, :, i:i + batch.shape[2]] for i in range(5))
+    return batch + _per_variant(strengths) * (blurred - batch)
+
+
+def _jpeg(batch, scales):
+    """8×8 块 DCT 量化；scale 为 0 的变体保持不变"""
+    variants, height, width = batch.shape
+    pad_h, pad_w = -height % 8, -width % 8
+    padded = np.pad(batch, ((0, 0), (0, pad_h), (0, pad_w)), mode='edge') - 128
+    blocks = padded.reshape(variants, (height + pad_h) // 8, 8, (width + pad_w) // 8, 8)
+    dct = _dct_matrix()
+    coefficients = np.einsum('ij,kajbl,ml->kaibm', dct, blocks, dct, optimize=True)
+    table = np.asarray(JPEG_LUMA_TABLE, dtype=np.float32)
+    steps = np.maximum(scales.astype(np.float32), 1e-6)[:, None, None, None, None] * table[None, :, None, :]
+    quantized = np.where(scales[:, None, None, None, None] > 0,
+                         np.round(coefficients / steps) * steps, coefficients)
+    restored = np.einsum('ij,kaibm,ml->kajbl', dct, quantized, dct, optimize=True)
+    return restored.reshape(padded.shape)[:, :height, :width] + 128
+
+
+def augment_array(image, variants, rng, **options):
+    """由一张灰度图（uint8 数组）生成 variants 个变体，返回 (变体, 高, 宽) 的 uint8 数组"""
+    options = {**DEFAULT_OPTIONS, **options}
+
+    def uniform(low, high):
+        return rng.uniform(low, high, size=variants)
+
+    batch = np.repeat(image.astype(np.float32)[None], variants, axis=0)
+    angle_limit = math.radians(options["max_rotation"])
+    batch = _warp(batch, uniform(-angle_limit, angle_limit), uniform(-options["max_shear"], options["max_shear"]))
+    batch = _blur(batch, uniform(0, options["max_blur"]))
+    contrast = _per_variant(uniform(options["min_contrast"], 1))
+    background = _per_variant(uniform(0, options["max_background"]))
+    batch = (255 - (255 - batch) * contrast) * (1 - background)
+    batch = _jpeg(batch, uniform(0, options["max_jpeg"]))
+    batch += rng.standard_normal(batch.shape, dtype=np.float32) * _per_variant(uniform(0, options["max_noise"]))
+    return np.clip(np.round(batch), 0, 255).astype(np.uint8)
+
+
+def augment_sample(tif_path, output_dir, variants, seed=0, options=None):
+    """读入一个样本的 .tif 与 .gt.txt，在 output_dir 中写出各变体的 .tif/.box/.gt.txt，返回写出的变体数
+
+    随机数按 (seed, 样本名) 确定，同一样本每次得到相同的变体。
+    """
+    with open(tif_path.with_suffix('.gt.txt'), 'r', encoding='utf-8') as f:
+        text = f.read().strip()
+    with Image.open(tif_path) as source:
+        dpi = source.info.get('dpi', (300, 300))
+        image = np.asarray(source.convert('L'))
+    rng = np.random.default_rng([seed, zlib.crc32(tif_path.stem.encode('utf-8'))])
+    batch = augment_array(image, variants, rng, **(options or {}))
+    _, height, width = batch.shape
+    for index, pixels in enumerate(batch, start=1):
+        base = output_dir / variant_name(tif_path.stem, index)
+        Image.fromarray(pixels).save(f"{base}.tif", dpi=dpi)
+        with open(f"{base}.box", 'w', encoding='utf-8') as f:
+            # 整行一个 WordStr 框，之后以制表符框标记行尾
+            f.write(f"WordStr 0 0 {width} {height} 0 #{text}\n")
+            f.write(f"\t {width} 0 {width + 1} {height} 0\n")
+        with open(f"{base}.gt.txt", 'w', encoding='utf-8') as f:
+            f.write(text)
+    return len(batch)
@@ -0,0 +1,185 @@
+"""训练流程的基准测试，无需安装 Tesseract 训练工具和字体
+
+用 benchmarks/stubs 下的替身程序代替 text2image、tesseract、combine_tessdata、lstmtraining，测量：
+  - InvoiceGenerator 的生成速率（逐张与批量两种路径）
+  - 发票文件的逐行读取速率
+  - 渲染、lstmf、训练各阶段的吞吐量与调度效率（子进程忙碌时间 / (墙钟时间 × 并发槽位数)）
+
+用法：
+  python benchmarks/run_benchmarks.py --samples 2000 --latency 0.01 --output benchmarks/results.jsonl
+结果追加写入 --output 指定的 JSON Lines 文件（附带当前提交号），便于跨提交比较。
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCHMARKS_DIR.parent
+STUBS_DIR = BENCHMARKS_DIR / "stubs"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="训练流程基准测试（使用替身程序）")
+    parser.add_argument("--invoices", type=int, default=20000, help="生成速率测试的发票张数")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="发票生成的工作进程数")
+    parser.add_argument("--samples", type=int, default=1000, help="渲染与 lstmf 阶段的样本数")
+    parser.add_argument("--batch-size", type=int, default=8, help="批量渲染测试的每批行数")
+    parser.add_argument("--iterations", type=int, default=2000, help="lstmtraining 替身的迭代次数")
+    parser.add_argument("--latency", type=float, default=0.0, help="每次替身调用的平均延迟（秒）")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="替身调用的失败概率")
+    parser.add_argument("--output", help="把结果追加到该 JSON Lines 文件")
+    parser.add_argument("--keep", action="store_true", help="保留临时工作目录")
+    return parser.parse_args()
+
+
+def setup_environment(workdir, args):
+    """让被测模块把所有数据写到临时目录，并优先使用替身程序"""
+    os.environ["HOME"] = str(workdir / "home")
+    os.environ["PATH"] = f"{STUBS_DIR}{os.pathsep}{os.environ.get('PATH', '')}"
+    os.environ["STUB_LATENCY"] = str(args.latency)
+    os.environ["STUB_FAILURE_RATE"] = str(args.failure_rate)
+    os.environ["STUB_SEED"] = "0"
+    sys.path.insert(0, str(REPO_DIR))
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def bench_generate(workdir, args):
+    import InvoiceGenerator
+
+    results = []
+    path = None
+    for batch in (False, True):
+        path = workdir / f"invoices_{'batch' if batch else 'scalar'}.txt"
+        _, elapsed = timed(lambda: InvoiceGenerator.generate_invoices_to_file(
+            path, args.invoices, seed=1, workers=args.workers, batch=batch))
+        size = path.stat().st_size
+        results.append({
+            "benchmark": f"generate_{'batch' if batch else 'scalar'}",
+            "items": args.invoices,
+            "seconds": elapsed,
+            "items_per_s": args.invoices / elapsed,
+            "mb_per_s": size / elapsed / 1e6,
+        })
+    return results, path
+
+
+def bench_read(trainer, invoice_path):
+    count, elapsed = timed(lambda: sum(1 for _ in trainer.iter_invoice_lines(invoice_path)))
+    return [{"benchmark": "read_invoice_lines", "items": count, "seconds": elapsed,
+             "items_per_s": count / elapsed,
+             "mb_per_s": Path(invoice_path).stat().st_size / elapsed / 1e6}]
+
+
+def stage_result(name, items, elapsed, metrics_dir, program, slots):
+    """根据计时事件计算调度效率：子进程忙碌时间占全部并发槽位时间的比例"""
+    import pipeline_metrics
+
+    summary = pipeline_metrics.summarize(pipeline_metrics.load_events(metrics_dir))
+    busy = summary["spans"].get(f"subprocess/{program}", {}).get("total_s", 0.0)
+    result = {
+        "benchmark": name,
+        "items": items,
+        "seconds": elapsed,
+        "items_per_s": items / elapsed if elapsed else None,
+        "slots": slots,
+        "efficiency": busy / (elapsed * slots) if elapsed else None,
+        "overhead_ms_per_item": (elapsed * slots - busy) / items * 1000 if items else None,
+    }
+    retries = summary["spans"].get(f"{program}/retry", {}).get("count")
+    if retries:
+        result["retries"] = retries
+    return result
+
+
+def bench_stages(trainer, workdir, invoice_path, args):
+    import pipeline_metrics
+
+    trainer.INVOICE_FILE_PATH = str(invoice_path)
+    trainer.NUM_SAMPLES = args.samples
+    trainer.SAMPLE_SELECTION = "first"  # 渲染正好 args.samples 行，吞吐按该数量计算
+    trainer.RENDER_CACHE_ENABLED = False
+    trainer.MAX_ITERATIONS = args.iterations
+    metrics_dir = workdir / "metrics"
+    slots = max(1, trainer.CPU_BUDGET // trainer.CHILD_OMP_THREADS)
+    results = []
+
+    for name, batch_size in (("render", 1), ("render_batch", args.batch_size)):
+        shutil.rmtree(trainer.TRAINING_DATA_DIR, ignore_errors=True)
+        trainer.TRAINING_DATA_DIR.mkdir(parents=True)
+        trainer.RENDER_BATCH_SIZE = batch_size
+        pipeline_metrics.configure(metrics_dir, reset=True)
+        _, elapsed = timed(lambda: trainer.generate_training_samples_from_invoices(["Stub Sans"],
+                                                                                   reset_progress=True))
+        results.append(stage_result(name, args.samples, elapsed, metrics_dir, "text2image", slots))
+
+    pipeline_metrics.configure(metrics_dir, reset=True)
+    _, elapsed = timed(trainer.generate_lstmf_files)
+    results.append(stage_result("lstmf", args.samples, elapsed, metrics_dir, "tesseract", slots))
+
+    trainer.TESSDATA_PATH.mkdir(parents=True, exist_ok=True)
+    (trainer.TESSDATA_PATH / "chi_sim.traineddata").write_bytes(b"stub traineddata")
+    pipeline_metrics.configure(metrics_dir, reset=True)
+    ok, elapsed = timed(lambda: trainer.generate_lstmf_training_list()
+                        and trainer.extract_lstm_from_traineddata()
+                        and trainer.train_lstm())
+    result = stage_result("train", args.iterations, elapsed, metrics_dir, "lstmtraining", 1)
+    result["ok"] = bool(ok)
+    results.append(result)
+    return results
+
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def print_table(results):
+    columns = ["benchmark", "items", "seconds", "items_per_s", "mb_per_s", "efficiency", "overhead_ms_per_item"]
+    print(" | ".join(f"{column:>20}" for column in columns))
+    for result in results:
+        cells = []
+        for column in columns:
+            value = result.get(column)
+            cells.append(f"{value:>20.3f}" if isinstance(value, float) else f"{str(value or '-'):>20}")
+        print(" | ".join(cells))
+
+
+def main():
+    args = parse_args()
+    workdir = Path(tempfile.mkdtemp(prefix="tain-bench-"))
+    setup_environment(workdir, args)
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s - %(message)s')
+    try:
+        results, invoice_path = bench_generate(workdir, args)
+        import train_tesseract_model as trainer
+        results += bench_read(trainer, invoice_path)
+        results += bench_stages(trainer, workdir, invoice_path, args)
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_table(results)
+    if args.output:
+        record = {"commit": current_commit(), "time": time.strftime('%Y-%m-%d %H:%M:%S'),
+                  "cpu_count": os.cpu_count(), "args": vars(args), "results": results}
+        with open(args.output, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import os
+import random
+import sys
+import time
+
+# =======================
+# 替身程序的公共部分
+# =======================
+#
+# benchmarks/stubs 下的 text2image、tesseract、combine_tessdata、lstmtraining 只模拟真实工具的输入输出格式，
+# 延迟与失败率由环境变量控制（<TOOL> 为大写的工具名，优先于通用设置）：
+#   STUB_<TOOL>_LATENCY / STUB_LATENCY          每次调用的平均延迟（秒），默认 0
+#   STUB_<TOOL>_JITTER / STUB_JITTER            延迟的相对抖动（0~1），默认 0.2
+#   STUB_<TOOL>_FAILURE_RATE / STUB_FAILURE_RATE 失败概率（0~1），默认 0
+#   STUB_SEED                                   设置后，同一命令行的延迟与失败结果可复现
+
+
+def setting(tool, name, default):
+    value = os.environ.get(f"STUB_{tool.upper()}_{name}", os.environ.get(f"STUB_{name}"))
+    return float(value) if value is not None else default
+
+
+def rng():
+    seed = os.environ.get("STUB_SEED")
+    if seed is None:
+        return random.Random()
+    return random.Random(f"{seed}:{' '.join(sys.argv)}")
+
+
+def simulate(tool):
+    """按设置等待一段时间，并按失败率决定是否以非零返回码退出"""
+    r = rng()
+    latency = setting(tool, "LATENCY", 0.0)
+    jitter = setting(tool, "JITTER", 0.2)
+    if latency > 0:
+        time.sleep(max(0.0, latency * (1 + jitter * (2 * r.random() - 1))))
+    if r.random() < setting(tool, "FAILURE_RATE", 0.0):
+        print(f"{tool}: simulated failure", file=sys.stderr)
+        sys.exit(1)
+    return r
+
+
+def option(name, default=None):
+    """读取 --name value 形式的参数"""
+    argv = sys.argv[1:]
+    if name in argv:
+        i = argv.index(name)
+        if i + 1 < len(argv):
+            return argv[i + 1]
+    return default
@@ -0,0 +1,108 @@
+import json
+import os
+import re
+import time
+from pathlib import Path
+
+# =======================
+# 检查点登记表
+# =======================
+#
+# lstmtraining 每出现新的最优 BCER 就写出一个 <前缀>_<BCER>_<迭代>_<迭代>.checkpoint，长时间训练后模型目录
+# 会堆积大量检查点。登记表在检查点写出时记录其迭代次数、损失率与大小，只保留损失最低的 k 个与最新的检查点，
+# 其余在训练过程中删除；最优检查点直接取登记表的第一项，无需扫描目录。
+# 每条记录同时保存学习迭代次数（iteration，即进度行 "At iteration L/T/S" 中的 L）与训练迭代次数
+# （training_iteration，即 T）：lstmtraining 从检查点恢复后按 T 与 --max_iterations 比较，T 不小于 L。
+
+CHECKPOINT_NAME_PATTERN = re.compile(r'_([0-9.]+)_(\d+)_(\d+)\.checkpoint$')
+
+
+def _entry(path, iteration, loss, training_iteration=None):
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        size = None
+    return {"path": str(path), "iteration": iteration, "training_iteration": training_iteration, "loss": loss,
+            "size": size, "written_at": time.time()}
+
+
+def training_iteration(entry):
+    """检查点的训练迭代次数；旧登记表中没有该字段时从文件名中解析，仍无法得到时退回学习迭代次数"""
+    if entry.get("training_iteration") is not None:
+        return entry["training_iteration"]
+    match = CHECKPOINT_NAME_PATTERN.search(Path(entry["path"]).name)
+    return int(match.group(3)) if match else entry["iteration"]
+
+
+class CheckpointRegistry:
+    def __init__(self, path, model_dir, keep_best=3):
+        self.path = Path(path)
+        self.model_dir = Path(model_dir)
+        self.keep_best = keep_best
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.best_entries = data["best"]
+            self.latest_entry = data.get("latest")
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            # 没有登记表（或已损坏）时扫描一次模型目录
+            self.rebuild()
+
+    def rebuild(self):
+        """从模型目录中已有的检查点文件名重建登记表"""
+        self.best_entries = []
+        self.latest_entry = None
+        for checkpoint in self.model_dir.glob('*.checkpoint'):
+            match = CHECKPOINT_NAME_PATTERN.search(checkpoint.name)
+            if match:
+                self.best_entries.append(_entry(checkpoint, int(match.group(2)), float(match.group(1)),
+                                                int(match.group(3))))
+        self._sort()
+
+    def _sort(self):
+        # 损失相同时保留迭代次数更多的检查点
+        self.best_entries.sort(key=lambda entry: (entry["loss"], -entry["iteration"]))
+
+    def best(self):
+        """损失最低的检查点记录，没有时返回 None"""
+        return self.best_entries[0] if self.best_entries else None
+
+    def record_best(self, path, iteration, loss, training_iteration=None):
+        """登记一个新的最优检查点并删除超出保留数量的检查点，返回被删除的记录"""
+        self.best_entries = [entry for entry in self.best_entries if entry["path"] != str(path)]
+        self.best_entries.append(_entry(path, iteration, loss, training_iteration))
+        self._sort()
+        removed = self.prune()
+        self.save()
+        return removed
+
+    def record_latest(self, path, iteration, training_iteration=None):
+        """登记最新的检查点（lstmtraining 每次输出进度时覆盖写出的 <前缀>_checkpoint）"""
+        self.latest_entry = _entry(path, iteration, None, training_iteration)
+        self.save()
+
+    def prune(self):
+        """删除损失排在 keep_best 之后的检查点文件，最新的检查点始终保留"""
+        keep, removed = [], []
+        latest_path = self.latest_entry["path"] if self.latest_entry else None
+        for entry in self.best_entries:
+            if len(keep) < self.keep_best or entry["path"] == latest_path:
+                keep.append(entry)
+            else:
+                removed.append(entry)
+        for entry in removed:
+            Path(entry["path"]).unlink(missing_ok=True)
+        self.best_entries = keep
+        return removed
+
+    def total_size(self):
+        entries = self.best_entries + ([self.latest_entry] if self.latest_entry else [])
+        return sum(entry["size"] or 0 for entry in entries)
+
+    def save(self):
+        # 先写临时文件再替换，避免中途崩溃留下损坏的登记表
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"keep_best": self.keep_best, "best": self.best_entries, "latest": self.latest_entry},
+                      f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,113 @@
+import hashlib
+import os
+import tempfile
+
+import subprocess_scheduler
+
+# =======================
+# 留出集评估
+# =======================
+#
+# 按样本名的哈希把一部分样本留作评估集，不参与训练；候选模型在评估集上识别，
+# 按发票字段类型分别统计字符错误率（CER）与词错误率（WER）。
+# 每次 tesseract 调用通过列表文件识别一批图片，避免每张图片启动一个进程。
+
+# 按标签（冒号之前的部分）中的关键字判断字段类型，按顺序匹配
+FIELD_TYPES = [
+    ("invoice_number", ("发票号",)),
+    ("tax_id", ("纳税人识别号",)),
+    ("date", ("开票日期",)),
+    ("amount", ("单价", "金额", "税额", "合计")),
+]
+OTHER_FIELD = "other"
+PAGE_SEPARATOR = "\f"
+
+
+def is_held_out(name, fraction):
+    """样本是否属于评估集；只取决于样本名，重新生成数据后划分保持不变"""
+    if fraction <= 0:
+        return False
+    digest = hashlib.sha1(name.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') / 2 ** 64 < fraction
+
+
+def field_type(text):
+    label = text.replace('：', ':').split(':', 1)[0]
+    for field, keywords in FIELD_TYPES:
+        if any(keyword in label for keyword in keywords):
+            return field
+    return OTHER_FIELD
+
+
+def edit_distance(reference, hypothesis):
+    """两个序列之间的 Levenshtein 距离"""
+    if len(reference) < len(hypothesis):
+        reference, hypothesis = hypothesis, reference
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_item in enumerate(reference, start=1):
+        current = [i]
+        for j, hyp_item in enumerate(hypothesis, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_item != hyp_item)))
+        previous = current
+    return previous[-1]
+
+
+def _rates(stats):
+    stats["cer"] = round(stats["char_errors"] / stats["chars"], 6) if stats["chars"] else None
+    stats["wer"] = round(stats["word_errors"] / stats["words"], 6) if stats["words"] else None
+    return stats
+
+
+def score(pairs):
+    """pairs 是 (真值, 识别结果) 的可迭代对象，返回各字段类型与全部样本（"all"）的错误统计"""
+    fields = {}
+    for truth, hypothesis in pairs:
+        truth, hypothesis = truth.strip(), hypothesis.strip()
+        char_errors = edit_distance(truth, hypothesis)
+        word_errors = edit_distance(truth.split(), hypothesis.split())
+        for field in (field_type(truth), "all"):
+            stats = fields.setdefault(field, {"lines": 0, "exact": 0, "chars": 0, "char_errors": 0,
+                                              "words": 0, "word_errors": 0})
+            stats["lines"] += 1
+            stats["exact"] += truth == hypothesis
+            stats["chars"] += len(truth)
+            stats["char_errors"] += char_errors
+            stats["words"] += len(truth.split())
+            stats["word_errors"] += word_errors
+    return {field: _rates(stats) for field, stats in fields.items()}
+
+
+def merge(results):
+    """合并多批 score() 的统计结果"""
+    merged = {}
+    for result in results:
+        for field, stats in result.items():
+            target = merged.setdefault(field, dict.fromkeys(stats, 0))
+            for key in ("lines", "exact", "chars", "char_errors", "words", "word_errors"):
+                target[key] += stats[key]
+    return {field: _rates(stats) for field, stats in merged.items()}
+
+
+def ocr_batch(images, lang, tessdata_dir, psm=7):
+    """用一个 tesseract 进程识别一批图片，返回与 images 一一对应的识别文本；失败时抛出 RuntimeError"""
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', encoding='utf-8', delete=False) as list_file:
+        list_file.write(''.join(f"{image}\n" for image in images))
+    try:
+        command = ['tesseract', list_file.name, 'stdout', '-l', lang, '--psm', str(psm),
+                   '--tessdata-dir', str(tessdata_dir)]
+        result = subprocess_scheduler.run(command)
+    finally:
+        os.unlink(list_file.name)
+    if result.returncode != 0:
+        raise RuntimeError(f"tesseract 返回码 {result.returncode}：{result.stderr}")
+    # 每张图片的识别结果之后都有一个分页符
+    pages = result.stdout.split(PAGE_SEPARATOR)[:len(images)]
+    if len(pages) != len(images):
+        raise RuntimeError(f"识别结果 {len(pages)} 页，与图片数量 {len(images)} 不一致")
+    return pages
+
+
+def evaluate_batch(samples, lang, tessdata_dir, psm=7):
+    """samples 是 (图片路径, 真值文本) 列表，识别后返回 score() 的统计结果"""
+    pages = ocr_batch([image for image, _ in samples], lang, tessdata_dir, psm)
+    return score((truth, page) for (_, truth), page in zip(samples, pages))
@@ -0,0 +1,135 @@
+import heapq
+import random
+import re
+import time
+from collections import Counter, namedtuple
+
+# =======================
+# 子进程失败的分类、重试与断路
+# =======================
+#
+# 确定性失败（字体不存在、文件缺失、参数错误等）重试多少次结果都一样，不再重试，并计入断路器：
+# 同一错误出现达到阈值时终止整个阶段，配置错误的运行在几秒内失败，而不是对每个样本重复同样的错误。
+# 暂时性失败（被信号终止、内存不足、I/O 错误等）放入重试队列，按带抖动的指数退避重新提交；
+# 等待在调度线程中进行，工作线程不会因为 sleep 而空占并发槽位。
+
+DETERMINISTIC = "deterministic"
+TRANSIENT = "transient"
+
+Failure = namedtuple("Failure", ["kind", "signature", "message"])
+
+TRANSIENT_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r"resource temporarily unavailable",
+    r"out of memory|bad_alloc|cannot allocate memory",
+    r"too many open files",
+    r"input/output error",
+    r"stale file handle",
+    r"timed? ?out",
+    r"interrupted system call",
+)]
+DETERMINISTIC_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r"could not find font",
+    r"unable to find font",
+    r"font .* not found",
+    r"no such file or directory",
+    r"can(no|')t open",
+    r"failed to (load|open|read)",
+    r"error opening data file",
+    r"unknown (command line )?(argument|flag|option)",
+    r"invalid (argument|value)",
+    r"permission denied",
+    r"not a valid",
+    r"unsupported",
+)]
+
+
+def signature(line):
+    """错误的归类标识：把独立的数字（编号、行号、偏移等）替换掉，使只有编号不同的同一错误归为一类"""
+    return re.sub(r"(?<![A-Za-z])\d+", "N", line.strip())[:200]
+
+
+def classify(returncode, stderr):
+    """按返回码与错误输出判断失败类型，无法识别的错误视为暂时性的（重试次数有上限）"""
+    text = (stderr or "").strip()
+    if returncode is not None and returncode < 0:
+        return Failure(TRANSIENT, f"signal {-returncode}", text or f"被信号 {-returncode} 终止")
+    lines = [line for line in text.splitlines() if line.strip()]
+    for patterns, kind in ((TRANSIENT_PATTERNS, TRANSIENT), (DETERMINISTIC_PATTERNS, DETERMINISTIC)):
+        for line in lines:
+            if any(pattern.search(line) for pattern in patterns):
+                return Failure(kind, signature(line), text)
+    return Failure(TRANSIENT, signature(lines[-1]) if lines else f"returncode {returncode}",
+                   text or f"返回码 {returncode}")
+
+
+def from_exception(exc, context=""):
+    """工作函数内部的意外异常：原因未知，按暂时性失败处理（重试次数有上限），同时计入失败统计"""
+    text = f"{context}{type(exc).__name__}: {exc}"
+    return Failure(TRANSIENT, signature(f"{type(exc).__name__}: {exc}"), text)
+
+
+def backoff_delay(attempt, base_delay, max_delay, rng=random):
+    """第 attempt 次重试前的等待时间：在 [0, min(max_delay, base_delay * 2^(attempt-1))] 内均匀抽取"""
+    return rng.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+
+
+class CircuitOpen(Exception):
+    """同一确定性错误出现次数达到阈值"""
+
+    def __init__(self, failure, count):
+        super().__init__(f"同一错误已出现 {count} 次：{failure.signature}")
+        self.failure = failure
+        self.count = count
+
+
+class CircuitBreaker:
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.counts = Counter()
+
+    def record(self, failure):
+        """记录一次确定性失败，返回该错误是第几次出现；达到阈值时抛出 CircuitOpen"""
+        self.counts[failure.signature] += 1
+        count = self.counts[failure.signature]
+        if self.threshold and count >= self.threshold:
+            raise CircuitOpen(failure, count)
+        return count
+
+
+class RetryQueue:
+    """按到期时间排序的重试队列；每个任务最多执行 max_attempts 次"""
+
+    def __init__(self, max_attempts, base_delay, max_delay):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._heap = []
+        self._attempts = {}  # id(任务) -> (任务, 已执行次数)；保留任务引用，id 不会被复用
+        self._seq = 0
+
+    def schedule(self, task):
+        """安排任务重试，返回这是第几次重试；次数用尽时返回 0"""
+        _, attempts = self._attempts.get(id(task), (task, 1))
+        if attempts >= self.max_attempts:
+            self._attempts.pop(id(task), None)
+            return 0
+        self._attempts[id(task)] = (task, attempts + 1)
+        ready_at = time.monotonic() + backoff_delay(attempts, self.base_delay, self.max_delay)
+        self._seq += 1
+        heapq.heappush(self._heap, (ready_at, self._seq, task))
+        return attempts
+
+    def pop_ready(self):
+        """取出一个已到期的任务，没有时返回 None"""
+        if self._heap and self._heap[0][0] <= time.monotonic():
+            return heapq.heappop(self._heap)[2]
+        return None
+
+    def next_delay(self):
+        """距下一个任务到期的秒数，队列为空时返回 None"""
+        if not self._heap:
+            return None
+        return max(0.0, self._heap[0][0] - time.monotonic())
+
+    def __len__(self):
+        return len(self._heap)
@@ -0,0 +1,140 @@
+import bisect
+import json
+import logging
+import os
+import subprocess
+from pathlib import Path
+
+# =======================
+# 持久化的字体索引
+# =======================
+#
+# 用 fc-scan 扫描一次字体目录，记录每个字体的文件、face 索引、族名、样式和字符覆盖范围，
+# 以 JSON 保存。索引附带字体目录树中每个目录的 mtime，安装或删除字体会改变所在目录的 mtime，
+# 据此判断索引是否需要重建；未变化时启动只需读取 JSON，无需再调用 fc-cache、fc-list、fc-match。
+
+SCAN_FORMAT = "%{file}\\t%{index}\\t%{family}\\t%{style}\\t%{charset}\\n"
+REGULAR_STYLES = ("regular", "book", "normal", "medium")
+
+
+def directory_stamp(fonts_dir):
+    """字体目录树中每个目录的 mtime，作为索引的失效依据"""
+    stamp = {}
+    for dirpath, _, _ in os.walk(fonts_dir):
+        try:
+            stamp[dirpath] = os.stat(dirpath).st_mtime_ns
+        except FileNotFoundError:
+            continue
+    return stamp
+
+
+def parse_charset(charset):
+    """把 fontconfig 的字符集文本（如 "20-7e a0-17f 4e00-9fff"）解析为 [起, 止] 区间列表"""
+    ranges = []
+    for part in charset.split():
+        start, _, end = part.partition('-')
+        try:
+            ranges.append([int(start, 16), int(end or start, 16)])
+        except ValueError:
+            continue
+    return sorted(ranges)
+
+
+def scan_fonts(fonts_dir):
+    """用 fc-scan 扫描字体目录，返回字体条目列表"""
+    result = subprocess.run(['fc-scan', '--format', SCAN_FORMAT, str(fonts_dir)],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
+    fonts = []
+    for line in result.stdout.splitlines():
+        fields = line.split('\t')
+        if len(fields) != 5:
+            continue
+        font_file, index, families, styles, charset = fields
+        fonts.append({
+            "file": font_file,
+            "index": int(index or 0),
+            # 族名和样式可能包含多个本地化名称，以逗号分隔，第一个是规范名称
+            "families": [name.strip() for name in families.split(',') if name.strip()],
+            "styles": [name.strip() for name in styles.split(',') if name.strip()],
+            "charset": parse_charset(charset),
+        })
+    return fonts
+
+
+def load_index(fonts_dir, cache_path):
+    """读取字体索引，字体目录变化或索引不存在时重建，返回 (FontIndex, 是否重建)"""
+    stamp = directory_stamp(fonts_dir)
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached.get("fonts_dir") == str(fonts_dir) and cached.get("stamp") == stamp:
+            return FontIndex(cached["fonts"]), False
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        pass
+
+    logging.info(f"字体目录有变化，重建字体索引：{fonts_dir}")
+    index = FontIndex(scan_fonts(fonts_dir))
+    tmp_path = Path(f"{cache_path}.tmp")
+    tmp_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"fonts_dir": str(fonts_dir), "stamp": stamp, "fonts": index.fonts}, f, ensure_ascii=False)
+    os.replace(tmp_path, cache_path)
+    logging.info(f"字体索引共 {len(index.fonts)} 个字体。")
+    return index, True
+
+
+def is_regular(font):
+    return any(style.lower() in REGULAR_STYLES for style in font["styles"])
+
+
+def description(font):
+    """text2image（Pango）可识别的字体描述：族名，非常规样式时附加样式名"""
+    family = font["families"][0]
+    style = font["styles"][0] if font["styles"] else ""
+    if not style or is_regular(font):
+        return family
+    return f"{family} {style}"
+
+
+class FontIndex:
+    def __init__(self, fonts):
+        self.fonts = fonts
+        self._starts = {}
+
+    def find(self, font_name):
+        """按字体描述、族名、文件名或文件路径查找字体，只给族名时优先常规样式，找不到时返回 None"""
+        wanted = font_name.strip().lower()
+        matches = []
+        for font in self.fonts:
+            names = {font["file"].lower(), Path(font["file"]).name.lower()}
+            for family in font["families"]:
+                names.add(family.lower())
+                for style in font["styles"]:
+                    names.add(f"{family} {style}".lower())
+                    names.add(f"{family}, {style}".lower())
+            if wanted in names:
+                matches.append(font)
+        if not matches:
+            return None
+        return max(matches, key=lambda font: (is_regular(font), -font["index"]))
+
+    def missing_chars(self, font, chars):
+        """返回字体未覆盖的字符"""
+        key = (font["file"], font["index"])
+        if key not in self._starts:
+            self._starts[key] = [start for start, _ in font["charset"]]
+        starts = self._starts[key]
+        missing = []
+        for char in dict.fromkeys(chars):
+            if char.isspace():
+                continue
+            i = bisect.bisect_right(starts, ord(char)) - 1
+            if i < 0 or ord(char) > font["charset"][i][1]:
+                missing.append(char)
+        return "".join(missing)
+
+    def best_alternative(self, chars):
+        """覆盖 chars 最多的字体，覆盖相同时优先常规样式；索引为空时返回 None"""
+        if not self.fonts:
+            return None
+        return max(self.fonts, key=lambda font: (-len(self.missing_chars(font, chars)), is_regular(font)))
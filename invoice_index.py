@@ -0,0 +1,234 @@
+import json
+import mmap
+import struct
+from array import array
+from itertools import accumulate
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:  # 没有 NumPy 时逐条平移偏移量
+    np = None
+
+# =======================
+# 发票语料的旁路文件
+# =======================
+#
+# 对于发票文本文件 generated_invoices.txt，同目录下另有三个旁路文件：
+#   generated_invoices.jsonl      每张发票一行紧凑 JSON（字段、明细、合计）
+#   generated_invoices.idx        每张发票一条定长记录 INVOICE_ENTRY
+#   generated_invoices.lines.idx  文本文件中每一物理行的起始字节偏移（uint64）
+# 索引均为定长记录，按编号直接 seek 即可定位，无需扫描整个语料。
+
+# 发票索引记录：文本偏移、文本长度（不含分隔符）、首行行号、行数、JSON 记录偏移、JSON 记录长度（不含换行）
+INVOICE_ENTRY = struct.Struct("<QIQIQI")
+LINE_ENTRY = struct.Struct("<Q")
+
+if np is not None:
+    INVOICE_DTYPE = np.dtype([
+        ("text_offset", "<u8"), ("text_length", "<u4"),
+        ("first_line", "<u8"), ("line_count", "<u4"),
+        ("record_offset", "<u8"), ("record_length", "<u4"),
+    ])
+
+
+def sidecar_paths(text_path):
+    """返回发票文本文件对应的 (JSON 记录文件, 发票索引文件, 行索引文件) 路径"""
+    text_path = Path(text_path)
+    return (
+        text_path.with_suffix(".jsonl"),
+        text_path.with_suffix(".idx"),
+        text_path.with_suffix(".lines.idx"),
+    )
+
+
+def chunk_index(text, records, separator):
+    """为一个分片的字节块计算相对于分片起点的索引，返回 (发票索引字节, 行起始偏移字节)
+
+    text 是以分隔符结尾的发票文本，records 是每张发票一行的 JSON 记录。
+    """
+    if np is not None:
+        return _chunk_index_numpy(text, records, separator)
+
+    separator_lines = separator.count(b"\n")
+    entries = bytearray()
+    text_offset = 0
+    first_line = 0
+    record_offset = 0
+    for invoice, record in zip(text.split(separator)[:-1], records.split(b"\n")[:-1]):
+        line_count = invoice.count(b"\n")
+        entries += INVOICE_ENTRY.pack(
+            text_offset, len(invoice), first_line, line_count, record_offset, len(record))
+        text_offset += len(invoice) + len(separator)
+        first_line += line_count + separator_lines
+        record_offset += len(record) + 1
+
+    line_starts = array("Q", accumulate((len(line) + 1 for line in text.split(b"\n")[:-1]), initial=0))
+    line_starts.pop()  # 最后一个值是分片末尾，不是行起点
+    return bytes(entries), line_starts.tobytes()
+
+
+def _chunk_index_numpy(text, records, separator):
+    """chunk_index 的向量化实现：直接在字节数组上定位换行符与分隔行"""
+    if not text:
+        return b"", b""
+    data = np.frombuffer(text, dtype=np.uint8)
+    line_starts = np.empty(int(np.count_nonzero(data == 10)), dtype="<u8")
+    line_starts[0] = 0
+    line_starts[1:] = np.flatnonzero(data == 10)[:-1] + 1
+
+    # 分隔符形如 "\n====\n"：先是一个空行，再是一行 "="；发票正文中不会出现以 "=" 开头的行
+    marker = separator.strip(b"\n")[:1][0]
+    separator_rows = np.flatnonzero(data[line_starts] == marker)
+    blank_rows = separator_rows - (separator.count(b"\n") - 1)
+    first_rows = np.empty_like(separator_rows)
+    first_rows[0] = 0
+    first_rows[1:] = separator_rows[:-1] + 1
+
+    record_ends = np.flatnonzero(np.frombuffer(records, dtype=np.uint8) == 10)
+    record_starts = np.empty_like(record_ends)
+    record_starts[0] = 0
+    record_starts[1:] = record_ends[:-1] + 1
+
+    table = np.empty(len(separator_rows), dtype=INVOICE_DTYPE)
+    table["text_offset"] = line_starts[first_rows]
+    table["text_length"] = line_starts[blank_rows] - line_starts[first_rows]
+    table["first_line"] = first_rows
+    table["line_count"] = blank_rows - first_rows
+    table["record_offset"] = record_starts
+    table["record_length"] = record_ends - record_starts
+    return table.tobytes(), line_starts.tobytes()
+
+
+def _shift_entries(entries, text_base, line_base, record_base):
+    """把分片内的相对偏移平移为文件内的绝对偏移"""
+    if np is not None:
+        table = np.frombuffer(entries, dtype=INVOICE_DTYPE).copy()
+        table["text_offset"] += text_base
+        table["first_line"] += line_base
+        table["record_offset"] += record_base
+        return table.tobytes()
+    shifted = bytearray()
+    for text_offset, text_length, first_line, line_count, record_offset, record_length in \
+            INVOICE_ENTRY.iter_unpack(entries):
+        shifted += INVOICE_ENTRY.pack(text_offset + text_base, text_length, first_line + line_base,
+                                      line_count, record_offset + record_base, record_length)
+    return bytes(shifted)
+
+
+def _shift_line_starts(line_starts, text_base):
+    if np is not None:
+        return (np.frombuffer(line_starts, dtype="<u8") + np.uint64(text_base)).tobytes()
+    shifted = array("Q", line_starts)
+    return array("Q", (start + text_base for start in shifted)).tobytes()
+
+
+class InvoiceIndexWriter:
+    """按分片顺序追加 JSON 记录与索引，和发票文本文件的写入保持同步"""
+
+    def __init__(self, text_path, buffering=8 * 1024 * 1024):
+        records_path, index_path, lines_path = sidecar_paths(text_path)
+        self.records_file = open(records_path, "wb", buffering=buffering)
+        self.index_file = open(index_path, "wb", buffering=buffering)
+        self.lines_file = open(lines_path, "wb", buffering=buffering)
+        self.text_size = 0
+        self.line_count = 0
+        self.record_size = 0
+
+    def append(self, text, records, index):
+        entries, line_starts = index
+        self.index_file.write(_shift_entries(entries, self.text_size, self.line_count, self.record_size))
+        self.lines_file.write(_shift_line_starts(line_starts, self.text_size))
+        self.records_file.write(records)
+        self.text_size += len(text)
+        self.line_count += len(line_starts) // LINE_ENTRY.size
+        self.record_size += len(records)
+
+    def close(self):
+        for f in (self.records_file, self.index_file, self.lines_file):
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class InvoiceIndex:
+    """按编号 O(1) 读取发票、发票的结构化记录或任意一行文本"""
+
+    def __init__(self, text_path):
+        records_path, index_path, lines_path = sidecar_paths(text_path)
+        self._files = [open(path, "rb") for path in (text_path, records_path, index_path, lines_path)]
+        self.text_file, self.records_file, index_file, lines_file = self._files
+        self.text_size = Path(text_path).stat().st_size
+        self._index = self._map(index_file)
+        self._lines = self._map(lines_file)
+
+    @staticmethod
+    def _map(f):
+        # 空文件无法 mmap，用空字节串代替
+        if Path(f.name).stat().st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self._index) // INVOICE_ENTRY.size
+
+    @property
+    def num_lines(self):
+        return len(self._lines) // LINE_ENTRY.size
+
+    def entry(self, i):
+        """返回第 i 张发票的 (文本偏移, 文本长度, 首行行号, 行数, 记录偏移, 记录长度)"""
+        if not 0 <= i < len(self):
+            raise IndexError(f"发票编号越界：{i}")
+        return INVOICE_ENTRY.unpack_from(self._index, i * INVOICE_ENTRY.size)
+
+    def invoice_span(self, i):
+        text_offset, text_length = self.entry(i)[:2]
+        return text_offset, text_offset + text_length
+
+    def invoice_lines(self, i):
+        """第 i 张发票包含的行号范围"""
+        first_line, line_count = self.entry(i)[2:4]
+        return range(first_line, first_line + line_count)
+
+    def line_span(self, j):
+        """第 j 行的字节范围 [start, end)，不含换行符"""
+        if not 0 <= j < self.num_lines:
+            raise IndexError(f"行号越界：{j}")
+        start = LINE_ENTRY.unpack_from(self._lines, j * LINE_ENTRY.size)[0]
+        if j + 1 < self.num_lines:
+            end = LINE_ENTRY.unpack_from(self._lines, (j + 1) * LINE_ENTRY.size)[0]
+        else:
+            end = self.text_size
+        return start, end - 1
+
+    def _read(self, f, start, end):
+        f.seek(start)
+        return f.read(end - start)
+
+    def read_invoice(self, i):
+        return self._read(self.text_file, *self.invoice_span(i)).decode("utf-8")
+
+    def read_line(self, j):
+        return self._read(self.text_file, *self.line_span(j)).decode("utf-8")
+
+    def read_record(self, i):
+        record_offset, record_length = self.entry(i)[4:]
+        return json.loads(self._read(self.records_file, record_offset, record_offset + record_length))
+
+    def close(self):
+        for mapped in (self._index, self._lines):
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+        for f in self._files:
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,104 @@
+import functools
+import subprocess
+from pathlib import Path
+
+try:
+    from PIL import Image, ImageDraw, ImageFilter, ImageFont
+except ImportError:  # 未安装 Pillow 时只能使用 text2image 渲染
+    Image = ImageDraw = ImageFilter = ImageFont = None
+
+# =======================
+# 进程内 Pillow/FreeType 渲染器
+# =======================
+#
+# 作为 text2image 子进程的替代：每个工作进程只加载一次字体，直接把文本行渲染为 .tif，
+# 同时写出与 text2image 格式一致的 .box（左、下、右、上坐标，原点在左下角）和 .gt.txt。
+
+MARGIN = 50  # 文本四周的留白（像素）
+
+
+def available():
+    return Image is not None
+
+
+def version():
+    """渲染器版本，作为渲染缓存键的一部分"""
+    import PIL
+    return f"pillow-{PIL.__version__}"
+
+
+@functools.lru_cache(maxsize=None)
+def resolve_font_file(font_name):
+    """把字体名解析为 (字体文件路径, face 索引)；font_name 是文件路径或 "路径:索引" 时直接使用"""
+    if Path(font_name).is_file():
+        return str(font_name), 0
+    font_file, _, index = str(font_name).rpartition(':')
+    if index.isdigit() and Path(font_file).is_file():
+        return font_file, int(index)
+    result = subprocess.run(['fc-match', '-f', '%{file}\t%{index}', font_name],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
+    font_file, _, index = result.stdout.partition('\t')
+    return font_file, int(index or 0)
+
+
+@functools.lru_cache(maxsize=64)
+def load_font(font_file, index, size_px):
+    """加载字体，同一工作进程内每种 (字体, 字号) 只加载一次"""
+    return ImageFont.truetype(font_file, size_px, index=index)
+
+
+def apply_exposure(image, exposure):
+    """与 text2image 的 --exposure 一致：不小于 2 时灰度腐蚀一次（笔画变粗、变暗），
+    不大于 -2 时灰度膨胀一次（笔画变细、变亮），其余取值不变"""
+    if exposure >= 2:
+        return image.filter(ImageFilter.MinFilter(3))
+    if exposure <= -2:
+        return image.filter(ImageFilter.MaxFilter(3))
+    return image
+
+
+def render_line(text, output_base, font_file, font_index=0, ptsize=40, char_spacing=0.0, exposure=0,
+                resolution=300):
+    """把一行文本渲染为 output_base.tif/.box/.gt.txt
+
+    ptsize 按 resolution 换算为像素字号，char_spacing 以 em 为单位追加在每个字符之后，与 text2image 一致。
+    """
+    size_px = max(1, round(ptsize * resolution / 72))
+    font = load_font(font_file, font_index, size_px)
+    ascent, descent = font.getmetrics()
+    spacing_px = char_spacing * size_px
+
+    # 先排版：逐字符计算横向位置
+    positions = []
+    x = float(MARGIN)
+    for char in text:
+        positions.append(x)
+        x += font.getlength(char) + spacing_px
+    line_end = int(x)
+    width = line_end + MARGIN
+    height = ascent + descent + 2 * MARGIN
+
+    image = Image.new('L', (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    boxes = []
+    for char, x in zip(text, positions):
+        if char.isspace():
+            # 空白字符没有墨迹，用其步进宽度和整行高度作为框
+            left, top, right, bottom = x, MARGIN, x + font.getlength(char), MARGIN + ascent + descent
+        else:
+            draw.text((x, MARGIN), char, font=font, fill=0)
+            left, top, right, bottom = font.getbbox(char)
+            left, top, right, bottom = x + left, MARGIN + top, x + right, MARGIN + bottom
+        boxes.append((char, int(left), height - int(round(bottom)), int(round(right)), height - int(top)))
+
+    image = apply_exposure(image, exposure)
+    image.save(f"{output_base}.tif", dpi=(resolution, resolution))
+
+    with open(f"{output_base}.box", 'w', encoding='utf-8') as f:
+        for char, left, bottom, right, top in boxes:
+            f.write(f"{char} {left} {bottom} {right} {top} 0\n")
+        # 与 text2image 一样，以制表符框标记行尾
+        f.write(f"\t {line_end} {height - MARGIN - ascent - descent} {line_end + 1} {height - MARGIN} 0\n")
+
+    with open(f"{output_base}.gt.txt", 'w', encoding='utf-8') as f:
+        f.write(text)
@@ -0,0 +1,86 @@
+import logging
+import threading
+import time
+from collections import Counter
+from logging.handlers import QueueHandler
+
+# =======================
+# 多进程日志的过滤与统计
+# =======================
+#
+# 所有进程（主进程、进程池中的工作进程）都只挂一个 QueueHandler，由主进程的 QueueListener 统一写入文件和控制台。
+# 级别过滤和逐样本日志的采样、限速都在各进程的 logger 上完成，被过滤的记录不会被格式化和序列化。
+
+SAMPLE_LOGGER_NAME = "sample"  # 逐样本热路径使用的 logger，受采样与限速控制
+
+
+class SampleLogFilter(logging.Filter):
+    """逐样本日志的采样与限速：每 every 条保留一条，且每秒不超过 max_per_second 条
+
+    警告及以上级别总是保留；every 为 0 时丢弃全部逐样本的低级别日志。
+    """
+
+    def __init__(self, every, max_per_second):
+        super().__init__()
+        self.every = every
+        self.max_per_second = max_per_second
+        self.suppressed = 0
+        self._seen = 0
+        self._window_start = 0.0
+        self._window_count = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        with self._lock:
+            self._seen += 1
+            keep = self.every > 0 and (self._seen - 1) % self.every == 0
+            if keep and self.max_per_second > 0:
+                now = time.monotonic()
+                if now - self._window_start >= 1.0:
+                    self._window_start = now
+                    self._window_count = 0
+                keep = self._window_count < self.max_per_second
+                if keep:
+                    self._window_count += 1
+            if not keep:
+                self.suppressed += 1
+            return keep
+
+
+class LevelCounter(logging.Handler):
+    """按级别统计经过监听器的日志条数，用于输出各阶段的摘要"""
+
+    def __init__(self):
+        super().__init__(level=logging.NOTSET)
+        self.counts = Counter()
+
+    def emit(self, record):
+        self.counts[record.levelname] += 1
+
+    def snapshot(self):
+        self.acquire()
+        try:
+            return Counter(self.counts)
+        finally:
+            self.release()
+
+
+def install_queue_logger(log_queue, level, sample_every, sample_max_per_second):
+    """让当前进程的日志只经由 log_queue 发送，并设置级别过滤与逐样本日志的采样、限速
+
+    返回逐样本日志的过滤器，可从中读取被省略的条数。
+    """
+    logger = logging.getLogger()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(QueueHandler(log_queue))
+    logger.setLevel(level)
+
+    sample_logger = logging.getLogger(SAMPLE_LOGGER_NAME)
+    for old_filter in list(sample_logger.filters):
+        sample_logger.removeFilter(old_filter)
+    sample_filter = SampleLogFilter(sample_every, sample_max_per_second)
+    sample_logger.addFilter(sample_filter)
+    return sample_filter
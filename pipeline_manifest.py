@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+# =======================
+# 训练流程的阶段清单
+# =======================
+#
+# 清单以 JSON 保存每个阶段最近一次成功运行的输入指纹与输出路径。
+# 再次运行时，指纹未变且输出仍存在的阶段可以直接跳过；
+# 渲染等逐样本的阶段另用只追加的完成记录（CompletionLog）实现断点续跑。
+
+
+def fingerprint(*parts):
+    """把任意可 JSON 序列化的输入计算为指纹"""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def file_signature(path):
+    """文件的 (路径, 大小, 修改时间) 签名；文件不存在时返回 None"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [str(path), stat.st_size, stat.st_mtime_ns]
+
+
+class PipelineManifest:
+    def __init__(self, path):
+        self.path = Path(path)
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.stages = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.stages = {}
+
+    def fingerprint_of(self, stage):
+        """阶段最近一次运行的版本（指纹加完成时间），上游重跑后下游随之失效"""
+        entry = self.stages.get(stage)
+        return fingerprint(entry["fingerprint"], entry["completed_at"]) if entry else None
+
+    def is_up_to_date(self, stage, stage_fingerprint):
+        """阶段的指纹一致且所有输出仍存在时返回 True"""
+        entry = self.stages.get(stage)
+        if not entry or entry["fingerprint"] != stage_fingerprint:
+            return False
+        return all(Path(output).exists() for output in entry["outputs"])
+
+    def record(self, stage, stage_fingerprint, inputs, outputs):
+        self.stages[stage] = {
+            "fingerprint": stage_fingerprint,
+            "inputs": inputs,
+            "outputs": [str(output) for output in outputs],
+            "completed_at": time.time(),
+        }
+        self.save()
+
+    def invalidate(self, stage):
+        if self.stages.pop(stage, None) is not None:
+            self.save()
+
+    def save(self):
+        # 先写临时文件再替换，避免中途崩溃留下损坏的清单
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.stages, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class CompletionLog:
+    """逐样本的完成记录：每行 "样本名\\t摘要"，只追加写入，崩溃后已完成的样本不会丢失"""
+
+    def __init__(self, path, reset=False):
+        self.path = Path(path)
+        self.done = set()
+        if reset:
+            self.path.unlink(missing_ok=True)
+        elif self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.done = {tuple(line.rstrip('\n').split('\t', 1)) for line in f if '\t' in line}
+        self._file = open(self.path, 'a', encoding='utf-8', buffering=1)
+
+    def __contains__(self, item):
+        return item in self.done
+
+    def mark(self, name, digest):
+        if (name, digest) not in self.done:
+            self.done.add((name, digest))
+            self._file.write(f"{name}\t{digest}\n")
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,183 @@
+import json
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# =======================
+# 训练流程的计时与时间线
+# =======================
+#
+# 每个进程把事件逐行追加到 <metrics_dir>/events-<pid>.jsonl（进程池的工作进程各写各的文件，无需跨进程通信）。
+# 事件分两种：
+#   区间（span）：阶段、调度任务、子进程调用、进程内渲染等，记录开始时间、墙钟耗时、CPU 时间、峰值内存等
+#   瞬时事件（instant）：重试等
+# 运行结束后 write_report 汇总为 JSON 摘要（按类别统计耗时分位数）和 Chrome/Perfetto 可直接打开的时间线文件。
+
+BUSY_CATEGORIES = ("task", "pillow")  # 统计工作线程忙碌时间的最外层区间类别（子进程区间嵌套在 task 内）
+
+_lock = threading.Lock()
+_state = {"dir": None, "pid": None, "file": None}
+
+
+def configure(metrics_dir, reset=False):
+    """启用记录；reset 为 True 时删除上次运行留下的事件文件"""
+    metrics_dir = Path(metrics_dir)
+    metrics_dir.mkdir(parents=True, exist_ok=True)
+    if reset:
+        for path in metrics_dir.glob("events-*.jsonl"):
+            path.unlink(missing_ok=True)
+    with _lock:
+        _state.update(dir=metrics_dir, pid=None, file=None)
+
+
+def enabled():
+    return _state["dir"] is not None
+
+
+def now_us():
+    """微秒级的墙钟时间戳，各进程之间可比较"""
+    return time.time_ns() // 1000
+
+
+def _emit(event):
+    event["pid"] = os.getpid()
+    event["tid"] = threading.get_native_id()
+    line = json.dumps(event, ensure_ascii=False) + "\n"
+    with _lock:
+        # fork 出的子进程继承了父进程的状态，按 pid 重新打开自己的事件文件
+        if _state["pid"] != event["pid"]:
+            _state["file"] = open(_state["dir"] / f"events-{event['pid']}.jsonl", 'a', encoding='utf-8')
+            _state["pid"] = event["pid"]
+        # 工作进程退出时不会执行 atexit，每条事件立即写出
+        _state["file"].write(line)
+        _state["file"].flush()
+
+
+def _rusage():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime, max(own.ru_maxrss, children.ru_maxrss)
+
+
+@contextmanager
+def span(name, category, resource_usage=False, **args):
+    """记录一个区间；with 块内可向产出的 args 字典补充字段（如子进程的 CPU 时间、返回码）
+
+    默认记录当前线程的 CPU 时间；resource_usage 为 True 时改为记录本进程及已回收子进程的 CPU 时间合计
+    与峰值内存，适合阶段这样的粗粒度区间。
+    """
+    if not enabled():
+        yield args
+        return
+    start = now_us()
+    thread_cpu = time.thread_time()
+    if resource_usage:
+        process_cpu, _ = _rusage()
+    try:
+        yield args
+    finally:
+        if resource_usage:
+            cpu, max_rss = _rusage()
+            args["cpu_s"] = round(cpu - process_cpu, 6)
+            args["max_rss_kb"] = max_rss
+        else:
+            args.setdefault("cpu_s", round(time.thread_time() - thread_cpu, 6))
+        _emit({"ph": "X", "name": name, "cat": category, "ts": start, "dur": now_us() - start, "args": args})
+
+
+def instant(name, category, **args):
+    """记录一个瞬时事件，例如重试"""
+    if enabled():
+        _emit({"ph": "i", "name": name, "cat": category, "ts": now_us(), "s": "t", "args": args})
+
+
+def percentile(sorted_values, q):
+    """最近秩法求分位数，sorted_values 已升序排列"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * q // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def load_events(metrics_dir):
+    events = []
+    for path in sorted(Path(metrics_dir).glob("events-*.jsonl")):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue  # 进程被强制结束时可能留下不完整的最后一行
+    return events
+
+
+def summarize(events):
+    """按 类别/名称 汇总区间事件：次数、耗时分位数、CPU 时间、峰值内存、排队等待，以及瞬时事件的次数"""
+    groups = {}
+    busy = {}
+    for event in events:
+        key = f"{event['cat']}/{event['name']}"
+        if event["ph"] == "i":
+            groups.setdefault(key, {"count": 0})["count"] += 1
+            continue
+        group = groups.setdefault(key, {"durations": [], "cpu_s": 0.0, "max_rss_kb": 0, "queue_wait": []})
+        args = event.get("args", {})
+        group["durations"].append(event["dur"] / 1e6)
+        group["cpu_s"] += args.get("child_cpu_s", args.get("cpu_s", 0.0))
+        group["max_rss_kb"] = max(group["max_rss_kb"], args.get("max_rss_kb", 0))
+        if "queue_wait_s" in args:
+            group["queue_wait"].append(args["queue_wait_s"])
+        if event["cat"] in BUSY_CATEGORIES:
+            thread = f"{event['pid']}:{event['tid']}"
+            busy[thread] = busy.get(thread, 0.0) + event["dur"] / 1e6
+
+    summary = {}
+    for key, group in sorted(groups.items()):
+        if "durations" not in group:
+            summary[key] = group
+            continue
+        durations = sorted(group["durations"])
+        entry = {
+            "count": len(durations),
+            "total_s": round(sum(durations), 3),
+            "p50_s": percentile(durations, 50),
+            "p90_s": percentile(durations, 90),
+            "p99_s": percentile(durations, 99),
+            "max_s": durations[-1],
+            "cpu_s": round(group["cpu_s"], 3),
+        }
+        if group["max_rss_kb"]:
+            entry["max_rss_kb"] = group["max_rss_kb"]
+        if group["queue_wait"]:
+            waits = sorted(group["queue_wait"])
+            entry["queue_wait_p50_s"] = percentile(waits, 50)
+            entry["queue_wait_p90_s"] = percentile(waits, 90)
+        summary[key] = entry
+
+    wall = 0.0
+    if events:
+        wall = (max(e["ts"] + e.get("dur", 0) for e in events) - min(e["ts"] for e in events)) / 1e6
+    return {
+        "wall_s": round(wall, 3),
+        "spans": summary,
+        # 各线程处于任务中的时间，与 wall_s 相比可看出空闲的工作线程
+        "thread_busy_s": {thread: round(seconds, 3) for thread, seconds in sorted(busy.items())},
+    }
+
+
+def write_report(metrics_dir, summary_path, trace_path):
+    """汇总事件文件，写出 JSON 摘要与 Chrome 时间线，返回摘要"""
+    events = load_events(metrics_dir)
+    summary = summarize(events)
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    trace_events = [{"ph": "M", "name": "process_name", "pid": pid, "args": {"name": f"pid {pid}"}}
+                    for pid in sorted({event["pid"] for event in events})]
+    trace_events.extend(events)
+    with open(trace_path, 'w', encoding='utf-8') as f:
+        json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+    return summary
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+
+# =======================
+# 按内容寻址的渲染缓存
+# =======================
+#
+# 缓存键是 (规范化文本, 解析后的字体, 渲染参数, 渲染上下文) 的哈希，渲染上下文包括渲染工具版本与页面几何，
+# 以及生成条目中 .lstmf 的 tesseract 版本与基础模型。每个条目是一个目录：
+#   <root>/<key 前两位>/<key>/sample.tif、sample.box、sample.gt.txt，以及可选的 sample.lstmf
+# 命中时以硬链接放入训练数据目录（跨文件系统时退回复制），条目目录的 mtime 记录最近使用时间，
+# 用于按 LRU 顺序淘汰，使缓存总大小不超过上限。
+
+REQUIRED_SUFFIXES = ('.tif', '.box', '.gt.txt')
+OPTIONAL_SUFFIXES = ('.lstmf',)
+
+
+def cache_key(text, font, options, context):
+    """计算渲染结果的缓存键；context 是影响输出的其余设置（可 JSON 序列化）"""
+    payload = json.dumps([text, font, sorted(options.items()), context],
+                         ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def link_or_copy(source, target):
+    """优先硬链接，失败（例如跨文件系统）时复制"""
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def unlink_outputs(output_base, suffixes=REQUIRED_SUFFIXES + OPTIONAL_SUFFIXES):
+    """删除样本的输出文件
+
+    缓存命中的文件是缓存条目的硬链接，重新渲染前必须先删除，避免原地覆盖时改写缓存内容。
+    """
+    for suffix in suffixes:
+        Path(f"{output_base}{suffix}").unlink(missing_ok=True)
+
+
+class RenderCache:
+    def __init__(self, root, max_bytes):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def entry_dir(self, key):
+        return self.root / key[:2] / key
+
+    def fetch(self, key, output_base):
+        """命中时把缓存文件链接到 output_base 并返回 True"""
+        entry = self.entry_dir(key)
+        if not all((entry / f"sample{suffix}").exists() for suffix in REQUIRED_SUFFIXES):
+            return False
+        unlink_outputs(output_base)
+        for suffix in REQUIRED_SUFFIXES + OPTIONAL_SUFFIXES:
+            source = entry / f"sample{suffix}"
+            if source.exists():
+                link_or_copy(source, f"{output_base}{suffix}")
+        os.utime(entry)  # 记录最近使用时间
+        return True
+
+    def store(self, key, output_base, suffixes=REQUIRED_SUFFIXES):
+        """把刚渲染好的样本文件放入缓存；条目先写入临时目录，再原子地改名"""
+        if not all(Path(f"{output_base}{suffix}").exists() for suffix in suffixes):
+            return False
+        entry = self.entry_dir(key)
+        if entry.exists():
+            return True
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        staging = entry.with_name(f"{key}.tmp-{os.getpid()}")
+        shutil.rmtree(staging, ignore_errors=True)
+        staging.mkdir()
+        for suffix in suffixes:
+            link_or_copy(f"{output_base}{suffix}", staging / f"sample{suffix}")
+        try:
+            os.rename(staging, entry)
+        except OSError:
+            # 其他进程已写入同一条目
+            shutil.rmtree(staging, ignore_errors=True)
+        return True
+
+    def add_file(self, key, output_base, suffix):
+        """为已有条目补充后续阶段的产物（例如 .lstmf）"""
+        entry = self.entry_dir(key)
+        source = Path(f"{output_base}{suffix}")
+        target = entry / f"sample{suffix}"
+        if not entry.exists() or not source.exists() or target.exists():
+            return False
+        link_or_copy(source, target)
+        return True
+
+    def prune(self):
+        """按最近使用时间淘汰条目，直到缓存总大小不超过 max_bytes，返回淘汰的条目数"""
+        entries = []
+        total = 0
+        for bucket in self.root.iterdir():
+            if not bucket.is_dir():
+                continue
+            for entry in bucket.iterdir():
+                size = sum(f.stat().st_size for f in entry.iterdir())
+                entries.append((entry.stat().st_mtime, size, entry))
+                total += size
+
+        evicted = 0
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            evicted += 1
+        if evicted:
+            logging.info(f"渲染缓存淘汰 {evicted} 个条目，当前大小 {total / 1024 ** 2:.1f} MiB")
+        return evicted
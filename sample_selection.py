@@ -0,0 +1,131 @@
+import heapq
+import re
+import unicodedata
+from collections import Counter
+
+# =======================
+# 按字符覆盖选择训练样本
+# =======================
+#
+# 发票语料中大量行是重复的分隔线与相同的字段标签，按顺序取前 N 行时，公司名称中的生僻字往往一次都没有出现。
+# 这里先按规范化后的内容去重，再用贪心集合覆盖选出尽量少的行，使语料中的每个字符至少出现 char_min_count 次、
+# 每个相邻字符对（bigram）至少出现一次。每一步选择新增覆盖最多的行；新增覆盖只会随已选行增加而减少，
+# 因此可以延迟重新计算（lazy greedy），只在堆顶的估值过期时才重算。
+
+# lstmtraining 字符表中的特殊条目，不是实际字符
+UNICHARSET_SPECIAL = {"NULL", "Joined", "|Broken|0|1"}
+CHAR_WEIGHT = 4  # 一个字符的新增覆盖相当于几个 bigram
+
+
+def normalize(text):
+    """去重用的规范化形式：NFKC（全角标点、兼容字符归一）并合并连续空白"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def dedupe(lines):
+    """按规范化内容去重，保留每组的第一行，返回 (去重后的行, 读入的总行数)"""
+    seen = set()
+    unique = []
+    total = 0
+    for total, line in enumerate(lines, start=1):
+        key = normalize(line)
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(line)
+    return unique, total
+
+
+def line_units(text):
+    """一行文本中的字符计数与 bigram 集合（不含空白）"""
+    chars = Counter(char for char in text if not char.isspace())
+    bigrams = {text[i:i + 2] for i in range(len(text) - 1)
+               if not text[i].isspace() and not text[i + 1].isspace()}
+    return chars, bigrams
+
+
+def load_unicharset(path):
+    """读取 lstmtraining 字符表中的字符，文件不存在时返回空集合"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            count = int(f.readline().split()[0])
+            entries = [f.readline() for _ in range(count)]
+    except FileNotFoundError:
+        return set()
+    chars = {entry.split(' ', 1)[0] for entry in entries if entry.strip()}
+    return chars - UNICHARSET_SPECIAL
+
+
+def select(lines, char_min_count=3, limit=0):
+    """从（已去重的）lines 中贪心选择覆盖全部字符与 bigram 的行，返回所选行的下标（按选择顺序）
+
+    字符的目标次数不超过它在 lines 中出现的总次数；limit 大于 0 时最多选择 limit 行。
+    """
+    units = [line_units(line) for line in lines]
+    char_need = Counter()
+    bigram_need = set()
+    for chars, bigrams in units:
+        char_need.update(chars)
+        bigram_need |= bigrams
+    for char in char_need:
+        char_need[char] = min(char_need[char], char_min_count)
+
+    def gain(index):
+        chars, bigrams = units[index]
+        return (CHAR_WEIGHT * sum(min(count, char_need[char]) for char, count in chars.items())
+                + len(bigrams & bigram_need))
+
+    # 堆中存放 (-估值, 下标)；估值只会偏高，弹出后重算仍不低于下一个堆顶时即为当前最优
+    heap = [(-gain(index), index) for index in range(len(lines))]
+    heapq.heapify(heap)
+    selected = []
+    while heap and (limit <= 0 or len(selected) < limit):
+        _, index = heapq.heappop(heap)
+        current = gain(index)
+        if current <= 0:
+            continue
+        if heap and current < -heap[0][0]:
+            heapq.heappush(heap, (-current, index))
+            continue
+        selected.append(index)
+        chars, bigrams = units[index]
+        for char, count in chars.items():
+            char_need[char] = max(0, char_need[char] - count)
+        bigram_need -= bigrams
+    return selected
+
+
+def coverage(lines, char_min_count=3, unicharset=None):
+    """统计 lines 覆盖的字符与 bigram；给出 unicharset 时同时统计字符表的覆盖情况"""
+    char_counts = Counter()
+    bigrams = set()
+    for line in lines:
+        chars, line_bigrams = line_units(line)
+        char_counts.update(chars)
+        bigrams |= line_bigrams
+    stats = {
+        "lines": len(lines),
+        "chars_rendered": sum(char_counts.values()),
+        "chars": len(char_counts),
+        "chars_at_min_count": sum(1 for count in char_counts.values() if count >= char_min_count),
+        "bigrams": len(bigrams),
+    }
+    if unicharset:
+        stats["unicharset_covered"] = len(unicharset & char_counts.keys())
+    return stats
+
+
+def report(pool, selected_lines, baseline_lines, char_min_count=3, unicharset=None):
+    """选择结果的统计：语料（去重后）、所选行与对比用的 baseline_lines（例如按顺序取的前 N 行）的覆盖情况"""
+    result = {
+        "corpus": coverage(pool, char_min_count, unicharset),
+        "selected": coverage(selected_lines, char_min_count, unicharset),
+    }
+    if baseline_lines:
+        result["baseline"] = coverage(baseline_lines, char_min_count, unicharset)
+    if unicharset:
+        pool_chars = set().union(*(line_units(line)[0] for line in pool)) if pool else set()
+        result["unicharset"] = {
+            "chars": len(unicharset),
+            "missing_from_corpus": sorted(unicharset - pool_chars),
+        }
+    return result
@@ -0,0 +1,188 @@
+import json
+import os
+import shutil
+import threading
+import uuid
+from pathlib import Path
+
+# =======================
+# 训练样本分片存储
+# =======================
+#
+# 每个样本的 .tif、.box、.gt.txt、.lstmf 依次追加写入分片文件，网络文件系统上只留下少量大文件：
+#   <name>.pack   样本文件内容首尾相接
+#   <name>.idx    索引 {"members": {样本名: {后缀: [偏移, 长度]}}}，分片写完后才原子地写出
+# 没有索引的 .pack 是写入中途失败留下的，读取时忽略。同名样本出现在多个分片中时以最后写出的分片为准。
+# 训练时只需把 .lstmf（以及评估用的 .tif、.gt.txt）解出；清理时删除分片目录即可，无需逐个删除样本文件。
+
+PACK_SUFFIX = '.pack'
+INDEX_SUFFIX = '.idx'
+
+
+class ShardWriter:
+    """流式写入分片：add() 追加一个样本的文件，分片超过 max_bytes 后自动开始新分片；线程安全"""
+
+    def __init__(self, directory, prefix="shard", max_bytes=1024 ** 3):
+        self.directory = Path(directory)
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.samples = 0
+        self._lock = threading.Lock()
+        self._file = None
+
+    def _open(self):
+        self._name = f"{self.prefix}-{uuid.uuid4().hex[:12]}"
+        self._file = open(self.directory / f"{self._name}{PACK_SUFFIX}", 'wb')
+        self._members = {}
+
+    def _finish(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        index_path = self.directory / f"{self._name}{INDEX_SUFFIX}"
+        tmp_path = index_path.with_name(index_path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"members": self._members}, f, ensure_ascii=False)
+        os.replace(tmp_path, index_path)
+
+    def add(self, name, files):
+        """追加一个样本，files 是 {后缀: 文件路径}"""
+        contents = {}
+        for suffix, path in files.items():
+            with open(path, 'rb') as f:
+                contents[suffix] = f.read()
+        with self._lock:
+            if self._file is None:
+                self._open()
+            entry = {}
+            for suffix, data in contents.items():
+                entry[suffix] = [self._file.tell(), len(data)]
+                self._file.write(data)
+            self._members[name] = entry
+            self.samples += 1
+            if self._file.tell() >= self.max_bytes:
+                self._finish()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._finish()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ShardStore:
+    """读取分片目录中所有已完成的分片"""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.index = {}
+        if not self.directory.exists():
+            return
+        indexes = sorted(self.directory.glob(f"*{INDEX_SUFFIX}"), key=lambda path: path.stat().st_mtime)
+        for index_path in indexes:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                members = json.load(f)["members"]
+            pack_path = index_path.with_suffix(PACK_SUFFIX)
+            for name, entry in members.items():
+                self.index[name] = (pack_path, entry)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def names(self):
+        return self.index.keys()
+
+    def names_with(self, suffix):
+        """包含指定文件的样本名"""
+        return [name for name, (_, entry) in self.index.items() if suffix in entry]
+
+    def read(self, name, suffix):
+        pack_path, entry = self.index[name]
+        offset, size = entry[suffix]
+        with open(pack_path, 'rb') as f:
+            f.seek(offset)
+            return f.read(size)
+
+    def extract(self, names, suffixes, target_dir):
+        """把指定样本的指定文件解出到 target_dir，返回 {样本名: {后缀: 路径}}
+
+        按分片与偏移排序后顺序读取，每个分片只打开一次。
+        """
+        target_dir = Path(target_dir)
+        target_dir.mkdir(parents=True, exist_ok=True)
+        wanted = []
+        for name in names:
+            pack_path, entry = self.index[name]
+            wanted.extend((str(pack_path), entry[suffix][0], entry[suffix][1], name, suffix)
+                          for suffix in suffixes if suffix in entry)
+        wanted.sort()
+        extracted = {}
+        pack_file, current = None, None
+        try:
+            for pack_path, offset, size, name, suffix in wanted:
+                if pack_path != current:
+                    if pack_file is not None:
+                        pack_file.close()
+                    pack_file, current = open(pack_path, 'rb'), pack_path
+                pack_file.seek(offset)
+                target = target_dir / f"{name}{suffix}"
+                with open(target, 'wb') as f:
+                    f.write(pack_file.read(size))
+                extracted.setdefault(name, {})[suffix] = target
+        finally:
+            if pack_file is not None:
+                pack_file.close()
+        return extracted
+
+    def remove(self, names):
+        """从所有分片的索引中删除指定样本，返回删除的样本数；只能在没有写入方时调用
+
+        改写后的索引保留原来的修改时间，不影响同名样本以最后写出的分片为准的顺序；
+        样本全部被删除的分片连同 .pack 一起删除，其余分片中被删除样本的内容留在 .pack 中不再被引用。
+        """
+        names = set(names)
+        removed = set()
+        for index_path in self.directory.glob(f"*{INDEX_SUFFIX}"):
+            with open(index_path, 'r', encoding='utf-8') as f:
+                members = json.load(f)["members"]
+            kept = {name: entry for name, entry in members.items() if name not in names}
+            if len(kept) == len(members):
+                continue
+            removed.update(members.keys() - kept.keys())
+            if not kept:
+                index_path.unlink()
+                index_path.with_suffix(PACK_SUFFIX).unlink(missing_ok=True)
+                continue
+            stat = index_path.stat()
+            tmp_path = index_path.with_name(index_path.name + '.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"members": kept}, f, ensure_ascii=False)
+            os.utime(tmp_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+            os.replace(tmp_path, index_path)
+        for name in removed:
+            self.index.pop(name, None)
+        return len(removed)
+
+    def remove_incomplete(self):
+        """删除没有索引的分片（写入中途失败留下的），返回删除的个数；只能在没有写入方时调用"""
+        removed = 0
+        for pack_path in self.directory.glob(f"*{PACK_SUFFIX}"):
+            if not pack_path.with_suffix(INDEX_SUFFIX).exists():
+                pack_path.unlink(missing_ok=True)
+                removed += 1
+        return removed
+
+    def delete(self):
+        """删除整个分片目录"""
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.index = {}
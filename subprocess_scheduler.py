@@ -0,0 +1,146 @@
+import os
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from queue import SimpleQueue
+
+import pipeline_metrics
+
+# =======================
+# 子进程调度器
+# =======================
+#
+# text2image、tesseract 等阶段的工作本身都在子进程中完成，调用方只是等待子进程结束，
+# 因此用线程而不是进程来发起子进程即可。并发数按 CPU 预算和每个子进程的 OpenMP 线程数确定：
+#   并发槽位数 = CPU 预算 // 每个子进程的线程数
+# 每个线程固定占用一个槽位，槽位对应一组 CPU 核；启用绑核时子进程只在这组核上运行。
+
+_local = threading.local()
+
+
+def available_cores():
+    """当前进程允许使用的 CPU 核编号"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def child_env(threads):
+    """子进程的环境变量：限制 OpenMP 线程数，避免每个子进程都启动与核数相同的线程"""
+    env = os.environ.copy()
+    env['OMP_NUM_THREADS'] = str(threads)
+    env['OMP_THREAD_LIMIT'] = str(threads)
+    return env
+
+
+def _communicate(process):
+    """读取子进程的输出并用 os.wait4 回收子进程，返回 (stdout, stderr, rusage)"""
+    if not hasattr(os, 'wait4'):
+        stdout, stderr = process.communicate()
+        return stdout, stderr, None
+    stderr_parts = []
+    reader = None
+    if process.stderr is not None:
+        # stdout 与 stderr 同时读取，避免任一管道写满导致子进程阻塞
+        reader = threading.Thread(target=lambda: stderr_parts.append(process.stderr.read()), daemon=True)
+        reader.start()
+    stdout = process.stdout.read() if process.stdout is not None else None
+    if reader is not None:
+        reader.join()
+    for pipe in (process.stdout, process.stderr):
+        if pipe is not None:
+            pipe.close()
+    _, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return stdout, stderr_parts[0] if stderr_parts else None, rusage
+
+
+def popen(command, **kwargs):
+    """启动子进程并返回 subprocess.Popen，适用于需要逐行读取输出的长时间子进程
+
+    与 run() 一样，在调度器的工作线程中调用时使用该线程槽位的线程数与 CPU 核。
+    """
+    slot = getattr(_local, 'slot', None)
+    threads, cores = (slot.threads, slot.cores) if slot else (1, None)
+    kwargs.setdefault('env', child_env(threads))
+    if cores and shutil.which('taskset'):
+        # 用 taskset 在 exec 之前设定亲和性，子进程创建的所有线程都继承这组核
+        command = ['taskset', '-c', ','.join(map(str, cores)), *command]
+        cores = None
+    process = subprocess.Popen(command, **kwargs)
+    if cores and hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(process.pid, cores)
+        except OSError:
+            pass  # 子进程可能已经退出
+    return process
+
+
+def run(command, **kwargs):
+    """运行子进程并返回 subprocess.CompletedProcess
+
+    在调度器的工作线程中调用时使用该线程槽位的线程数与 CPU 核，否则按单线程、不绑核运行。
+    启用 pipeline_metrics 时记录子进程的墙钟耗时、CPU 时间与峰值内存。
+    """
+    kwargs.setdefault('stdout', subprocess.PIPE)
+    kwargs.setdefault('stderr', subprocess.PIPE)
+    kwargs.setdefault('text', True)
+
+    program = os.path.basename(command[0])
+    with pipeline_metrics.span(program, "subprocess") as metrics:
+        process = popen(command, **kwargs)
+        stdout, stderr, rusage = _communicate(process)
+        metrics["returncode"] = process.returncode
+        if rusage is not None:
+            metrics["child_cpu_s"] = round(rusage.ru_utime + rusage.ru_stime, 6)
+            metrics["max_rss_kb"] = rusage.ru_maxrss
+    return subprocess.CompletedProcess(process.args, process.returncode, stdout, stderr)
+
+
+class _Slot:
+    def __init__(self, threads, cores):
+        self.threads = threads
+        self.cores = cores
+
+
+class SubprocessScheduler:
+    """按 CPU 预算发起子进程的线程池，接口与 concurrent.futures 的执行器一致（submit、shutdown、with）
+
+    提交的函数在工作线程中执行，函数内部用 run() 启动子进程。
+    """
+
+    def __init__(self, cpu_budget=None, threads_per_child=1, pin_cores=False):
+        cores = available_cores()
+        cpu_budget = min(cpu_budget or len(cores), len(cores))
+        self.threads_per_child = max(1, threads_per_child)
+        self.max_workers = max(1, cpu_budget // self.threads_per_child)
+
+        self._slots = SimpleQueue()
+        for i in range(self.max_workers):
+            group = cores[i * self.threads_per_child:(i + 1) * self.threads_per_child] if pin_cores else None
+            self._slots.put(_Slot(self.threads_per_child, group))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, initializer=self._claim_slot)
+
+    def _claim_slot(self):
+        _local.slot = self._slots.get()
+
+    def submit(self, fn, *args, **kwargs):
+        return self._executor.submit(self._run_task, time.monotonic(), fn, *args, **kwargs)
+
+    @staticmethod
+    def _run_task(submitted, fn, *args, **kwargs):
+        # 记录任务在队列中等待空闲槽位的时间
+        queue_wait = round(time.monotonic() - submitted, 6)
+        with pipeline_metrics.span(getattr(fn, '__name__', 'task'), "task", queue_wait_s=queue_wait):
+            return fn(*args, **kwargs)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
@@ -0,0 +1,55 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import pillow_renderer  # noqa: E402
+
+pytestmark = pytest.mark.skipif(not pillow_renderer.available(), reason="未安装 Pillow")
+
+FONT_DIRS = [Path("/usr/share/fonts"), Path("/usr/local/share/fonts"), Path.home() / ".fonts"]
+
+
+def find_font():
+    for directory in FONT_DIRS:
+        for pattern in ("*.ttf", "*.otf", "*.ttc"):
+            for font_file in sorted(directory.rglob(pattern)) if directory.is_dir() else []:
+                return str(font_file)
+    pytest.skip("没有可用的字体文件")
+
+
+def test_line_end_box_at_end_of_line(tmp_path):
+    from PIL import Image
+
+    base = tmp_path / "sample"
+    pillow_renderer.render_line("ab c", base, find_font(), ptsize=12, resolution=300)
+    with Image.open(f"{base}.tif") as image:
+        width, height = image.size
+    lines = Path(f"{base}.box").read_text(encoding="utf-8").splitlines()
+    assert len(lines) == len("ab c") + 1
+
+    # 行尾的制表符框位于最后一个字符之后、右侧留白之前
+    fields = lines[-1].split()
+    left, right = int(fields[0]), int(fields[2])
+    assert lines[-1].startswith("\t")
+    assert left == width - pillow_renderer.MARGIN
+    assert right == left + 1
+    last_char_right = int(lines[-2].split()[3])
+    assert left >= last_char_right
+
+
+def test_exposure_matches_text2image_direction():
+    from PIL import Image, ImageDraw
+
+    image = Image.new('L', (20, 20), 255)
+    ImageDraw.Draw(image).rectangle((8, 8, 11, 11), fill=0)
+    ink = image.histogram()[0]
+
+    # text2image：exposure 不小于 2 时笔画变粗，不大于 -2 时变细，只做一次且与绝对值大小无关
+    assert pillow_renderer.apply_exposure(image, 2).histogram()[0] > ink
+    assert pillow_renderer.apply_exposure(image, -2).histogram()[0] < ink
+    assert pillow_renderer.apply_exposure(image, 3).histogram() == pillow_renderer.apply_exposure(image, 2).histogram()
+    assert pillow_renderer.apply_exposure(image, 1).histogram() == image.histogram()
+    assert pillow_renderer.apply_exposure(image, -1).histogram() == image.histogram()
@@ -1,14 +1,47 @@
 import os
+import argparse
 import subprocess
 import logging
 import shutil
+import json
+import csv
+import socket
+import tempfile
 import glob
 import time
-import re
+import mmap
+import heapq
+import random
+import hashlib
+import functools
+from collections import Counter
+from itertools import chain, islice, product
 from pathlib import Path
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from multiprocessing import cpu_count, Queue
-from logging.handlers import QueueHandler, QueueListener
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED, ALL_COMPLETED
+from multiprocessing import Queue
+from logging.handlers import QueueListener
+
+import pillow_renderer
+import render_cache
+import font_index
+import subprocess_scheduler
+import pipeline_logging
+import pipeline_metrics
+import training_progress
+import work_queue
+import shard_store
+import failure_policy
+import sample_selection
+import augment
+import evaluation
+import checkpoint_registry
+from checkpoint_registry import CheckpointRegistry
+from pipeline_manifest import PipelineManifest, CompletionLog, fingerprint, file_signature
+
+try:
+    from PIL import Image
+except ImportError:  # 批量渲染需要 Pillow 拆分多页 TIFF，未安装时退回逐行渲染
+    Image = None
 
 # =======================
 # 配置参数
@@ -16,16 +49,46 @@ from logging.handlers import QueueHandler, QueueListener
 
 # 日志配置
 LOG_FILE = "training.log"
+LOG_LEVEL = logging.INFO  # 各进程在序列化之前按此级别过滤，设为 logging.DEBUG 可查看命令行与 lstmtraining 输出
+SAMPLE_LOG_EVERY = 1000  # 逐样本日志（渲染、转换成功等）每 N 条保留一条，0 表示全部省略；警告与错误总是保留
+SAMPLE_LOG_MAX_PER_SECOND = 10  # 每个进程每秒最多保留的逐样本日志条数
 
 # 字体配置
 DEFAULT_FONTS_DIR = "/usr/share/fonts"  # 默认字体目录，可根据需要修改
 
 # 其他配置
 INVOICE_FILE_PATH = "generated_invoices.txt"  # 发票数据文件路径
-NUM_SAMPLES = 100  # 样本数量
+NUM_SAMPLES = 100  # 样本数量，0 表示不限
+# 样本选择："first"：按顺序取前 NUM_SAMPLES 行，达到数量后停止读取，内存占用与语料大小无关；
+# "coverage"：去重后贪心选择覆盖全部字符与 bigram 的最少行（不超过 NUM_SAMPLES），需要把整个语料的
+# 不重复行读入内存，适合中小规模语料
+SAMPLE_SELECTION = "first"
+SELECTION_CHAR_MIN_COUNT = 3  # coverage 选择时每个字符至少出现的次数（语料中出现次数更少的字符全部选入）
+UNICHARSET_PATH = "unicharset"  # 用于统计覆盖情况的字符表
 FONT_NAMES = ["Microsoft YaHei"]  # 支持的字体列表
+FONT_WEIGHTS = {}  # 渲染矩阵中各字体的权重，例如 {"Microsoft YaHei": 2}；未列出的字体权重为 1
+# 发票标签用到的字符；所选字体必须覆盖这些字符与发票语料中实际出现的全部字符（例如公司名称中的生僻字），
+# 否则改用覆盖最全的替代字体
+FONT_REQUIRED_CHARS = "发票号开票日期购买方名称纳税人识别号销售方项目明细单价数量金额税率税额合计价税合计大写开票人¥0123456789.:%()（）-"
 LANGUAGES = ["chi_sim"]  # 支持的语言列表
 
+# 渲染配置
+RENDER_ENGINE = "text2image"  # 渲染引擎："text2image" 或 "pillow"（进程内渲染，无需 Tesseract 训练工具）
+# 渲染矩阵：每个参数的取值及其权重。每行文本从 字体 × 字号 × 曝光 × 字符间距 的组合中取一种，
+# 组合的权重是各取值权重之积；每个参数只有一个取值时等同于固定参数
+RENDER_MATRIX = {
+    "ptsize": {40: 1},
+    "char_spacing": {0.0: 1},
+    "exposure": {0: 1},
+}
+RENDER_SAMPLING = "stratified"  # "stratified"：按权重比例轮转分配，各组合占比精确；"weighted"：按权重逐行随机抽取
+RENDER_SEED = 0  # weighted 抽样的随机种子，同一行文本每次得到相同的组合
+RENDER_SCHEDULE_WINDOW = 4096  # 调度窗口：每次读取这么多行，按字体分组并均衡长短行后再分发
+RENDER_RESOLUTION = 300  # text2image 默认分辨率（DPI）
+RENDER_BATCH_SIZE = 1  # 每次 text2image 调用渲染的文本行数，大于 1 时启用批量渲染（每行一页）
+RENDER_BATCH_PAGE_WIDTH = 8000  # 批量渲染的页面宽度（像素），需容纳最长的一行以免折行
+RENDER_BATCH_MARGIN = 50  # 批量渲染的页边距（像素）
+
 # 路径配置
 HOME_DIR = Path.home()
 TESSDATA_PREFIX = HOME_DIR / "Desktop" / "trainingdata" / "tesseract-5.4.1"
@@ -36,9 +99,116 @@ LANGDATA_DIR = TESSTRAIN_DIR / "langdata"
 OUTPUT_DIR = TESSTRAIN_DIR / "output"
 MODEL_DIR = TESSTRAIN_DIR / "model"  # 用于存放中间模型文件
 
+# 渲染缓存配置：相同文本、字体与渲染参数的样本直接复用上次的渲染结果
+RENDER_CACHE_ENABLED = True
+RENDER_CACHE_DIR = TESSTRAIN_DIR / "render_cache"
+RENDER_CACHE_MAX_BYTES = 10 * 1024 ** 3  # 缓存大小上限，超出后按最近使用时间淘汰
+RENDER_CACHE_MAP = TRAINING_DATA_DIR / "render_cache.map"  # 记录本次样本与缓存键的对应关系
+
+# 断点续跑配置
+PIPELINE_MANIFEST_PATH = OUTPUT_DIR / "pipeline_manifest.json"  # 各阶段的输入指纹与输出
+RENDER_DONE_PATH = TRAINING_DATA_DIR / "render.done"  # 渲染阶段逐样本的完成记录
+SELECTION_REPORT_PATH = TRAINING_DATA_DIR / "sample_selection.json"  # 样本选择的覆盖统计
+FONT_INDEX_PATH = OUTPUT_DIR / "font_index.json"  # 字体索引，字体目录变化时自动重建
+CORPUS_CHARS_PATH = OUTPUT_DIR / "corpus_chars.json"  # 发票语料中出现的字符，语料文件变化时重新统计
+STAGES = ["generate", "augment", "lstmf", "list", "extract", "train", "evaluate"]  # 训练流程的阶段，按执行顺序排列
+
+# 子进程调度配置：text2image、tesseract 子进程由线程发起，并发数 = CPU_BUDGET // CHILD_OMP_THREADS
+CPU_BUDGET = len(subprocess_scheduler.available_cores())  # 可使用的 CPU 核数
+CHILD_OMP_THREADS = 1  # 每个 text2image/tesseract 子进程的 OpenMP 线程数
+PIN_CHILD_CORES = False  # 是否把每个并发槽位的子进程绑定到固定的 CPU 核
+
+# 流水线模式：样本渲染完成后立即转换为 .lstmf 并追加到训练列表，渲染与 lstmf 阶段重叠执行；
+# 之后的 lstmf 阶段只需处理遗漏的样本
+PIPELINE_STREAMING = False
+
+# 分片存储：样本在本机暂存目录中渲染并转换为 .lstmf，随即打包追加到 SHARD_DIR 的分片中并删除暂存文件，
+# 训练数据目录（通常在网络文件系统上）只保留少量大文件；训练前只解出 .lstmf 与评估集的 .tif、.gt.txt，
+# 清理时删除分片目录即可
+SHARD_STORE_ENABLED = False
+SHARD_DIR = TRAINING_DATA_DIR / "shards"
+SHARD_MAX_BYTES = 1024 ** 3  # 单个分片的大小上限
+SHARD_SCRATCH_DIR = Path(tempfile.gettempdir()) / "tesstrain_scratch"  # 本机暂存目录，应位于本地磁盘
+SHARD_EXTRACT_DIR = TRAINING_DATA_DIR / "extracted"  # 训练与评估所需文件的解出位置
+SHARD_SUFFIXES = ('.tif', '.box', '.gt.txt', '.lstmf')  # 打包的样本文件
+
+# 图像增强：每个渲染好的样本只读入一次，用 NumPy 批量生成 AUGMENT_VARIANTS 个变体（轻微旋转与倾斜、模糊、
+# 对比度、类 JPEG 压缩、噪声），写出 .tif/.box/.gt.txt 后在 lstmf 阶段与原样本一起转换；留出集样本不做增强
+AUGMENT_ENABLED = False
+AUGMENT_VARIANTS = 2  # 每个样本的变体数
+AUGMENT_SEED = 0  # 同一样本每次得到相同的变体
+AUGMENT_OPTIONS = {}  # 覆盖 augment.DEFAULT_OPTIONS 中的变换幅度，例如 {"max_rotation": 1.0, "max_noise": 8.0}
+AUGMENT_BATCH_SIZE = 16  # 每个工作进程任务处理的样本数
+AUGMENT_REPORT_PATH = TRAINING_DATA_DIR / "augment.json"  # 增强阶段的统计，也是该阶段的输出标记
+
+# 分布式生成：多台主机共享 WORK_QUEUE_DIR 与训练数据目录，主节点把样本切分为工作单元写入队列，
+# 各节点（用 --worker 启动）领取单元、渲染并转换为 .lstmf 后提交到训练数据目录；为 None 时在本机生成
+WORK_QUEUE_DIR = None  # 例如 Path("/mnt/shared/tesstrain_queue")
+WORK_UNIT_SIZE = 500  # 每个工作单元的样本数
+WORK_LEASE_SECONDS = 300  # 租约超过这么久未续约视为节点失效，单元由其他节点重新处理
+WORK_QUEUE_POLL_SECONDS = 10  # 暂时没有可领取的单元时，等待这么久再检查
+
+# 失败处理：确定性错误（字体不存在、文件缺失、参数错误等）不重试；暂时性错误放入重试队列，
+# 按带抖动的指数退避重新提交，等待期间不占用并发槽位
+RETRY_MAX_ATTEMPTS = 3  # 每个任务最多执行的次数
+RETRY_BASE_DELAY = 0.5  # 第一次重试前的最长等待时间（秒），之后每次加倍
+RETRY_MAX_DELAY = 30  # 单次等待时间的上限（秒）
+CIRCUIT_BREAKER_THRESHOLD = 20  # 同一确定性错误出现这么多次后终止整个阶段，0 表示不终止
+
+# 计时与时间线：记录各阶段、调度任务与子进程调用的耗时、CPU 时间、峰值内存、重试与排队等待
+METRICS_ENABLED = True
+METRICS_DIR = OUTPUT_DIR / "metrics"  # 各进程的事件文件
+METRICS_SUMMARY_PATH = OUTPUT_DIR / "metrics_summary.json"  # 按类别汇总的耗时分位数
+METRICS_TRACE_PATH = OUTPUT_DIR / "pipeline_trace.json"  # 可在 chrome://tracing 或 Perfetto 中打开
+
+# 训练配置
+MAX_ITERATIONS = 4000  # lstmtraining 的最大迭代次数
+TRAINING_PROGRESS_CSV = MODEL_DIR / "training_progress.csv"  # 训练过程中逐行追加的进度时间序列
+TRAINING_PROGRESS_JSON = MODEL_DIR / "training_progress.json"  # 训练结束后写出的完整序列与摘要
+CHECKPOINT_REGISTRY_PATH = MODEL_DIR / "checkpoints.json"  # 检查点登记表（迭代次数、损失率、大小）
+CHECKPOINT_KEEP_BEST = 3  # 训练过程中只保留损失最低的若干个检查点（另保留最新的检查点）
+
+# 增量微调：从上次的最优检查点（没有时用 my_model.traineddata）继续训练，只使用上次训练之后新增的样本，
+# 并混入一部分旧样本避免遗忘；没有可继续的模型或训练记录时退回完整训练
+INCREMENTAL_ENABLED = False
+INCREMENTAL_ITERATIONS = 1000  # 在起点的迭代次数之上继续训练的迭代次数
+INCREMENTAL_REPLAY_FRACTION = 0.3  # 增量训练列表中旧样本所占的比例，0 表示只用新样本
+INCREMENTAL_SEED = 0  # 抽取旧样本的随机种子
+TRAINED_SAMPLES_PATH = MODEL_DIR / "trained_samples.tsv"  # 当前模型训练过的样本（.lstmf 内容摘要与路径）
+INCREMENTAL_LIST_PATH = TRAINING_DATA_DIR / "lstmf.incremental_list"  # 增量训练实际使用的列表
+INCREMENTAL_DIR = MODEL_DIR / "incremental"  # 增量训练的模型目录（独立的检查点前缀与登记表），打包成功后再替换旧检查点
+
+# 超参数扫描（--sweep）：从同一 lstmf.training_list 并发运行多组 lstmtraining，CPU 核在各组之间平分，
+# 每组使用独立的模型目录与绑定的核；结束后在留出集上评估各组的最优检查点，写出对比表
+SWEEP_CONFIGS = {
+    # 名称 -> lstmtraining 参数（--键 值），未给出的 max_iterations 取 MAX_ITERATIONS，例如：
+    # "lr_1e-4": {"learning_rate": 0.0001},
+    # "lr_1e-3_8k": {"learning_rate": 0.001, "max_iterations": 8000},
+}
+SWEEP_DIR = OUTPUT_DIR / "sweep"  # 各组的模型目录 SWEEP_DIR/<名称>
+SWEEP_REPORT_PATH = SWEEP_DIR / "sweep_report.json"
+SWEEP_TABLE_PATH = SWEEP_DIR / "sweep_report.csv"  # 按留出集 CER 排序的对比表
+
+# 评估配置：按样本名哈希留出一部分样本不参与训练，训练后用它们评估保留的检查点，
+# 留出集上 CER 最低的检查点打包为最终的 my_model.traineddata
+EVAL_HOLDOUT_FRACTION = 0.05  # 留作评估集的样本比例，0 表示不留出（评估阶段随之跳过）
+EVAL_LIST_PATH = TRAINING_DATA_DIR / "lstmf.eval_list"  # 评估集的 .lstmf 列表，也可直接用于 lstmeval
+EVAL_DIR = OUTPUT_DIR / "evaluation"  # 候选检查点打包出的 traineddata
+EVAL_REPORT_PATH = OUTPUT_DIR / "evaluation.json"  # 各候选模型按字段类型统计的 CER/WER
+EVAL_BATCH_SIZE = 200  # 每个 tesseract 进程识别的图片数
+EVAL_PSM = 7  # 样本是单行文本
+EVAL_INCLUDE_BASE_MODEL = True  # 同时评估基础模型 chi_sim 作为对照（不参与选择）
+
+# 提前停止：BCER 在 EARLY_STOP_WINDOW 次迭代内没有比最优值下降至少 EARLY_STOP_MIN_DELTA 个百分点时结束训练，
+# 已写出的最优检查点照常打包
+EARLY_STOP_ENABLED = False
+EARLY_STOP_WINDOW = 800
+EARLY_STOP_MIN_DELTA = 0.1
+EARLY_STOP_MIN_ITERATIONS = 1000  # 达到该迭代次数之前不会提前停止
+
 # 环境变量设置
 os.environ["TESSDATA_PREFIX"] = str(TESSDATA_PATH)
-os.environ['OMP_NUM_THREADS'] = str(cpu_count())
+# OMP_NUM_THREADS 不再全局设置，由 subprocess_scheduler 按子进程分别设置
 
 # 创建必要的目录
 TRAINING_DATA_DIR.mkdir(parents=True, exist_ok=True)
@@ -50,26 +220,40 @@ MODEL_DIR.mkdir(parents=True, exist_ok=True)
 # 日志配置（多进程安全）
 # =======================
 
+sample_log = logging.getLogger(pipeline_logging.SAMPLE_LOGGER_NAME)  # 逐样本热路径的日志，受采样与限速控制
+LOG_QUEUE = None  # 主进程的日志队列，由 configure_logging 设置，进程池据此为工作进程配置日志
+LOG_COUNTER = None  # 按级别统计日志条数，用于各阶段摘要
+SAMPLE_LOG_FILTER = None  # 主进程（含调度器线程）的逐样本日志过滤器
+
 def configure_logging(log_queue):
-    """配置主进程的日志监听器"""
+    """配置主进程的日志监听器，主进程自身的日志也经由队列发送"""
+    global LOG_QUEUE, LOG_COUNTER, SAMPLE_LOG_FILTER
     handler = logging.FileHandler(LOG_FILE, encoding='utf-8')
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(processName)s - %(message)s')
     handler.setFormatter(formatter)
     stream_handler = logging.StreamHandler()
-    listener = QueueListener(log_queue, handler, stream_handler)
+    stream_handler.setFormatter(formatter)
+    LOG_COUNTER = pipeline_logging.LevelCounter()
+    listener = QueueListener(log_queue, handler, stream_handler, LOG_COUNTER)
     listener.start()
+    LOG_QUEUE = log_queue
+    SAMPLE_LOG_FILTER = pipeline_logging.install_queue_logger(
+        log_queue, LOG_LEVEL, SAMPLE_LOG_EVERY, SAMPLE_LOG_MAX_PER_SECOND)
     return listener
 
-def worker_configure_logger(log_queue):
-    """配置子进程的日志处理器"""
-    queue_handler = QueueHandler(log_queue)
-    logger = logging.getLogger()
-    logger.setLevel(logging.DEBUG)
-    logger.addHandler(queue_handler)
-    # 移除其他处理器以避免重复日志
-    for handler in logger.handlers:
-        if not isinstance(handler, QueueHandler):
-            logger.removeHandler(handler)
+def worker_configure_logger(log_queue, metrics_dir=None):
+    """配置子进程的日志处理器（以及计时记录），作为进程池的 initializer"""
+    pipeline_logging.install_queue_logger(log_queue, LOG_LEVEL, SAMPLE_LOG_EVERY, SAMPLE_LOG_MAX_PER_SECOND)
+    if metrics_dir is not None:
+        pipeline_metrics.configure(metrics_dir)
+
+def worker_pool(max_workers):
+    """创建进程池；主进程已配置日志队列时，工作进程的日志也经由该队列发送"""
+    if LOG_QUEUE is None:
+        return ProcessPoolExecutor(max_workers=max_workers)
+    metrics_dir = METRICS_DIR if pipeline_metrics.enabled() else None
+    return ProcessPoolExecutor(max_workers=max_workers, initializer=worker_configure_logger,
+                               initargs=(LOG_QUEUE, metrics_dir))
 
 # =======================
 # 函数定义
@@ -77,7 +261,13 @@ def worker_configure_logger(log_queue):
 
 def check_dependencies():
     """检查所有必需的外部命令是否可用"""
-    commands = ['text2image', 'tesseract', 'lstmtraining', 'combine_tessdata', 'fc-cache', 'fc-list', 'fc-match']
+    commands = ['text2image', 'tesseract', 'lstmtraining', 'combine_tessdata', 'fc-cache', 'fc-scan']
+    if RENDER_ENGINE == "pillow":
+        # 进程内渲染不需要 text2image，但需要 Pillow
+        commands.remove('text2image')
+        if not pillow_renderer.available():
+            logging.error("RENDER_ENGINE 为 pillow，但未安装 Pillow。")
+            return False
     missing = []
     for cmd in commands:
         if shutil.which(cmd) is None:
@@ -97,165 +287,924 @@ def refresh_fonts_cache():
     except subprocess.CalledProcessError as e:
         logging.error(f"刷新字体缓存时发生错误：{e}")
 
-def check_font_installed(font_name):
-    """检查字体是否安装"""
-    command = ['fc-list', ':family']
+def render_font_name(font):
+    """交给渲染工作进程的字体名：text2image 使用字体描述，Pillow 直接使用 "文件:索引"，无需再解析"""
+    if RENDER_ENGINE == "pillow":
+        return f"{font['file']}:{font['index']}"
+    return font_index.description(font)
+
+def corpus_chars():
+    """发票语料（规范化后）中出现的全部字符，按语料文件签名缓存在 CORPUS_CHARS_PATH 中；语料不存在时返回空字符串"""
+    signature = file_signature(INVOICE_FILE_PATH)
+    if signature is None:
+        return ""
     try:
-        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
-        installed_fonts = result.stdout.lower().splitlines()
-        for line in installed_fonts:
-            if font_name.lower() in line:
-                logging.info(f"已安装字体：{font_name}")
-                return True
-        logging.error(f"字体未找到：{font_name}")
-        return False
-    except subprocess.CalledProcessError as e:
-        logging.error(f"检查字体时发生错误：{e}")
-        return False
-
-def find_alternative_font(font_name):
-    """如果找不到指定字体，返回系统中已安装的替代字体"""
+        with open(CORPUS_CHARS_PATH, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached["signature"] == signature:
+            return cached["chars"]
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        pass
+    chars = set()
+    for line in iter_invoice_lines(INVOICE_FILE_PATH):
+        chars.update(line)
+    text = "".join(sorted(char for char in chars if not char.isspace()))
+    with open(CORPUS_CHARS_PATH, 'w', encoding='utf-8') as f:
+        json.dump({"signature": signature, "chars": text}, f, ensure_ascii=False)
+    return text
+
+def resolve_fonts():
+    """用字体索引校验 FONT_NAMES，返回交给工作进程的字体名列表；无可用字体时返回 None
+
+    字体未安装或未覆盖 FONT_REQUIRED_CHARS 与语料中的字符时改用覆盖最全的替代字体，在分发任何渲染任务之前发现问题。
+    """
     try:
-        result = subprocess.run(['fc-match', font_name], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
-        if result.returncode == 0:
-            alternative_font = result.stdout.split(':')[0].strip()
-            logging.info(f"找不到字体 '{font_name}'，使用替代字体：{alternative_font}")
-            return alternative_font
-        else:
-            logging.error(f"fc-match 命令失败，无法找到替代字体。错误信息：{result.stderr}")
-            return None
-    except subprocess.CalledProcessError as e:
-        logging.error(f"fc-match 命令执行失败，无法找到替代字体。错误信息：{e}")
+        index, rebuilt = font_index.load_index(DEFAULT_FONTS_DIR, FONT_INDEX_PATH)
+    except (OSError, subprocess.CalledProcessError) as e:
+        logging.error(f"建立字体索引失败，错误信息：{e}")
         return None
+    if rebuilt:
+        refresh_fonts_cache()
+    required_chars = "".join(dict.fromkeys(FONT_REQUIRED_CHARS + corpus_chars()))
+
+    resolved = []
+    for font_name in FONT_NAMES:
+        font = index.find(font_name)
+        if font is None:
+            logging.error(f"字体未找到：{font_name}")
+        else:
+            missing = index.missing_chars(font, required_chars)
+            if missing:
+                logging.error(f"字体 '{font_name}' 缺少字符：{missing}")
+                font = None
+        if font is None:
+            font = index.best_alternative(required_chars)
+            missing = required_chars if font is None else index.missing_chars(font, required_chars)
+            if missing:
+                logging.error(f"找不到覆盖所需字符的替代字体（缺少：{missing}），无法使用字体 '{font_name}'。")
+                return None
+            logging.info(f"将字体 '{font_name}' 替换为 '{font_index.description(font)}'（{font['file']}）")
+        resolved.append(render_font_name(font))
+    logging.info(f"使用字体：{', '.join(resolved)}")
+    return resolved
+
+def text2image_command(font_name, output_base, text_path, options, extra_args=()):
+    """构造 text2image 命令行，options 是渲染矩阵中的一种组合 {"ptsize", "char_spacing", "exposure"}"""
+    return [
+        'text2image',
+        '--font', font_name,          # 使用指定的字体
+        '--outputbase', str(output_base),
+        '--text', str(text_path),
+        '--fonts_dir', str(DEFAULT_FONTS_DIR),  # 确保字体目录正确
+        '--ptsize', str(options["ptsize"]),
+        '--char_spacing', str(options["char_spacing"]),
+        '--exposure', str(options["exposure"]),
+        *extra_args
+    ]
 
 def generate_single_training_sample(args):
-    """生成单个训练样本，args 是一个包含 (invoice_text, output_base, i, font_name) 的元组"""
-    invoice_text, output_base, i, font_name = args
-    retries = 3
+    """生成单个训练样本，args 是一个包含 (invoice_text, output_base, i, font_name, options) 的元组
+
+    只调用一次 text2image，成功时返回 None，失败（包括意外异常）时返回 failure_policy.Failure，由调度方决定是否重试。
+    """
+    invoice_text, output_base, i, font_name, options = args
+    failure = None
     try:
-        logging.info(f"正在处理的发票文本 (编号: {i}):\n{invoice_text}\n")
+        sample_log.info("正在处理的发票文本 (编号: %s)：%s", i, invoice_text)
 
         # 将发票内容写入文本文件
         text_line_path = f"{output_base}.txt"
         with open(text_line_path, 'w', encoding='utf-8') as f:
             f.write(invoice_text)
-        logging.debug(f"写入文本文件：{text_line_path}，内容：{invoice_text}")
-
-        for attempt in range(retries):
-            command = [
-                'text2image',
-                '--font', font_name,          # 使用指定的字体
-                '--outputbase', output_base,
-                '--text', text_line_path,
-                '--fonts_dir', str(DEFAULT_FONTS_DIR),  # 确保字体目录正确
-                '--ptsize', '40',
-                '--char_spacing', '0.0',
-                '--exposure', '0'
-            ]
-
-            logging.debug(f"执行命令：{' '.join(command)} (尝试 {attempt + 1}/{retries})")
-            result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
 
-            if result.returncode == 0:
-                logging.info(f"text2image 生成训练数据成功，文件：{output_base}.tif")
-                gt_text_path = f"{output_base}.gt.txt"
-                with open(gt_text_path, 'w', encoding='utf-8') as f:
-                    f.write(invoice_text)
-                logging.debug(f"写入 GT 文本文件：{gt_text_path}，内容：{invoice_text}")
+        command = text2image_command(font_name, output_base, text_line_path, options)
+        if sample_log.isEnabledFor(logging.DEBUG):
+            sample_log.debug("执行命令：%s", ' '.join(command))
+        result = subprocess_scheduler.run(command)
 
-                # 检查文件是否生成
-                if Path(f"{output_base}.tif").exists():
-                    logging.info(f"成功生成 .tif 文件：{output_base}.tif")
-                else:
-                    logging.error(f"没有找到生成的 .tif 文件：{output_base}.tif")
-                break
+        if result.returncode == 0:
+            gt_text_path = f"{output_base}.gt.txt"
+            with open(gt_text_path, 'w', encoding='utf-8') as f:
+                f.write(invoice_text)
+
+            # 检查文件是否生成
+            if Path(f"{output_base}.tif").exists():
+                sample_log.info("成功生成 .tif 文件：%s.tif", output_base)
             else:
-                logging.error(f"text2image 生成训练数据失败，错误信息：{result.stderr}")
-                time.sleep(2)
+                failure = failure_policy.Failure(failure_policy.TRANSIENT, "text2image 未生成 .tif 文件",
+                                                 f"没有找到生成的 .tif 文件：{output_base}.tif")
         else:
-            logging.error(f"多次尝试后，仍无法生成训练样本，样本编号：{i}")
+            failure = failure_policy.classify(result.returncode, result.stderr)
 
         # 删除临时文本文件
         try:
             Path(text_line_path).unlink()
-            logging.debug(f"已删除临时文本文件：{text_line_path}")
         except OSError as e:
             logging.error(f"删除临时文本文件失败：{text_line_path}，错误信息：{e}")
 
     except Exception as e:
-        logging.error(f"生成训练样本时发生异常，样本编号：{i}，错误信息：{e}")
+        failure = failure_policy.from_exception(e, f"生成训练样本时发生异常，样本编号：{i}，")
+    return failure
+
+def batch_page_args(ptsize):
+    """批量渲染的页面布局参数：页面高度只容纳一行文本，使每行各占一页"""
+    line_height = ptsize * RENDER_RESOLUTION / 72
+    page_height = int(2 * RENDER_BATCH_MARGIN + line_height * 1.8)  # 放得下一行，放不下两行
+    return [
+        '--xsize', str(RENDER_BATCH_PAGE_WIDTH),
+        '--ysize', str(page_height),
+        '--margin', str(RENDER_BATCH_MARGIN),
+    ]
 
-def generate_training_samples_in_parallel(invoice_texts, output_bases):
-    """并行生成多个训练样本"""
-    logging.info("开始并行生成训练样本...")
-    max_workers = min(cpu_count() * 2, 32)  # 根据实际情况调整
-    args_list = [(text, base, idx + 1, FONT_NAMES[0]) for idx, (text, base) in enumerate(zip(invoice_texts, output_bases))]
+def read_box_pages(box_path):
+    """读取 text2image 生成的 .box 文件，按页号分组返回 {page: [(char, left, bottom, right, top), ...]}"""
+    pages = {}
+    with open(box_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if not line:
+                continue
+            # 字符本身可能是空格，因此从右侧切分
+            char, left, bottom, right, top, page = line.rsplit(' ', 5)
+            pages.setdefault(int(page), []).append((char, left, bottom, right, top))
+    return pages
+
+def split_batch_output(batch_base, samples):
+    """把批量渲染得到的多页 TIFF 与 .box 拆分为逐行的 .tif/.box/.gt.txt
+
+    每页的字符必须与对应文本行一致（忽略空白），否则返回 False，由调用方退回逐行渲染。
+    """
+    box_pages = read_box_pages(f"{batch_base}.box")
+    if len(box_pages) != len(samples):
+        logging.warning(f"批量渲染页数 {len(box_pages)} 与文本行数 {len(samples)} 不一致：{batch_base}")
+        return False
+    for page, (invoice_text, *_) in enumerate(samples):
+        rendered = "".join(box[0] for box in box_pages.get(page, [])).split()
+        if "".join(rendered) != "".join(invoice_text.split()):
+            logging.warning(f"批量渲染第 {page} 页与文本行不一致：{batch_base}")
+            return False
+
+    with Image.open(f"{batch_base}.tif") as image:
+        for page, (invoice_text, output_base, *_) in enumerate(samples):
+            image.seek(page)
+            image.save(f"{output_base}.tif")
+            with open(f"{output_base}.box", 'w', encoding='utf-8') as f:
+                for char, left, bottom, right, top in box_pages[page]:
+                    f.write(f"{char} {left} {bottom} {right} {top} 0\n")
+            with open(f"{output_base}.gt.txt", 'w', encoding='utf-8') as f:
+                f.write(invoice_text)
+    return True
 
-    with ProcessPoolExecutor(max_workers=max_workers) as executor:
-        futures = [executor.submit(generate_single_training_sample, args) for args in args_list]
-        for future in as_completed(futures):
+def generate_training_sample_batch(args):
+    """批量生成训练样本：一次 text2image 调用渲染多行文本（每行一页），再拆分为逐行的训练样本
+
+    args 是 (samples, font_name)，samples 是 (invoice_text, output_base, i, options) 的列表，
+    同一批的渲染参数相同。拆分结果与文本不一致时，退回逐行调用 generate_single_training_sample。
+    text2image 失败时返回 failure_policy.Failure，由调度方决定是否重试整批。
+    """
+    samples, font_name = args
+    options = samples[0][3]
+    batch_base = Path(f"{samples[0][1]}_batch")
+    split_ok = False
+    failure = None
+    try:
+        if Image is None:
+            raise RuntimeError("未安装 Pillow，无法拆分多页 TIFF")
+        sample_log.info("批量渲染 %d 行文本 (编号: %s-%s)", len(samples), samples[0][2], samples[-1][2])
+
+        text_path = f"{batch_base}.txt"
+        with open(text_path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(text for text, *_ in samples))
+
+        command = text2image_command(font_name, batch_base, text_path, options, batch_page_args(options["ptsize"]))
+        if sample_log.isEnabledFor(logging.DEBUG):
+            sample_log.debug("执行命令：%s", ' '.join(command))
+        result = subprocess_scheduler.run(command)
+        if result.returncode == 0:
+            split_ok = split_batch_output(batch_base, samples)
+        else:
+            failure = failure_policy.classify(result.returncode, result.stderr)
+    except Exception as e:
+        logging.error(f"批量生成训练样本时发生异常：{batch_base}，错误信息：{e}")
+    finally:
+        # 删除批量渲染的中间文件
+        for suffix in ('.txt', '.tif', '.box'):
+            Path(f"{batch_base}{suffix}").unlink(missing_ok=True)
+
+    if failure is not None:
+        return failure
+    if not split_ok:
+        logging.warning(f"退回逐行渲染：{batch_base}")
+        for invoice_text, output_base, i, sample_options in samples:
+            line_failure = generate_single_training_sample((invoice_text, output_base, i, font_name, sample_options))
+            failure = failure or line_failure
+    return failure
+
+def render_training_samples_pillow(args):
+    """使用进程内 Pillow 渲染器生成一组训练样本，args 是 (samples, font_name)
+
+    samples 是 (invoice_text, output_base, i, options) 的列表。字体在每个工作进程中只解析、加载一次，
+    同一字体不同字号的字体对象也会被缓存。字体无法解析时返回确定性的 failure_policy.Failure；
+    个别行渲染出错时继续渲染其余行，返回第一个错误，由调度方重试整组。
+    """
+    samples, font_name = args
+    try:
+        font_file, font_index = pillow_renderer.resolve_font_file(font_name)
+    except Exception as e:
+        return failure_policy.Failure(failure_policy.DETERMINISTIC, f"无法解析字体文件：{font_name}",
+                                      f"无法解析字体文件：{font_name}，错误信息：{e}")
+    failure = None
+    for invoice_text, output_base, i, options in samples:
+        try:
+            with pipeline_metrics.span("render_line", "pillow", sample=i):
+                pillow_renderer.render_line(invoice_text, output_base, font_file, font_index,
+                                            resolution=RENDER_RESOLUTION, **options)
+            sample_log.debug("Pillow 渲染训练样本成功，文件：%s.tif", output_base)
+        except Exception as e:
+            sample_log.warning("Pillow 渲染训练样本时发生异常，样本编号：%s，错误信息：%s", i, e)
+            failure = failure or failure_policy.from_exception(e, f"Pillow 渲染训练样本时发生异常，样本编号：{i}，")
+    return failure
+
+def batched(iterable, size):
+    """把可迭代对象切分为长度不超过 size 的列表"""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+def render_combinations(fonts):
+    """展开渲染矩阵，返回 [((font_name, options), weight), ...]
+
+    fonts 是已解析的字体名，与 FONT_NAMES 一一对应，权重取自 FONT_WEIGHTS。
+    """
+    option_names = list(RENDER_MATRIX)
+    combinations = []
+    for font_config, font_name in zip(FONT_NAMES, fonts):
+        font_weight = FONT_WEIGHTS.get(font_config, 1)
+        for values in product(*(RENDER_MATRIX[name].items() for name in option_names)):
+            weight = font_weight
+            for _, value_weight in values:
+                weight *= value_weight
+            if weight > 0:
+                options = {name: value for name, (value, _) in zip(option_names, values)}
+                combinations.append(((font_name, options), weight))
+    return combinations
+
+def assign_render_options(numbered_samples, fonts):
+    """为每行文本分配一种渲染组合，产出 (invoice_text, output_base, i, font_name, options)
+
+    分配只取决于行号，因此断点续跑和渲染缓存在多次运行之间保持一致。
+    """
+    combinations = render_combinations(fonts)
+    choices = [combination for combination, _ in combinations]
+    weights = [weight for _, weight in combinations]
+    total = sum(weights)
+    current = [0] * len(weights)
+    for text, base, idx in numbered_samples:
+        if RENDER_SAMPLING == "weighted":
+            font_name, options = random.Random(f"{RENDER_SEED}:{idx}").choices(choices, weights)[0]
+        else:
+            # 平滑加权轮转：每个组合的累计份额加上自身权重，取最大者并扣除总权重
+            for j, weight in enumerate(weights):
+                current[j] += weight
+            j = max(range(len(current)), key=current.__getitem__)
+            current[j] -= total
+            font_name, options = choices[j]
+        yield text, base, idx, font_name, options
+
+def balanced_chunks(samples, chunk_size):
+    """把一组样本分成若干个不超过 chunk_size 行的任务，使各任务的文本总长尽量接近
+
+    按最长处理时间优先（LPT）：从长到短把每行放入当前总长最小且未满的任务。
+    """
+    chunk_count = -(-len(samples) // chunk_size)
+    heap = [(0, j) for j in range(chunk_count)]
+    chunks = [[] for _ in range(chunk_count)]
+    costs = [0] * chunk_count
+    for sample in sorted(samples, key=lambda sample: len(sample[0]), reverse=True):
+        cost, j = heapq.heappop(heap)
+        chunks[j].append(sample)
+        costs[j] = cost + len(sample[0])
+        if len(chunks[j]) < chunk_size:
+            heapq.heappush(heap, (costs[j], j))
+    # 先分发总长最大的任务，缩短最后一批任务的拖尾
+    order = sorted(range(chunk_count), key=costs.__getitem__, reverse=True)
+    return [chunks[j] for j in order]
+
+def schedule_render_tasks(samples, chunk_size, group_key):
+    """把样本流整理为渲染任务 (chunk, font_name)
+
+    每次读取 RENDER_SCHEDULE_WINDOW 行，按 group_key 分组（同一字体的行集中在同一批任务中，
+    使工作进程的字体缓存保持有效），组内再用 balanced_chunks 均衡长短行。
+    """
+    for window in batched(samples, max(RENDER_SCHEDULE_WINDOW, chunk_size)):
+        groups = {}
+        for text, base, idx, font_name, options in window:
+            key = group_key(font_name, options)
+            groups.setdefault(key, (font_name, []))[1].append((text, base, idx, options))
+        tasks = []
+        for font_name, group in groups.values():
+            tasks.extend((chunk, font_name) for chunk in balanced_chunks(group, chunk_size))
+        # 不同分组的任务也按总长从大到小分发
+        tasks.sort(key=lambda task: sum(len(sample[0]) for sample in task[0]), reverse=True)
+        yield from tasks
+
+def submit_bounded(executor, fn, args_iter, max_in_flight, retry_queue=None):
+    """按需从迭代器取任务提交，在途任务不超过 max_in_flight，按完成顺序产出 (args, future)
+
+    给出 retry_queue 时，调用方处理结果时可把任务放入重试队列，到期的重试任务优先于新任务提交；
+    退避等待发生在这里（调度线程），不占用工作槽位。生成器提前关闭时取消尚未开始的任务。
+    """
+    pending = {}
+    args_iter = iter(args_iter)
+    exhausted = False
+    try:
+        while True:
+            while len(pending) < max_in_flight:
+                args = retry_queue.pop_ready() if retry_queue is not None else None
+                if args is None:
+                    if exhausted:
+                        break
+                    args = next(args_iter, None)
+                    if args is None:
+                        exhausted = True
+                        continue
+                pending[executor.submit(fn, args)] = args
+            retry_wait = retry_queue.next_delay() if retry_queue is not None else None
+            if not pending:
+                if retry_wait is None:
+                    return
+                time.sleep(retry_wait)
+                continue
+            done, _ = wait(pending, timeout=retry_wait, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future
+    finally:
+        for future in pending:
+            future.cancel()
+
+def render_results(executor, worker, args_iter, max_in_flight):
+    """提交渲染任务，按完成顺序产出最终完成（成功或不再重试）的任务参数
+
+    工作函数返回 failure_policy.Failure 表示失败：暂时性失败按退避放回队列，最多执行 RETRY_MAX_ATTEMPTS 次；
+    确定性失败不重试，同一错误出现 CIRCUIT_BREAKER_THRESHOLD 次时抛出 failure_policy.CircuitOpen。
+    """
+    retry_queue = failure_policy.RetryQueue(RETRY_MAX_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY)
+    breaker = failure_policy.CircuitBreaker(CIRCUIT_BREAKER_THRESHOLD)
+    results = submit_bounded(executor, worker, args_iter, max_in_flight, retry_queue)
+    try:
+        for args, future in results:
+            try:
+                failure = future.result()
+            except Exception as exc:
+                logging.error(f"任务运行时出错: {exc}")
+                failure = None
+            if failure is not None:
+                if failure.kind == failure_policy.TRANSIENT:
+                    attempt = retry_queue.schedule(args)
+                    if attempt:
+                        pipeline_metrics.instant("retry", "render", attempt=attempt, error=failure.signature)
+                        sample_log.info("渲染失败（暂时性错误，第 %d 次重试）：%s", attempt, failure.signature)
+                        continue
+                    logging.error(f"渲染失败，已重试 {RETRY_MAX_ATTEMPTS - 1} 次：{failure.message}")
+                elif breaker.record(failure) == 1:
+                    # 同一确定性错误只完整记录第一次，之后只计数
+                    logging.error(f"渲染失败（确定性错误，不重试）：{failure.message}")
+            yield args
+    finally:
+        results.close()  # 断路或提前退出时取消尚未开始的任务
+
+@functools.lru_cache(maxsize=None)
+def render_tool_version():
+    """当前渲染引擎的版本，作为渲染缓存键的一部分"""
+    if RENDER_ENGINE == "pillow":
+        return pillow_renderer.version()
+    try:
+        result = subprocess.run(['text2image', '--version'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                text=True)
+        return result.stdout.strip().splitlines()[0] if result.stdout.strip() else "unknown"
+    except OSError:
+        return "unknown"
+
+@functools.lru_cache(maxsize=None)
+def tesseract_version():
+    """生成 .lstmf 的 tesseract 版本；缓存条目中也保存 .lstmf，因此作为渲染缓存键的一部分"""
+    try:
+        result = subprocess.run(['tesseract', '--version'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                text=True)
+        return result.stdout.strip().splitlines()[0] if result.stdout.strip() else "unknown"
+    except OSError:
+        return "unknown"
+
+def render_cache_context():
+    """缓存键中文本、字体与渲染组合之外的部分：渲染工具版本、页面几何（分辨率、单行或批量渲染的页面布局），
+    以及缓存中 .lstmf 所依赖的 tesseract 版本与基础模型"""
+    if RENDER_ENGINE == "pillow":
+        geometry = {"engine": "pillow", "resolution": RENDER_RESOLUTION, "margin": pillow_renderer.MARGIN}
+    elif RENDER_BATCH_SIZE > 1:
+        # 批量渲染时每行单独一页，输出只取决于页面布局，与每批的行数无关
+        geometry = {"engine": "text2image", "mode": "batch", "resolution": RENDER_RESOLUTION,
+                    "page_width": RENDER_BATCH_PAGE_WIDTH, "margin": RENDER_BATCH_MARGIN}
+    else:
+        geometry = {"engine": "text2image", "mode": "single"}  # text2image 默认的页面大小与分辨率
+    return [render_tool_version(), geometry, tesseract_version(),
+            file_signature(TESSDATA_PATH / "chi_sim.traineddata")]
+
+def open_render_cache():
+    """打开渲染缓存，未启用时返回 None"""
+    if not RENDER_CACHE_ENABLED:
+        return None
+    return render_cache.RenderCache(RENDER_CACHE_DIR, RENDER_CACHE_MAX_BYTES)
+
+def render_cache_font(font_name):
+    """缓存键中的字体：Pillow 引擎使用解析后的字体文件，text2image 使用字体名"""
+    if RENDER_ENGINE == "pillow":
+        return [font_name, *pillow_renderer.resolve_font_file(font_name)]
+    return font_name
+
+def sample_dir():
+    """样本渲染与转换的输出目录：启用分片存储时为本机暂存目录"""
+    return SHARD_SCRATCH_DIR if SHARD_STORE_ENABLED else TRAINING_DATA_DIR
+
+def open_shard_writer(prefix="shard"):
+    return shard_store.ShardWriter(SHARD_DIR, prefix, SHARD_MAX_BYTES)
+
+def pack_sample(writer, tif_file):
+    """把样本的各个文件写入分片，并删除暂存文件"""
+    base = tif_file.with_suffix('')
+    files = {suffix: Path(f"{base}{suffix}") for suffix in SHARD_SUFFIXES if Path(f"{base}{suffix}").exists()}
+    writer.add(base.name, files)
+    for path in files.values():
+        path.unlink()
+
+def open_subprocess_scheduler():
+    """按 CPU_BUDGET 与 CHILD_OMP_THREADS 创建子进程调度器"""
+    scheduler = subprocess_scheduler.SubprocessScheduler(CPU_BUDGET, CHILD_OMP_THREADS, PIN_CHILD_CORES)
+    logging.info(f"子进程并发数 {scheduler.max_workers}，每个子进程 {CHILD_OMP_THREADS} 个 OpenMP 线程"
+                 f"{'，绑定 CPU 核' if PIN_CHILD_CORES else ''}。")
+    return scheduler
+
+class LstmfStream:
+    """流水线模式中的 lstmf 转换：渲染完成的样本立即提交转换，转换成功后追加到训练列表
+
+    在途的转换任务不超过 max_in_flight，达到上限时阻塞调用方，调用方随之暂停提交新的渲染任务，形成背压。
+    给出 shard_writer 时，转换成功的样本改为打包写入分片，不写训练列表。
+    """
+
+    def __init__(self, executor, max_in_flight, list_path=None, shard_writer=None):
+        self.executor = executor
+        self.max_in_flight = max_in_flight
+        self.pending = {}
+        self.converted = 0
+        self.listed = 0
+        self.shard_writer = shard_writer
+        self.list_file = open(list_path, 'w', encoding='utf-8', buffering=1) if list_path else None
+
+    def add(self, output_base):
+        tif_file = Path(f"{output_base}.tif")
+        if not tif_file.exists():
+            return
+        if lstmf_up_to_date(tif_file):
+            self._append(tif_file)
+            return
+        self.pending[self.executor.submit(generate_single_lstmf, tif_file)] = tif_file
+        if len(self.pending) >= self.max_in_flight:
+            self._collect(FIRST_COMPLETED)
+
+    def _collect(self, return_when):
+        done, _ = wait(self.pending, return_when=return_when)
+        for future in done:
+            tif_file = self.pending.pop(future)
             try:
                 future.result()
             except Exception as exc:
                 logging.error(f"任务运行时出错: {exc}")
+            self.converted += 1
+            if lstmf_up_to_date(tif_file):
+                self._append(tif_file)
+
+    def _append(self, tif_file):
+        if self.shard_writer is not None:
+            pack_sample(self.shard_writer, tif_file)
+        else:
+            self.list_file.write(f"{tif_file.with_suffix('.lstmf').resolve()}\n")
+        self.listed += 1
+
+    def close(self):
+        if self.pending:
+            self._collect(ALL_COMPLETED)
+        if self.list_file is not None:
+            self.list_file.close()
+        logging.info(f"流水线转换 {self.converted} 个 .lstmf 文件，"
+                     f"{'打包' if self.shard_writer is not None else '训练列表共'} {self.listed} 个样本。")
+
+def task_samples(args):
+    """取出渲染任务包含的 (invoice_text, output_base, i, options) 列表"""
+    if isinstance(args[0], list):
+        return args[0]
+    invoice_text, output_base, i, _, options = args
+    return [(invoice_text, output_base, i, options)]
+
+def render_task_plan(pending):
+    """按渲染引擎与 RENDER_BATCH_SIZE 选择渲染函数，并把已分配渲染组合的样本流整理为任务，返回 (worker, args_iter)"""
+    if RENDER_ENGINE == "pillow":
+        # 进程内渲染：每个任务渲染同一字体的一组文本行，减少任务调度开销
+        worker = render_training_samples_pillow
+        args_iter = schedule_render_tasks(pending, max(RENDER_BATCH_SIZE, 1),
+                                          lambda font_name, options: font_name)
+    elif RENDER_BATCH_SIZE > 1:
+        # 批量渲染：每个任务用同一组参数渲染 RENDER_BATCH_SIZE 行，text2image 进程数相应减少
+        worker = generate_training_sample_batch
+        args_iter = schedule_render_tasks(pending, RENDER_BATCH_SIZE,
+                                          lambda font_name, options: (font_name, *options.values()))
+    else:
+        worker = generate_single_training_sample
+        args_iter = ((text, base, idx, font_name, options)
+                     for (((text, base, idx, options),), font_name)
+                     in schedule_render_tasks(pending, 1, lambda font_name, options: font_name))
+    return worker, args_iter
+
+def open_render_executor():
+    """创建渲染任务的执行器，返回 (executor, max_workers)"""
+    if RENDER_ENGINE == "pillow":
+        # Pillow 在进程内渲染，属于 CPU 密集型任务，每个核一个工作进程
+        executor = worker_pool(CPU_BUDGET)
+        max_workers = CPU_BUDGET
+    else:
+        # text2image 在子进程中渲染，由线程发起即可
+        executor = open_subprocess_scheduler()
+        max_workers = executor.max_workers
+    return executor, max_workers
+
+def generate_training_samples_in_parallel(samples, fonts, completion_log=None):
+    """并行生成多个训练样本，samples 是 (invoice_text, output_base) 的可迭代对象，按需惰性消费
+
+    fonts 是已由 resolve_fonts 校验过的字体名，每行文本按渲染矩阵分配字体与渲染参数。
+    启用渲染缓存时，命中的样本直接从缓存链接到训练数据目录，不再提交渲染。
+    completion_log 记录已完成的样本，其中内容未变且 .tif 仍存在的样本直接跳过。
+    PIPELINE_STREAMING 为 True 时，每个样本就绪后立即交给 LstmfStream 转换为 .lstmf。
+    """
+    logging.info("开始并行生成训练样本...")
+    cache = open_render_cache()
+    # 分片存储中已有的样本（渲染后的文件已打包，暂存目录中不再有 .tif）
+    packed = shard_store.ShardStore(SHARD_DIR) if SHARD_STORE_ENABLED else None
+    lstmf_stream = None
+    cache_keys = {}
+    cache_context = render_cache_context()
+    stats = {"hits": 0, "rendered": 0, "skipped": 0}
+    combination_counts = Counter()
+
+    with open(RENDER_CACHE_MAP, 'w', encoding='utf-8') as cache_map:
+        def uncached(numbered_samples):
+            if cache is None and completion_log is None:
+                for sample in numbered_samples:
+                    render_cache.unlink_outputs(sample[1])  # 只有本次确实写出 .tif 的样本才计为新渲染
+                    yield sample
+                return
+            for text, base, idx, font_name, options in numbered_samples:
+                key = render_cache.cache_key(text, render_cache_font(font_name), options, cache_context)
+                name = Path(base).name
+                if completion_log is not None and (name, key) in completion_log and \
+                        (name in packed if packed is not None else Path(f"{base}.tif").exists()):
+                    stats["skipped"] += 1
+                    cache_map.write(f"{name}\t{key}\n")
+                    if lstmf_stream is not None:
+                        lstmf_stream.add(base)
+                    continue
+                if cache is not None:
+                    if cache.fetch(key, base):
+                        stats["hits"] += 1
+                        cache_map.write(f"{name}\t{key}\n")
+                        if completion_log is not None:
+                            completion_log.mark(name, key)
+                        if lstmf_stream is not None:
+                            lstmf_stream.add(base)
+                        continue
+                render_cache.unlink_outputs(base)
+                cache_keys[str(base)] = key
+                yield text, base, idx, font_name, options
+
+        def counted(assigned):
+            for sample in assigned:
+                font_name, options = sample[3:]
+                combination_counts[(font_name, *options.values())] += 1
+                yield sample
+
+        numbered = ((text, base, idx) for idx, (text, base) in enumerate(samples, start=1))
+        pending = uncached(counted(assign_render_options(numbered, fonts)))
+        worker, args_iter = render_task_plan(pending)
+        executor, max_workers = open_render_executor()
+        with executor:
+            lstmf_executor = None
+            shard_writer = None
+            if PIPELINE_STREAMING or SHARD_STORE_ENABLED:
+                # text2image 与 tesseract 共用同一个子进程调度器，两个阶段合计不超过 CPU 预算
+                lstmf_executor = open_subprocess_scheduler() if RENDER_ENGINE == "pillow" else executor
+                if SHARD_STORE_ENABLED:
+                    shard_writer = open_shard_writer()
+                    lstmf_stream = LstmfStream(lstmf_executor, max_workers * 4, shard_writer=shard_writer)
+                else:
+                    lstmf_stream = LstmfStream(lstmf_executor, max_workers * 4,
+                                               TRAINING_DATA_DIR / "lstmf.training_list")
+            try:
+                for args in render_results(executor, worker, args_iter, max_workers * 4):
+                    for _, base, *_ in task_samples(args):
+                        key = cache_keys.pop(str(base), None)
+                        if not Path(f"{base}.tif").exists():
+                            continue
+                        stats["rendered"] += 1
+                        if key is not None:
+                            if completion_log is not None:
+                                completion_log.mark(Path(base).name, key)
+                            if cache is not None and cache.store(key, base):
+                                cache_map.write(f"{Path(base).name}\t{key}\n")
+                        if lstmf_stream is not None:
+                            lstmf_stream.add(base)
+            except failure_policy.CircuitOpen as exc:
+                logging.error(f"渲染阶段终止：{exc}。请检查字体与渲染参数配置。")
+                return False
+            finally:
+                if lstmf_stream is not None:
+                    lstmf_stream.close()
+                if shard_writer is not None:
+                    shard_writer.close()
+                if lstmf_executor is not None and lstmf_executor is not executor:
+                    lstmf_executor.shutdown()
+
+    logging.info(f"已完成样本跳过 {stats['skipped']} 个，渲染缓存命中 {stats['hits']} 个，"
+                 f"新渲染 {stats['rendered']} 个。")
+    for combination, count in sorted(combination_counts.items(), key=str):
+        logging.info(f"渲染组合 (字体, {', '.join(RENDER_MATRIX)}) = {combination}：{count} 行")
+    if lstmf_stream is not None and shard_writer is None:
+        cache_lstmf_outputs()
+    elif cache is not None:
+        cache.prune()
     logging.info("所有训练样本生成完成。")
+    return True
 
-def generate_training_samples_from_invoices():
+def cache_lstmf_outputs():
+    """把新生成的 .lstmf 文件补充到对应的渲染缓存条目中"""
+    cache = open_render_cache()
+    if cache is None or not RENDER_CACHE_MAP.exists():
+        return
+    added = 0
+    with open(RENDER_CACHE_MAP, 'r', encoding='utf-8') as cache_map:
+        for line in cache_map:
+            name, _, key = line.rstrip('\n').partition('\t')
+            if cache.add_file(key, TRAINING_DATA_DIR / name, '.lstmf'):
+                added += 1
+    logging.info(f"已将 {added} 个 .lstmf 文件加入渲染缓存。")
+    cache.prune()
+
+def iter_invoice_lines(path):
+    """以内存映射方式逐行读取发票文件，惰性地过滤并规范化有效的发票数据行
+
+    跳过空行和以 "=" 开头的分隔行，替换 '￥' 为 '¥' 并将文本转换为小写。
+    """
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for raw_line in iter(mm.readline, b""):
+                if raw_line.startswith(b"="):
+                    continue
+                line = raw_line.decode('utf-8').strip()
+                if line:
+                    yield line.replace('￥', '¥').lower()
+
+def select_invoice_lines(invoice_texts):
+    """去重后按字符与 bigram 覆盖选择训练行，记录覆盖统计，返回所选行的列表"""
+    baseline = []
+
+    def remember_baseline(lines):
+        # 按顺序取前 NUM_SAMPLES 行时会渲染的行，用于对比
+        for line in lines:
+            if len(baseline) < NUM_SAMPLES:
+                baseline.append(line)
+            yield line
+
+    pool, total = sample_selection.dedupe(remember_baseline(invoice_texts))
+    selected = [pool[index] for index in sample_selection.select(pool, SELECTION_CHAR_MIN_COUNT, NUM_SAMPLES)]
+    # 发票文本已转换为小写，字符表中的大写字母按小写计
+    unicharset = {char.lower() for char in sample_selection.load_unicharset(UNICHARSET_PATH)}
+    stats = sample_selection.report(pool, selected, baseline, SELECTION_CHAR_MIN_COUNT, unicharset)
+    stats["lines_read"] = total
+    with open(SELECTION_REPORT_PATH, 'w', encoding='utf-8') as f:
+        json.dump(stats, f, ensure_ascii=False, indent=2)
+
+    corpus, chosen = stats["corpus"], stats["selected"]
+    logging.info(f"样本选择：读入 {total} 行，去重后 {len(pool)} 行，选出 {len(selected)} 行；"
+                 f"字符 {chosen['chars']}/{corpus['chars']}（{chosen['chars_at_min_count']} 个达到 "
+                 f"{SELECTION_CHAR_MIN_COUNT} 次），bigram {chosen['bigrams']}/{corpus['bigrams']}。")
+    if baseline:
+        logging.info(f"按顺序取前 {len(baseline)} 行时：字符 {stats['baseline']['chars']} 个，"
+                     f"bigram {stats['baseline']['bigrams']} 个。")
+    if unicharset:
+        missing = stats["unicharset"]["missing_from_corpus"]
+        logging.info(f"字符表 {UNICHARSET_PATH} 共 {len(unicharset)} 个字符，所选行覆盖 "
+                     f"{chosen['unicharset_covered']} 个；语料中没有出现的：{''.join(missing) or '无'}")
+    logging.info(f"覆盖统计已写入 {SELECTION_REPORT_PATH}")
+    return selected
+
+def generate_training_samples_from_invoices(fonts, reset_progress=False):
+    """读取发票文件并按渲染矩阵生成训练样本；reset_progress 为 True 时忽略上次运行的逐样本完成记录"""
     logging.info(f"从文件 {INVOICE_FILE_PATH} 读取发票数据并生成训练样本...")
     try:
-        with open(INVOICE_FILE_PATH, 'r', encoding='utf-8') as file:
-            lines = file.readlines()
+        invoice_texts = iter_invoice_lines(INVOICE_FILE_PATH)
+        if SAMPLE_SELECTION == "coverage":
+            # 覆盖选择需要读完整个语料
+            invoice_texts = iter(select_invoice_lines(invoice_texts))
+        elif NUM_SAMPLES > 0:
+            # 应用样本数量限制，达到数量后立即停止读取
+            invoice_texts = islice(invoice_texts, NUM_SAMPLES)
+        first_text = next(invoice_texts, None)
     except FileNotFoundError:
         logging.error(f"发票文件未找到：{INVOICE_FILE_PATH}")
-        return
+        return False
 
-    # 过滤有效的发票数据行
-    # 替换 '￥' 为 '¥' 并将文本转换为小写
-    invoice_texts = [line.strip().replace('￥', '¥').lower() for line in lines if line.strip() and not line.startswith("=")]
+    if first_text is None:
+        logging.warning("没有找到有效的发票数据。")
+        return False
 
-    # 应用样本数量限制
-    if NUM_SAMPLES > 0:
-        invoice_texts = invoice_texts[:NUM_SAMPLES]
+    texts = chain([first_text], invoice_texts)
+    output_dir = sample_dir()
+    output_dir.mkdir(parents=True, exist_ok=True)
+    samples = ((text, output_dir / f"invoice_{idx}") for idx, text in enumerate(texts, start=1))
 
-    if not invoice_texts:
-        logging.warning("没有找到有效的发票数据。")
-        return
+    if WORK_QUEUE_DIR is not None:
+        return generate_training_samples_distributed(samples, fonts, reset_progress)
 
-    output_bases = [TRAINING_DATA_DIR / f"invoice_{idx}" for idx in range(1, len(invoice_texts) + 1)]
+    if SHARD_STORE_ENABLED:
+        store = shard_store.ShardStore(SHARD_DIR)
+        if reset_progress:
+            store.delete()
+        elif store.remove_incomplete():
+            logging.warning("已删除上次运行中途失败留下的未完成分片。")
 
     # 并行生成训练样本
-    generate_training_samples_in_parallel(invoice_texts, output_bases)
+    with CompletionLog(RENDER_DONE_PATH, reset=reset_progress) as completion_log:
+        return generate_training_samples_in_parallel(samples, fonts, completion_log)
+
+def open_work_queue():
+    return work_queue.WorkQueue(WORK_QUEUE_DIR, WORK_LEASE_SECONDS)
+
+def enqueue_work_units(queue, samples, fonts, stamp):
+    """按渲染矩阵分配渲染组合后，把样本切分为工作单元写入队列，返回单元数"""
+    numbered = ((text, Path(base).name, idx) for idx, (text, base) in enumerate(samples, start=1))
+    units = ([list(sample) for sample in chunk]
+             for chunk in batched(assign_render_options(numbered, fonts), WORK_UNIT_SIZE))
+    return queue.reset(stamp, units)
+
+def render_work_unit(samples, staging_dir, executor, lstmf_executor, max_workers):
+    """渲染一个工作单元的样本并转换为 .lstmf，输出写入 staging_dir"""
+    pending = ((text, staging_dir / name, idx, font_name, options) for text, name, idx, font_name, options in samples)
+    worker, args_iter = render_task_plan(pending)
+    for _ in render_results(executor, worker, args_iter, max_workers * 4):
+        pass
+    futures = [lstmf_executor.submit(generate_single_lstmf, tif_file) for tif_file in staging_dir.glob("*.tif")]
+    for future in as_completed(futures):
+        try:
+            future.result()
+        except Exception as exc:
+            logging.error(f"任务运行时出错: {exc}")
+
+def commit_work_unit(staging_dir, unit):
+    """把暂存目录中的输出逐个改名到训练数据目录，返回提交的 .lstmf 文件名
+
+    暂存目录位于训练数据目录之下，同一文件系统内的改名是原子的；.lstmf 最后提交，
+    训练数据目录中出现的 .lstmf 总有完整的 .tif 与 .gt.txt。
+    启用分片存储时，整个单元打包为一个分片，分片的索引写出后才算提交。
+    """
+    if SHARD_STORE_ENABLED:
+        packed = []
+        with open_shard_writer(prefix=unit) as writer:
+            for tif_file in sorted(staging_dir.glob("*.tif")):
+                if tif_file.with_suffix('.lstmf').exists():
+                    pack_sample(writer, tif_file)
+                    packed.append(f"{tif_file.stem}.lstmf")
+        return packed
+    files = sorted(staging_dir.iterdir(), key=lambda path: path.suffix == '.lstmf')
+    for path in files:
+        os.replace(path, TRAINING_DATA_DIR / path.name)
+    return [path.name for path in files if path.suffix == '.lstmf']
+
+def process_work_queue(queue):
+    """领取并处理工作单元，直到队列中的所有单元完成，返回本进程处理的单元数"""
+    staging_root = sample_dir() / ".staging"
+    processed = 0
+    executor, max_workers = open_render_executor()
+    lstmf_executor = open_subprocess_scheduler() if RENDER_ENGINE == "pillow" else executor
+    try:
+        while not queue.finished():
+            lease = queue.claim()
+            if lease is None:
+                # 其余单元正由其他节点处理（或队列尚未就绪），等待完成或租约过期
+                time.sleep(WORK_QUEUE_POLL_SECONDS)
+                continue
+            with lease:
+                unit = lease.load()
+                info = queue.info()
+                if unit is None or info is None or unit["stamp"] != info["stamp"]:
+                    logging.warning(f"工作单元 {lease.unit} 已不属于当前队列，跳过。")
+                    continue
+                if lease.reclaimed:
+                    logging.warning(f"回收了租约过期的工作单元 {lease.unit}")
+                staging_dir = staging_root / f"{lease.unit}-{socket.gethostname()}-{os.getpid()}"
+                shutil.rmtree(staging_dir, ignore_errors=True)
+                staging_dir.mkdir(parents=True)
+                with pipeline_metrics.span("work_unit", "task", unit=lease.unit, samples=len(unit["samples"])):
+                    render_work_unit(unit["samples"], staging_dir, executor, lstmf_executor, max_workers)
+                    # 提交前确认队列没有在处理期间被主节点重置
+                    info = queue.info()
+                    if info is None or unit["stamp"] != info["stamp"]:
+                        logging.warning(f"队列已被重置，丢弃工作单元 {lease.unit} 的输出。")
+                        shutil.rmtree(staging_dir, ignore_errors=True)
+                        continue
+                    lstmf_names = commit_work_unit(staging_dir, lease.unit)
+                shutil.rmtree(staging_dir, ignore_errors=True)
+                lease.commit({"samples": len(unit["samples"]), "lstmf": lstmf_names})
+                processed += 1
+                logging.info(f"工作单元 {lease.unit} 完成：{len(lstmf_names)}/{len(unit['samples'])} 个 .lstmf 文件")
+    finally:
+        executor.shutdown()
+        if lstmf_executor is not executor:
+            lstmf_executor.shutdown()
+    return processed
+
+def generate_training_samples_distributed(samples, fonts, reset_progress=False):
+    """主节点：把样本写入共享工作队列并参与处理，全部单元完成后合并训练列表
+
+    队列的指纹与生成阶段的输入一致时继续处理已有队列（已完成的单元不再重复）。
+    """
+    queue = open_work_queue()
+    stamp = fingerprint("work_queue", stage_inputs("generate", None), fonts)
+    info = queue.info()
+    if reset_progress or info is None or info["stamp"] != stamp:
+        if SHARD_STORE_ENABLED:
+            shard_store.ShardStore(SHARD_DIR).delete()  # 新队列的样本全部重新生成
+        count = enqueue_work_units(queue, samples, fonts, stamp)
+        logging.info(f"已向工作队列 {WORK_QUEUE_DIR} 写入 {count} 个工作单元，"
+                     f"其他节点可用 --worker 参与处理。")
+    else:
+        logging.info(f"继续处理已有的工作队列：{len(queue.done_units())}/{info['units']} 个单元已完成。")
+
+    try:
+        processed = process_work_queue(queue)
+    except failure_policy.CircuitOpen as exc:
+        logging.error(f"渲染阶段终止：{exc}。请检查字体与渲染参数配置。")
+        return False
+    # 全部单元完成后，剩下的暂存目录都属于中途失效的节点
+    shutil.rmtree(sample_dir() / ".staging", ignore_errors=True)
+    records = list(queue.results())
+    if SHARD_STORE_ENABLED:
+        lstmf_files = extract_from_shards([Path(name).stem for record in records for name in record["lstmf"]])
+    else:
+        lstmf_files = [TRAINING_DATA_DIR / name for record in records for name in record["lstmf"]]
+    hosts = Counter(record["host"] for record in records)
+    logging.info(f"所有工作单元完成，本机处理 {processed} 个，各节点：{dict(hosts)}；"
+                 f"共 {len(lstmf_files)} 个 .lstmf 文件。")
+
+    # 分布式模式下完成情况由队列记录，渲染完成记录只用于标记阶段输出
+    with CompletionLog(RENDER_DONE_PATH, reset=True) as completion_log:
+        for record in records:
+            for name in record["lstmf"]:
+                completion_log.mark(Path(name).stem, record["unit"])
+    trained, held_out = write_training_lists(lstmf_files)
+    logging.info(f"已合并训练列表：训练 {trained} 个，留作评估 {held_out} 个。")
+    return trained > 0
+
+def run_worker():
+    """工作节点：处理共享工作队列中的单元，直到全部完成"""
+    if WORK_QUEUE_DIR is None:
+        logging.error("未配置 WORK_QUEUE_DIR，无法以工作节点模式运行。")
+        return False
+    TRAINING_DATA_DIR.mkdir(parents=True, exist_ok=True)
+    logging.info(f"以工作节点模式运行，工作队列：{WORK_QUEUE_DIR}")
+    try:
+        processed = process_work_queue(open_work_queue())
+    except failure_policy.CircuitOpen as exc:
+        logging.error(f"工作节点终止：{exc}。请检查字体与渲染参数配置。")
+        return False
+    logging.info(f"工作队列已全部完成，本节点处理 {processed} 个工作单元。")
+    return True
 
 def find_best_checkpoint():
     """查找损失率最低的检查点文件"""
     logging.info("开始查找损失率最小的检查点文件...")
-    checkpoint_files = list(MODEL_DIR.glob('*.checkpoint'))
-    if not checkpoint_files:
-        logging.error("未找到任何检查点文件。")
-        return None
-
-    min_loss = float('inf')
-    best_checkpoint = None
-
-    # 使用正则表达式从文件名中提取损失率
-    def get_loss_from_filename(filename):
-        match = re.search(r'_([0-9.]+)_\d+_\d+\.checkpoint', filename.name)
-        if match:
-            return float(match.group(1))
-        return None
-
-    for checkpoint in checkpoint_files:
-        loss = get_loss_from_filename(checkpoint)
-        if loss is not None and loss < min_loss:
-            min_loss = loss
-            best_checkpoint = checkpoint
-
-    if best_checkpoint:
-        logging.info(f"找到最优检查点文件：{best_checkpoint} (损失率：{min_loss})")
-    else:
+    registry = CheckpointRegistry(CHECKPOINT_REGISTRY_PATH, MODEL_DIR, CHECKPOINT_KEEP_BEST)
+    best = registry.best()
+    if best and not Path(best["path"]).exists():
+        # 登记表与目录不一致（检查点被手动删除等），重新扫描一次
+        logging.warning(f"登记的检查点已不存在：{best['path']}，重新扫描模型目录。")
+        registry.rebuild()
+        registry.save()
+        best = registry.best()
+
+    if not best:
         logging.error("未找到任何有效的检查点文件。")
+        return None
 
-    return best_checkpoint
+    logging.info(f"找到最优检查点文件：{best['path']} (损失率：{best['loss']})")
+    return Path(best["path"])
 
 def generate_single_lstmf(tif_file):
     """单个 .tif 文件生成 .lstmf 文件的处理函数"""
@@ -279,44 +1228,160 @@ def generate_single_lstmf(tif_file):
             'lstm.train'
         ]
 
-        logging.debug(f"执行命令：{' '.join(command)}")
-        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        if sample_log.isEnabledFor(logging.DEBUG):
+            sample_log.debug("执行命令：%s", ' '.join(command))
+        result = subprocess_scheduler.run(command)
 
         if result.returncode != 0:
             logging.error(f"生成 .lstmf 文件失败，文件：{tif_file}，错误信息：{result.stderr}")
-            logging.debug(f"Tesseract 输出（stdout）：{result.stdout}")
-            logging.debug(f"Tesseract 输出（stderr）：{result.stderr}")
+            sample_log.debug("Tesseract 输出（stdout）：%s", result.stdout)
         else:
             # 检查文件是否实际生成
             if lstmf_file.exists():
-                logging.info(f"成功生成 .lstmf 文件：{lstmf_file}")
+                sample_log.info("成功生成 .lstmf 文件：%s", lstmf_file)
             else:
                 logging.error(f"命令返回成功，但未找到 .lstmf 文件：{lstmf_file}")
-                logging.debug(f"Tesseract 输出（stdout）：{result.stdout}")
-                logging.debug(f"Tesseract 输出（stderr）：{result.stderr}")
+                sample_log.debug("Tesseract 输出（stdout）：%s", result.stdout)
+                sample_log.debug("Tesseract 输出（stderr）：%s", result.stderr)
 
     except Exception as e:
         logging.error(f"生成 .lstmf 文件时发生异常，文件：{tif_file}，错误信息：{e}")
 
+def augment_samples(args):
+    """在工作进程中为一组样本生成增强变体，args 是 (tif 文件列表, 输出目录)，返回写出的变体数"""
+    tif_files, output_dir = args
+    written = 0
+    for tif_file in tif_files:
+        try:
+            written += augment.augment_sample(tif_file, output_dir, AUGMENT_VARIANTS, AUGMENT_SEED, AUGMENT_OPTIONS)
+        except Exception as e:
+            logging.error(f"增强样本时发生异常，文件：{tif_file}，错误信息：{e}")
+    return written
+
+def augment_training_samples():
+    """为训练样本（不含留出集）生成增强变体，变体写入样本目录，由 lstmf 阶段转换"""
+    output_dir = sample_dir()
+    # 先删除上次运行的变体，变体数或参数变化后不会残留旧的变体
+    for path in output_dir.glob("*_aug*.*"):
+        if augment.is_augmented(path.name.split('.', 1)[0]):
+            path.unlink(missing_ok=True)
+    if SHARD_STORE_ENABLED:
+        # 上次 lstmf 阶段打包的变体也要从分片中删除，否则 extract 阶段仍会把它们写入训练列表
+        store = shard_store.ShardStore(SHARD_DIR)
+        removed = store.remove([name for name in store.names() if augment.is_augmented(name)])
+        if removed:
+            logging.info(f"已从分片中删除上次运行的 {removed} 个增强变体。")
+    if not AUGMENT_ENABLED or AUGMENT_VARIANTS <= 0:
+        logging.info("未启用图像增强。")
+        with open(AUGMENT_REPORT_PATH, 'w', encoding='utf-8') as f:
+            json.dump({"variants": 0}, f)
+        return True
+    if not augment.available():
+        logging.error("图像增强需要 NumPy 与 Pillow，请安装后重试或关闭 AUGMENT_ENABLED。")
+        return False
+
+    source_dir = output_dir
+    if SHARD_STORE_ENABLED:
+        # 原样本已打包到分片，解出图片与真值到暂存目录；变体在 lstmf 阶段转换后同样打包
+        store = shard_store.ShardStore(SHARD_DIR)
+        names = [name for name in store.names_with('.tif') if not augment.is_augmented(name)]
+        source_dir = SHARD_SCRATCH_DIR / "augment_sources"
+        store.extract(names, ('.tif', '.gt.txt'), source_dir)
+    sources = [tif_file for tif_file in sorted(source_dir.glob("*.tif"))
+               if not augment.is_augmented(tif_file.stem)
+               and not evaluation.is_held_out(tif_file.stem, EVAL_HOLDOUT_FRACTION)]
+    logging.info(f"开始为 {len(sources)} 个样本各生成 {AUGMENT_VARIANTS} 个增强变体...")
+
+    written = 0
+    try:
+        with worker_pool(CPU_BUDGET) as executor:
+            futures = [executor.submit(augment_samples, (chunk, output_dir))
+                       for chunk in batched(sources, AUGMENT_BATCH_SIZE)]
+            for future in as_completed(futures):
+                try:
+                    written += future.result()
+                except Exception as exc:
+                    logging.error(f"任务运行时出错: {exc}")
+    finally:
+        if source_dir != output_dir:
+            shutil.rmtree(source_dir, ignore_errors=True)
+
+    with open(AUGMENT_REPORT_PATH, 'w', encoding='utf-8') as f:
+        json.dump({"variants": AUGMENT_VARIANTS, "sources": len(sources), "written": written,
+                   "options": {**augment.DEFAULT_OPTIONS, **AUGMENT_OPTIONS}}, f, ensure_ascii=False, indent=2)
+    logging.info(f"增强完成：写出 {written} 个变体。")
+    return written > 0 or not sources
+
+def lstmf_up_to_date(tif_file):
+    """判断 .tif 对应的 .lstmf 是否存在且不早于 .tif"""
+    lstmf_file = tif_file.with_suffix('.lstmf')
+    try:
+        return lstmf_file.stat().st_mtime >= tif_file.stat().st_mtime
+    except FileNotFoundError:
+        return False
+
 def generate_lstmf_files():
     """使用 Tesseract 生成 .lstmf 文件，使用多进程加速"""
     logging.info("开始生成 .lstmf 文件...")
-    tif_files = list(TRAINING_DATA_DIR.glob("*.tif"))
-    logging.info(f"找到 {len(tif_files)} 个 .tif 文件需要转换为 .lstmf 文件。")
-
-    if not tif_files:
+    all_tif_files = list(sample_dir().glob("*.tif"))
+    if not all_tif_files:
+        if SHARD_STORE_ENABLED and len(shard_store.ShardStore(SHARD_DIR)):
+            # 分片存储模式下样本在生成阶段已转换并打包，暂存目录中只剩转换失败的样本
+            logging.info("所有样本已在生成阶段转换为 .lstmf 并打包到分片。")
+            return True
         logging.warning("未找到任何 .tif 文件，请检查生成步骤。")
-        return
+        return False
 
-    max_workers = min(cpu_count() * 2, 32)  # 根据实际情况调整
-    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+    # 跳过 .lstmf 已是最新的样本（例如从渲染缓存链接而来的样本）
+    tif_files = [tif_file for tif_file in all_tif_files if not lstmf_up_to_date(tif_file)]
+    logging.info(f"找到 {len(all_tif_files)} 个 .tif 文件，其中 {len(tif_files)} 个需要转换为 .lstmf 文件。")
+
+    with open_subprocess_scheduler() as executor:
         futures = [executor.submit(generate_single_lstmf, tif_file) for tif_file in tif_files]
         for future in as_completed(futures):
             try:
                 future.result()
             except Exception as exc:
                 logging.error(f"任务运行时出错: {exc}")
+    if SHARD_STORE_ENABLED:
+        with open_shard_writer() as writer:
+            for tif_file in all_tif_files:
+                if lstmf_up_to_date(tif_file):
+                    pack_sample(writer, tif_file)
+    else:
+        cache_lstmf_outputs()
     logging.info("所有 .lstmf 文件生成完成。")
+    return True
+
+def extract_from_shards(names=None):
+    """从分片中解出训练所需的 .lstmf，以及评估集样本的 .tif 与 .gt.txt，返回解出的 .lstmf 路径
+
+    names 为 None 时解出分片中的全部样本。
+    """
+    store = shard_store.ShardStore(SHARD_DIR)
+    if names is None:
+        names = store.names_with('.lstmf')
+    held_out = [name for name in names if evaluation.is_held_out(augment.source_name(name), EVAL_HOLDOUT_FRACTION)]
+    extracted = store.extract(names, ('.lstmf',), SHARD_EXTRACT_DIR)
+    store.extract(held_out, ('.tif', '.gt.txt'), SHARD_EXTRACT_DIR)
+    logging.info(f"从分片中解出 {len(extracted)} 个 .lstmf 文件，以及 {len(held_out)} 个评估样本的图片与真值。")
+    return [files['.lstmf'] for files in extracted.values()]
+
+def write_training_lists(lstmf_files):
+    """把 .lstmf 文件按留出集划分写入训练列表与评估列表（绝对路径），返回 (训练样本数, 评估样本数)"""
+    trained = held_out = 0
+    with open(TRAINING_DATA_DIR / "lstmf.training_list", 'w', encoding='utf-8') as f, \
+            open(EVAL_LIST_PATH, 'w', encoding='utf-8') as eval_list:
+        for lstmf_file in lstmf_files:
+            absolute_path = Path(lstmf_file).resolve()
+            # 留出集样本只写入评估列表；增强变体按原样本划分
+            if evaluation.is_held_out(augment.source_name(absolute_path.stem), EVAL_HOLDOUT_FRACTION):
+                eval_list.write(f"{absolute_path}\n")
+                held_out += 1
+            else:
+                f.write(f"{absolute_path}\n")
+                trained += 1
+    return trained, held_out
 
 def generate_lstmf_training_list():
     """生成 lstmf.training_list 文件，使用绝对路径"""
@@ -324,29 +1389,38 @@ def generate_lstmf_training_list():
     training_list_path = TRAINING_DATA_DIR / "lstmf.training_list"
 
     try:
-        lstmf_files = list(TRAINING_DATA_DIR.glob("*.lstmf"))
+        if SHARD_STORE_ENABLED:
+            lstmf_files = extract_from_shards()
+        else:
+            lstmf_files = list(TRAINING_DATA_DIR.glob("*.lstmf"))
         logging.info(f"找到 {len(lstmf_files)} 个 .lstmf 文件")
 
         if not lstmf_files:
             logging.warning("未找到任何 .lstmf 文件，请检查生成步骤。")
 
-        with open(training_list_path, 'w', encoding='utf-8') as f:
-            for lstmf_file in lstmf_files:
-                absolute_path = lstmf_file.resolve()
-                f.write(f"{absolute_path}\n")
-
-        logging.info(f"成功生成 lstmf.training_list 文件：{training_list_path}")
+        trained, held_out = write_training_lists(lstmf_files)
+        logging.info(f"成功生成 lstmf.training_list 文件：{training_list_path}（训练 {trained} 个，"
+                     f"留作评估 {held_out} 个：{EVAL_LIST_PATH}）")
+        return trained > 0
     except Exception as e:
         logging.error(f"生成 lstmf.training_list 文件失败，错误信息：{e}")
+        return False
 
-def extract_lstm_from_traineddata(retries=3):
-    """从预训练的 traineddata 文件中提取 lstm 文件，并添加重试机制"""
+def extract_lstm_from_traineddata(retries=RETRY_MAX_ATTEMPTS):
+    """从预训练的 traineddata 文件中提取 lstm 文件；暂时性错误按退避重试，确定性错误立即失败"""
     logging.info("开始提取 LSTM 文件...")
     base_model = TESSDATA_PATH / "chi_sim.traineddata"
     output_lstm = MODEL_DIR / "chi_sim.lstm"
     if not base_model.exists():
         logging.error(f"基础模型文件未找到：{base_model}")
-        return
+        return False
+
+    # 基础模型没有变化时直接复用上次提取的 .lstm
+    source_stamp = output_lstm.with_name(output_lstm.name + '.source')
+    signature = json.dumps(file_signature(base_model))
+    if output_lstm.exists() and source_stamp.exists() and source_stamp.read_text(encoding='utf-8') == signature:
+        logging.info(f"基础模型未变化，复用已提取的 LSTM 文件：{output_lstm}")
+        return True
 
     command = [
         'combine_tessdata', '-e', str(base_model), str(output_lstm)
@@ -354,17 +1428,25 @@ def extract_lstm_from_traineddata(retries=3):
 
     for attempt in range(1, retries + 1):
         logging.debug(f"执行命令：{' '.join(command)} (尝试 {attempt}/{retries})")
-        try:
-            result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
+        with pipeline_metrics.span("combine_tessdata", "subprocess", attempt=attempt):
+            result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        if result.returncode == 0:
+            source_stamp.write_text(signature, encoding='utf-8')
             logging.info(f"成功提取 LSTM 文件：{output_lstm}")
-            return
-        except subprocess.CalledProcessError as e:
-            logging.error(f"提取 LSTM 文件失败，错误信息：{e.stderr}")
-            if attempt < retries:
-                logging.info("等待 5 秒后重试...")
-                time.sleep(5)
-            else:
-                logging.error("达到最大重试次数，提取 LSTM 文件失败。")
+            return True
+        failure = failure_policy.classify(result.returncode, result.stderr)
+        logging.error(f"提取 LSTM 文件失败，错误信息：{failure.message}")
+        if failure.kind == failure_policy.DETERMINISTIC:
+            logging.error("该错误重试后结果不会改变，不再重试。")
+            return False
+        if attempt < retries:
+            delay = failure_policy.backoff_delay(attempt, RETRY_BASE_DELAY, RETRY_MAX_DELAY)
+            pipeline_metrics.instant("retry", "combine_tessdata", attempt=attempt)
+            logging.info(f"等待 {delay:.1f} 秒后重试...")
+            time.sleep(delay)
+        else:
+            logging.error("达到最大重试次数，提取 LSTM 文件失败。")
+    return False
 
 def package_traineddata():
     """打包 .traineddata 文件"""
@@ -373,7 +1455,7 @@ def package_traineddata():
 
     if not best_checkpoint:
         logging.error("无法打包 .traineddata 文件，因为未找到最佳检查点。")
-        return
+        return False
 
     final_traineddata_path = OUTPUT_DIR / "my_model.traineddata"
     package_cmd = [
@@ -387,65 +1469,481 @@ def package_traineddata():
     logging.debug(f"执行命令：{' '.join(package_cmd)}")
 
     try:
-        result = subprocess.run(package_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
+        with pipeline_metrics.span("lstmtraining_stop", "subprocess"):
+            result = subprocess.run(package_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                                    check=True)
         logging.info(f"成功生成 .traineddata 文件：{final_traineddata_path}")
+        return True
     except subprocess.CalledProcessError as e:
         logging.error(f"生成 .traineddata 文件失败，错误信息：{e.stderr}")
+        return False
+
+def lstmtraining_command(model_output_prefix, options=None, continue_from=None, train_listfile=None):
+    """lstmtraining 的训练命令；options 的每一项转换为 --键 值，可覆盖 max_iterations 或追加 learning_rate 等参数
+
+    默认从 chi_sim.lstm 开始、使用完整的训练列表。
+    """
+    command = [
+        'lstmtraining',
+        '--model_output', str(model_output_prefix),
+        '--continue_from', str(continue_from or MODEL_DIR / 'chi_sim.lstm'),
+        '--traineddata', str(TESSDATA_PATH / 'chi_sim.traineddata'),  # 仅使用简体中文数据
+        '--train_listfile', str(train_listfile or TRAINING_DATA_DIR / 'lstmf.training_list'),
+    ]
+    for key, value in {"max_iterations": MAX_ITERATIONS, **(options or {})}.items():
+        command += [f'--{key}', str(value)]
+    return command
+
+def run_lstmtraining(command, model_output_prefix, recorder, registry, env=None, run_name=None):
+    """运行 lstmtraining，逐行记录进度并登记检查点，启用提前停止时在 BCER 停滞后结束进程
+
+    输出写入模型目录下的 lstmtraining_output.log；在子进程调度器的工作线程中调用时使用该槽位的线程数与 CPU 核。
+    run_name 用于区分并发运行的多组训练（日志前缀与计时记录）。返回 (返回码, 提前停止原因)。
+    """
+    label = f"[{run_name}] " if run_name else ""
+    stopper = training_progress.PlateauStopper(EARLY_STOP_WINDOW, EARLY_STOP_MIN_DELTA, EARLY_STOP_MIN_ITERATIONS) \
+        if EARLY_STOP_ENABLED else None
+    stop_reason = None
+    log_path = Path(model_output_prefix).parent / "lstmtraining_output.log"
+    with open(log_path, "w", encoding='utf-8') as logfile, \
+            pipeline_metrics.span("lstmtraining", "subprocess", **({"run": run_name} if run_name else {})) as metrics:
+        process = subprocess_scheduler.popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+                                             **({"env": env} if env is not None else {}))
+
+        # 实时读取子进程的输出写入 lstmtraining_output.log；只有 DEBUG 级别时才转发到日志队列
+        forward = logging.getLogger().isEnabledFor(logging.DEBUG)
+        for line in iter(process.stdout.readline, ''):
+            # 将输出转换为小写并写入日志
+            processed_line = line.lower()
+            logfile.write(processed_line)
+            if forward:
+                logging.debug(processed_line.strip())
+
+            record = recorder.feed(line)
+            if record is None:
+                continue
+            logging.info(f"{label}迭代 {record['iteration']}：BCER {record['bcer']:.3f}%，"
+                         f"BWER {record['bwer']:.3f}%，最优 BCER {record['best_bcer']:.3f}%")
+            if "wrote checkpoint" in line:
+                registry.record_latest(f"{model_output_prefix}_checkpoint", record["iteration"],
+                                       record["training_iteration"])
+            if record["checkpoint"]:
+                for entry in registry.record_best(record["checkpoint"], record["iteration"], record["bcer"],
+                                                  record["training_iteration"]):
+                    logging.debug(f"删除检查点：{entry['path']}（损失率：{entry['loss']}）")
+            # 进度行在检查点写出之后才输出，此时结束进程不会留下写了一半的检查点
+            if stopper is not None and stop_reason is None and stopper.update(record):
+                stop_reason = (f"BCER 在 {record['iteration'] - stopper.best_iteration} 次迭代内没有改善"
+                               f"（最优 {stopper.best_bcer:.3f}% @ {stopper.best_iteration}）")
+                logging.info(f"{label}提前停止训练：{stop_reason}")
+                process.terminate()
+
+        process.stdout.close()
+        return_code = process.wait()
+        metrics["returncode"] = return_code
+        metrics["iterations"] = recorder.records[-1]["iteration"] if recorder.records else 0
+        metrics["early_stopped"] = stop_reason is not None
+    return return_code, stop_reason
+
+def sample_digest(path):
+    """.lstmf 文件内容的摘要；样本名会随语料变化而对应不同的文本，按内容判断样本是否训练过"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def read_training_list(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+def load_trained_samples():
+    """上次训练记录的样本 {摘要: 路径}，没有记录时返回 None"""
+    try:
+        with open(TRAINED_SAMPLES_PATH, 'r', encoding='utf-8') as f:
+            return dict(line.rstrip('\n').split('\t', 1) for line in f if '\t' in line)
+    except FileNotFoundError:
+        return None
+
+def record_trained_samples(digests, previous=None):
+    """记录当前模型训练过的样本；增量训练时与之前的记录合并"""
+    samples = {**(previous or {}), **digests}
+    tmp_path = TRAINED_SAMPLES_PATH.with_name(TRAINED_SAMPLES_PATH.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.writelines(f"{digest}\t{path}\n" for digest, path in samples.items())
+    os.replace(tmp_path, TRAINED_SAMPLES_PATH)
+    logging.info(f"已记录模型训练过的样本 {len(samples)} 个：{TRAINED_SAMPLES_PATH}")
+
+def incremental_start_point(registry):
+    """增量训练的起点，返回 (模型文件, 起点的训练迭代次数)；没有可继续的模型时返回 (None, 0)
+
+    优先使用登记表中的最优检查点；lstmtraining 恢复该检查点后按其训练迭代次数与 --max_iterations 比较，
+    因此起点取训练迭代次数而不是学习迭代次数。没有检查点时从 my_model.traineddata 中提取 .lstm。
+    """
+    best = registry.best()
+    if best and Path(best["path"]).exists():
+        return Path(best["path"]), checkpoint_registry.training_iteration(best)
+    final_model = OUTPUT_DIR / "my_model.traineddata"
+    if final_model.exists():
+        start = INCREMENTAL_DIR / "my_model_previous.lstm"
+        result = subprocess_scheduler.run(['combine_tessdata', '-e', str(final_model), str(start)])
+        if result.returncode == 0 and start.exists():
+            return start, 0
+        logging.error(f"从 {final_model} 提取 .lstm 失败，错误信息：{result.stderr}")
+    return None, 0
+
+def promote_incremental_checkpoints(registry, incremental_registry):
+    """增量训练打包成功后，用本次的检查点替换登记表中的旧检查点
+
+    旧检查点的损失是在旧训练集上得到的，与本次不可比较，全部删除；本次的检查点移入 MODEL_DIR 并写入登记表，
+    之后的打包、评估与下一次增量训练都从这些检查点开始。
+    """
+    for entry in registry.best_entries:
+        Path(entry["path"]).unlink(missing_ok=True)
+    promoted = []
+    for entry in incremental_registry.best_entries:
+        target = MODEL_DIR / Path(entry["path"]).name
+        os.replace(entry["path"], target)
+        promoted.append({**entry, "path": str(target)})
+    registry.best_entries = promoted
+    registry.save()
+    shutil.rmtree(INCREMENTAL_DIR, ignore_errors=True)
+
+def write_incremental_list(training_list, trained):
+    """新增样本加上按 INCREMENTAL_REPLAY_FRACTION 抽取的旧样本写入增量列表，返回 (新样本数, 旧样本数, 各样本摘要)"""
+    digests = {path: sample_digest(path) for path in training_list}
+    new = [path for path, digest in digests.items() if digest not in trained]
+    old = [path for path, digest in digests.items() if digest in trained]
+    fraction = min(max(INCREMENTAL_REPLAY_FRACTION, 0.0), 0.95)
+    replay_count = min(len(old), round(len(new) * fraction / (1 - fraction)))
+    rng = random.Random(INCREMENTAL_SEED)
+    samples = new + rng.sample(old, replay_count)
+    rng.shuffle(samples)
+    with open(INCREMENTAL_LIST_PATH, 'w', encoding='utf-8') as f:
+        f.writelines(f"{path}\n" for path in samples)
+    return len(new), replay_count, digests
+
+def train_lstm_incremental():
+    """增量微调：从上次的模型继续，只训练新增样本与部分旧样本；返回 None 表示需要退回完整训练"""
+    trained = load_trained_samples()
+    if trained is None:
+        logging.info(f"没有上次训练的样本记录（{TRAINED_SAMPLES_PATH}），进行完整训练。")
+        return None
+    registry = CheckpointRegistry(CHECKPOINT_REGISTRY_PATH, MODEL_DIR, CHECKPOINT_KEEP_BEST)
+    training_list = read_training_list(TRAINING_DATA_DIR / 'lstmf.training_list')
+    new_count, replay_count, digests = write_incremental_list(training_list, trained)
+    if new_count == 0:
+        logging.info("训练列表中没有新增样本，保留当前模型。")
+        return True
+
+    # 每次在空目录中以新的前缀训练：目录中没有 <前缀>_checkpoint，lstmtraining 一定从 --continue_from 开始，
+    # 起点的迭代次数即为实际载入的检查点的迭代次数。旧检查点与登记表在打包成功之前保持不变
+    shutil.rmtree(INCREMENTAL_DIR, ignore_errors=True)
+    INCREMENTAL_DIR.mkdir(parents=True)
+    start, start_iteration = incremental_start_point(registry)
+    if start is None:
+        logging.info("没有可继续训练的检查点或 my_model.traineddata，进行完整训练。")
+        return None
+    logging.info(f"增量训练：从 {start}（训练迭代 {start_iteration}）继续，新增样本 {new_count} 个，"
+                 f"混入旧样本 {replay_count} 个，训练 {INCREMENTAL_ITERATIONS} 次迭代。")
+
+    incremental_registry = CheckpointRegistry(INCREMENTAL_DIR / "checkpoints.json", INCREMENTAL_DIR,
+                                              CHECKPOINT_KEEP_BEST)
+    model_output_prefix = INCREMENTAL_DIR / 'my_model'
+    command = lstmtraining_command(model_output_prefix, {"max_iterations": start_iteration + INCREMENTAL_ITERATIONS},
+                                   continue_from=start, train_listfile=INCREMENTAL_LIST_PATH)
+    logging.debug(f"执行命令：{' '.join(command)}")
+    recorder = training_progress.ProgressRecorder(TRAINING_PROGRESS_CSV, TRAINING_PROGRESS_JSON)
+    stop_reason = None
+    try:
+        return_code, stop_reason = run_lstmtraining(command, model_output_prefix, recorder, incremental_registry,
+                                                    env=subprocess_scheduler.child_env(CPU_BUDGET))
+        if return_code != 0 and stop_reason is None:
+            logging.error(f"增量训练过程中出现错误，返回码：{return_code}")
+            logging.error(f"查看详细错误信息：{INCREMENTAL_DIR / 'lstmtraining_output.log'}")
+            return False
+    except Exception as e:
+        logging.error(f"运行 lstmtraining 时发生异常：{e}")
+        return False
+    finally:
+        summary = recorder.close(stop_reason)
+        logging.info(f"训练进度：{TRAINING_PROGRESS_CSV}（{summary['records']} 条记录，最优 BCER {summary['best_bcer']}）")
+
+    best = incremental_registry.best()
+    if best is None:
+        logging.error("增量训练没有写出检查点，保留当前模型。")
+        return False
+    # 先打包到临时文件，成功后再替换 my_model.traineddata 并用本次的检查点替换旧检查点
+    final_traineddata_path = OUTPUT_DIR / "my_model.traineddata"
+    tmp_traineddata_path = OUTPUT_DIR / "my_model_incremental.traineddata"
+    if not package_checkpoint(best["path"], tmp_traineddata_path):
+        return False
+    os.replace(tmp_traineddata_path, final_traineddata_path)
+    logging.info(f"成功生成 .traineddata 文件：{final_traineddata_path}")
+    promote_incremental_checkpoints(registry, incremental_registry)
+    record_trained_samples({digest: path for path, digest in digests.items()}, trained)
+    return True
 
 def train_lstm():
     """使用 lstmtraining 进行训练，并实时显示输出"""
+    if INCREMENTAL_ENABLED:
+        result = train_lstm_incremental()
+        if result is not None:
+            return result
     logging.info("开始进行 LSTM 模型训练...")
     lstm_model_path = MODEL_DIR / 'chi_sim.lstm'
 
     # 检查 .lstm 文件是否存在
     if not lstm_model_path.exists():
         logging.error(f"LSTM 模型文件未找到：{lstm_model_path}。请确保已成功提取 .lstm 文件。")
-        return
+        return False
 
     # 训练过程，生成检查点文件
     model_output_prefix = MODEL_DIR / 'my_model'
-    init_cmd = [
-        'lstmtraining',
-        '--model_output', str(model_output_prefix),
-        '--continue_from', str(lstm_model_path),
-        '--traineddata', str(TESSDATA_PATH / 'chi_sim.traineddata'),  # 仅使用简体中文数据
-        '--train_listfile', str(TRAINING_DATA_DIR / 'lstmf.training_list'),
-        '--max_iterations', '4000'
-    ]
-
+    init_cmd = lstmtraining_command(model_output_prefix)
     logging.debug(f"执行命令：{' '.join(init_cmd)}")
 
+    recorder = training_progress.ProgressRecorder(TRAINING_PROGRESS_CSV, TRAINING_PROGRESS_JSON)
+    registry = CheckpointRegistry(CHECKPOINT_REGISTRY_PATH, MODEL_DIR, CHECKPOINT_KEEP_BEST)
+    removed = registry.prune()
+    registry.save()
+    if removed:
+        logging.info(f"清理了 {len(removed)} 个旧检查点，释放 {sum(e['size'] or 0 for e in removed) / 1e6:.1f} MB")
+    stop_reason = None
     try:
-        # 使用 Popen 启动子进程，并将输出写入日志文件
-        with open(MODEL_DIR / "lstmtraining_output.log", "w", encoding='utf-8') as logfile:
-            process = subprocess.Popen(init_cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-
-            # 实时读取子进程的输出并打印
-            for line in iter(process.stdout.readline, ''):
-                # 将输出转换为小写并写入日志
-                processed_line = line.lower()
-                logfile.write(processed_line)
-                logging.debug(processed_line.strip())
-
-            process.stdout.close()
-            return_code = process.wait()
-            if return_code != 0:
-                logging.error(f"LSTM 训练过程中出现错误，返回码：{return_code}")
-                logging.error(f"查看详细错误信息：{MODEL_DIR / 'lstmtraining_output.log'}")
-                return
-            else:
-                logging.info("LSTM 训练完成。")
+        # lstmtraining 独占整个 CPU 预算
+        return_code, stop_reason = run_lstmtraining(init_cmd, model_output_prefix, recorder, registry,
+                                                    env=subprocess_scheduler.child_env(CPU_BUDGET))
+        # 提前停止时进程被终止，返回码非 0 属于预期
+        if return_code != 0 and stop_reason is None:
+            logging.error(f"LSTM 训练过程中出现错误，返回码：{return_code}")
+            logging.error(f"查看详细错误信息：{MODEL_DIR / 'lstmtraining_output.log'}")
+            return False
+        else:
+            logging.info("LSTM 训练完成。")
     except Exception as e:
         logging.error(f"运行 lstmtraining 时发生异常：{e}")
-        return
+        return False
+    finally:
+        summary = recorder.close(stop_reason)
+        logging.info(f"训练进度：{TRAINING_PROGRESS_CSV}（{summary['records']} 条记录，最优 BCER {summary['best_bcer']}）")
 
     # 训练完成后，开始打包 traineddata 文件
     logging.info("开始打包 .traineddata 文件...")
-    package_traineddata()
+    if not package_traineddata():
+        return False
+    # 记录本次训练使用的样本，之后的增量训练据此找出新增样本
+    training_list = read_training_list(TRAINING_DATA_DIR / 'lstmf.training_list')
+    record_trained_samples({sample_digest(path): path for path in training_list})
+    return True
+
+def load_eval_samples():
+    """读取评估列表，返回 (图片路径, 真值文本) 列表"""
+    samples = []
+    try:
+        with open(EVAL_LIST_PATH, 'r', encoding='utf-8') as f:
+            lstmf_files = [Path(line.strip()) for line in f if line.strip()]
+    except FileNotFoundError:
+        return samples
+    for lstmf_file in lstmf_files:
+        tif_file, gt_file = lstmf_file.with_suffix('.tif'), lstmf_file.with_suffix('.gt.txt')
+        if tif_file.exists() and gt_file.exists():
+            samples.append((str(tif_file), gt_file.read_text(encoding='utf-8').strip()))
+        else:
+            logging.warning(f"评估样本缺少 .tif 或 .gt.txt 文件：{lstmf_file}")
+    return samples
+
+def package_checkpoint(checkpoint, output_path):
+    """把检查点打包为 traineddata，供 tesseract 直接加载"""
+    command = [
+        'lstmtraining',
+        '--stop_training',
+        '--continue_from', str(checkpoint),
+        '--traineddata', str(TESSDATA_PATH / 'chi_sim.traineddata'),
+        '--model_output', str(output_path)
+    ]
+    result = subprocess_scheduler.run(command)
+    if result.returncode != 0:
+        logging.error(f"打包检查点 {checkpoint} 失败，错误信息：{result.stderr}")
+        return False
+    return True
+
+def evaluate_models():
+    """在留出集上并行评估保留的检查点，选出 CER 最低的一个打包为最终模型"""
+    logging.info("开始在留出集上评估候选模型...")
+    samples = load_eval_samples()
+    report = {"samples": len(samples), "selected": None, "models": {}}
+    if not samples:
+        logging.warning("评估集为空（EVAL_HOLDOUT_FRACTION 为 0 或样本过少），跳过评估。")
+        with open(EVAL_REPORT_PATH, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        return True
+
+    registry = CheckpointRegistry(CHECKPOINT_REGISTRY_PATH, MODEL_DIR, CHECKPOINT_KEEP_BEST)
+    candidates = {f"candidate_{i}": entry for i, entry in enumerate(registry.best_entries, start=1)}
+    if not candidates:
+        logging.error("没有可评估的检查点。")
+        return False
+    shutil.rmtree(EVAL_DIR, ignore_errors=True)
+    EVAL_DIR.mkdir(parents=True)
+
+    batches = list(batched(samples, EVAL_BATCH_SIZE))
+    results = {}
+    with open_subprocess_scheduler() as executor:
+        # 检查点打包完成后立即提交该模型的评估批次，各模型的打包与评估相互重叠
+        packaging = {executor.submit(package_checkpoint, entry["path"], EVAL_DIR / f"{name}.traineddata"): name
+                     for name, entry in candidates.items()}
+        pending = {}
+        if EVAL_INCLUDE_BASE_MODEL:
+            pending.update({executor.submit(evaluation.evaluate_batch, batch, "chi_sim", TESSDATA_PATH, EVAL_PSM):
+                            "chi_sim" for batch in batches})
+        for future in as_completed(packaging):
+            name = packaging[future]
+            if future.result():
+                pending.update({executor.submit(evaluation.evaluate_batch, batch, name, EVAL_DIR, EVAL_PSM): name
+                                for batch in batches})
+        failed = set()
+        for future in as_completed(pending):
+            name = pending[future]
+            try:
+                results.setdefault(name, []).append(future.result())
+            except Exception as exc:
+                logging.error(f"评估模型 {name} 时出错：{exc}")
+                failed.add(name)
+
+    for name in sorted(results.keys() - failed):
+        entry = candidates.get(name)
+        report["models"][name] = {
+            "checkpoint": entry["path"] if entry else None,
+            "training_loss": entry["loss"] if entry else None,
+            "fields": evaluation.merge(results[name]),
+        }
+    scored = [name for name in candidates if name in report["models"]]
+    if not scored:
+        logging.error("所有候选模型评估失败。")
+        return False
+    # 按留出集 CER、WER、训练损失依次比较
+    selected = min(scored, key=lambda name: (report["models"][name]["fields"]["all"]["cer"],
+                                             report["models"][name]["fields"]["all"]["wer"] or 0,
+                                             report["models"][name]["training_loss"]))
+    report["selected"] = selected
+
+    for name, model in report["models"].items():
+        fields = model["fields"]
+        per_field = "，".join(f"{field} {stats['cer']:.4f}" for field, stats in sorted(fields.items())
+                             if field != "all")
+        logging.info(f"{name}{' (选中)' if name == selected else ''}：训练损失 {model['training_loss']}，"
+                     f"CER {fields['all']['cer']:.4f}，WER {fields['all']['wer']:.4f}（{per_field}）")
+
+    shutil.copyfile(EVAL_DIR / f"{selected}.traineddata", OUTPUT_DIR / "my_model.traineddata")
+    with open(EVAL_REPORT_PATH, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    logging.info(f"已将留出集上最优的 {report['models'][selected]['checkpoint']} 打包为 "
+                 f"{OUTPUT_DIR / 'my_model.traineddata'}，评估报告：{EVAL_REPORT_PATH}")
+    return True
+
+def sweep_run(name, options, eval_samples):
+    """在调度器槽位中运行一组扫描配置：训练、打包最优检查点并在留出集上评估，返回结果记录"""
+    model_dir = SWEEP_DIR / name
+    shutil.rmtree(model_dir, ignore_errors=True)
+    model_dir.mkdir(parents=True)
+    prefix = model_dir / 'my_model'
+    recorder = training_progress.ProgressRecorder(model_dir / "training_progress.csv",
+                                                  model_dir / "training_progress.json")
+    registry = CheckpointRegistry(model_dir / "checkpoints.json", model_dir, CHECKPOINT_KEEP_BEST)
+    result = {"name": name, "options": options, "model_dir": str(model_dir)}
+    stop_reason = None
+    try:
+        result["returncode"], stop_reason = run_lstmtraining(lstmtraining_command(prefix, options), prefix,
+                                                             recorder, registry, run_name=name)
+    finally:
+        summary = recorder.close(stop_reason)
+    result.update(iterations=summary["last_iteration"], best_bcer=summary["best_bcer"],
+                  final_bcer=recorder.records[-1]["bcer"] if recorder.records else None,
+                  elapsed_s=summary["elapsed_s"], early_stopped=stop_reason is not None)
+    if result["returncode"] != 0 and stop_reason is None:
+        logging.error(f"[{name}] lstmtraining 返回码 {result['returncode']}，"
+                      f"查看 {model_dir / 'lstmtraining_output.log'}")
+        return result
+
+    best = registry.best()
+    if best is None or not package_checkpoint(best["path"], model_dir / "my_model.traineddata"):
+        logging.error(f"[{name}] 没有可打包的检查点。")
+        return result
+    result["checkpoint"] = best["path"]
+    if eval_samples:
+        fields = evaluation.merge(evaluation.evaluate_batch(batch, "my_model", model_dir, EVAL_PSM)
+                                  for batch in batched(eval_samples, EVAL_BATCH_SIZE))
+        result["cer"], result["wer"] = fields["all"]["cer"], fields["all"]["wer"]
+        result["fields"] = fields
+    return result
+
+def sweep_lstmtraining():
+    """并发运行 SWEEP_CONFIGS 中的各组训练，写出按留出集 CER 排序的对比表"""
+    if not SWEEP_CONFIGS:
+        logging.error("SWEEP_CONFIGS 为空，没有需要扫描的配置。")
+        return False
+    if not (MODEL_DIR / 'chi_sim.lstm').exists() or not (TRAINING_DATA_DIR / 'lstmf.training_list').exists():
+        logging.error("缺少 chi_sim.lstm 或 lstmf.training_list，请先完成 extract 之前的阶段。")
+        return False
+    SWEEP_DIR.mkdir(parents=True, exist_ok=True)
+    eval_samples = load_eval_samples()
+    if not eval_samples:
+        logging.warning("评估集为空，对比表中只有训练误差。")
+
+    # 每组训练占一个槽位：槽位的核数即该组 lstmtraining 的 OpenMP 线程数，组数多于核数时分批运行
+    threads = max(1, CPU_BUDGET // len(SWEEP_CONFIGS))
+    scheduler = subprocess_scheduler.SubprocessScheduler(CPU_BUDGET, threads, pin_cores=True)
+    logging.info(f"开始超参数扫描：{len(SWEEP_CONFIGS)} 组配置，同时运行 {scheduler.max_workers} 组，"
+                 f"每组 {threads} 个 CPU 核。")
+    results = []
+    with scheduler:
+        futures = {scheduler.submit(sweep_run, name, options, eval_samples): name
+                   for name, options in SWEEP_CONFIGS.items()}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                results.append(future.result())
+            except Exception as exc:
+                logging.error(f"[{name}] 运行时出错：{exc}")
+                results.append({"name": name, "options": SWEEP_CONFIGS[name], "error": str(exc)})
+
+    # 按留出集 CER 排序，没有评估结果的排在最后（按训练误差）
+    results.sort(key=lambda r: (r.get("cer") is None, r.get("cer") or 0, r.get("best_bcer") is None,
+                                r.get("best_bcer") or 0))
+    columns = ["name", "cer", "wer", "best_bcer", "final_bcer", "iterations", "early_stopped", "elapsed_s",
+               "options"]
+    with open(SWEEP_TABLE_PATH, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for r in results:
+            writer.writerow([json.dumps(r.get(column), ensure_ascii=False) if column == "options"
+                             else r.get(column) for column in columns])
+    with open(SWEEP_REPORT_PATH, 'w', encoding='utf-8') as f:
+        json.dump({"cores_per_run": threads, "eval_samples": len(eval_samples), "runs": results},
+                  f, ensure_ascii=False, indent=2)
+
+    def fmt(value, spec):
+        return format(value, spec) if value is not None else "-"
+
+    logging.info(f"{'配置':<20}{'CER':>8}{'WER':>8}{'最优BCER':>10}{'最终BCER':>10}{'迭代':>8}{'耗时(秒)':>10}")
+    for r in results:
+        logging.info(f"{r['name']:<20}{fmt(r.get('cer'), '.4f'):>8}{fmt(r.get('wer'), '.4f'):>8}"
+                     f"{fmt(r.get('best_bcer'), '.3f'):>10}{fmt(r.get('final_bcer'), '.3f'):>10}"
+                     f"{fmt(r.get('iterations'), 'd'):>8}{fmt(r.get('elapsed_s'), '.1f'):>10}")
+    logging.info(f"对比表：{SWEEP_TABLE_PATH}，详细结果：{SWEEP_REPORT_PATH}")
+    return any("checkpoint" in r for r in results)
 
 def clean_up():
     """清理临时文件（可选）"""
     logging.info("开始清理临时文件...")
+    if SHARD_STORE_ENABLED:
+        # 样本都在分片中，删除分片目录、解出目录与暂存目录即可
+        shard_store.ShardStore(SHARD_DIR).delete()
+        for directory in (SHARD_EXTRACT_DIR, SHARD_SCRATCH_DIR):
+            shutil.rmtree(directory, ignore_errors=True)
+        logging.info("已删除训练数据分片。")
+        return
     try:
         files_to_delete = list(TRAINING_DATA_DIR.glob("*.tif")) + \
                           list(TRAINING_DATA_DIR.glob("*.gt.txt")) + \
@@ -456,52 +1954,198 @@ def clean_up():
         for file in files_to_delete:
             if file.exists():
                 file.unlink()
-                logging.debug(f"已删除文件：{file}")
+                sample_log.debug("已删除文件：%s", file)
             else:
-                logging.warning(f"文件未找到，跳过删除：{file}")
+                sample_log.warning("文件未找到，跳过删除：%s", file)
 
         logging.info("已删除临时训练数据文件。")
     except Exception as e:
         logging.error(f"清理过程中发生错误：{e}")
 
-def generate_training_data():
+def generate_training_data(reset_progress=False):
     """生成训练数据，使用多进程加速"""
     logging.info("开始生成训练数据...")
-    refresh_fonts_cache()
-
-    # 检查并确保所需字体已安装
-    for font in FONT_NAMES.copy():  # 使用 copy 以安全地修改列表
-        if not check_font_installed(font):
-            alternative = find_alternative_font(font)
-            if alternative:
-                logging.info(f"将字体 '{font}' 替换为 '{alternative}'")
-                FONT_NAMES[FONT_NAMES.index(font)] = alternative
-            else:
-                logging.error(f"字体 '{font}' 未安装，无法继续生成训练数据。")
-                return
 
-    generate_training_samples_from_invoices()
+    # 检查所需字体，只在字体目录变化时重建索引并刷新字体缓存
+    fonts = resolve_fonts()
+    if not fonts:
+        logging.error("没有可用的字体，无法继续生成训练数据。")
+        return False
+
+    if not generate_training_samples_from_invoices(fonts, reset_progress):
+        return False
     logging.info("训练数据生成完成。")
+    return True
 
-def train_model():
-    """完整的训练流程"""
-    generate_training_data()
-    generate_lstmf_files()
-    generate_lstmf_training_list()
-    extract_lstm_from_traineddata()
-    train_lstm()
+def stage_inputs(stage, manifest):
+    """阶段的输入描述，用于计算指纹；下游阶段包含上游阶段的运行版本"""
+    base_model = file_signature(TESSDATA_PATH / "chi_sim.traineddata")
+    if stage == "generate":
+        return {
+            "invoices": file_signature(INVOICE_FILE_PATH),
+            "num_samples": NUM_SAMPLES,
+            "sample_selection": [SAMPLE_SELECTION, SELECTION_CHAR_MIN_COUNT, file_signature(UNICHARSET_PATH)]
+            if SAMPLE_SELECTION == "coverage" else SAMPLE_SELECTION,
+            "fonts": FONT_NAMES,
+            "render_engine": RENDER_ENGINE,
+            "font_weights": FONT_WEIGHTS,
+            "render_matrix": RENDER_MATRIX,
+            "render_sampling": [RENDER_SAMPLING, RENDER_SEED],
+            "shard_store": SHARD_STORE_ENABLED,
+        }
+    if stage == "augment":
+        return {
+            "generate": manifest.fingerprint_of("generate"),
+            "augment": [AUGMENT_VARIANTS, AUGMENT_SEED, AUGMENT_OPTIONS] if AUGMENT_ENABLED else None,
+            "eval_holdout_fraction": EVAL_HOLDOUT_FRACTION,
+        }
+    if stage == "lstmf":
+        return {"generate": manifest.fingerprint_of("generate"), "augment": manifest.fingerprint_of("augment"),
+                "base_model": base_model}
+    if stage == "list":
+        return {"lstmf": manifest.fingerprint_of("lstmf"), "eval_holdout_fraction": EVAL_HOLDOUT_FRACTION}
+    if stage == "extract":
+        return {"base_model": base_model}
+    if stage == "train":
+        return {
+            "list": manifest.fingerprint_of("list"),
+            "extract": manifest.fingerprint_of("extract"),
+            "max_iterations": MAX_ITERATIONS,
+            "early_stop": [EARLY_STOP_WINDOW, EARLY_STOP_MIN_DELTA, EARLY_STOP_MIN_ITERATIONS]
+            if EARLY_STOP_ENABLED else None,
+            "incremental": [INCREMENTAL_ITERATIONS, INCREMENTAL_REPLAY_FRACTION, INCREMENTAL_SEED]
+            if INCREMENTAL_ENABLED else None,
+        }
+    if stage == "evaluate":
+        return {
+            "train": manifest.fingerprint_of("train"),
+            "eval_psm": EVAL_PSM,
+            "include_base_model": EVAL_INCLUDE_BASE_MODEL,
+        }
+    raise ValueError(f"未知阶段：{stage}")
+
+def stage_outputs(stage):
+    """阶段的输出，任一输出缺失时阶段视为需要重跑"""
+    return {
+        "generate": [RENDER_DONE_PATH],
+        "augment": [AUGMENT_REPORT_PATH],
+        "lstmf": [TRAINING_DATA_DIR],
+        "list": [TRAINING_DATA_DIR / "lstmf.training_list"],
+        "extract": [MODEL_DIR / "chi_sim.lstm"],
+        "train": [OUTPUT_DIR / "my_model.traineddata"],
+        "evaluate": [EVAL_REPORT_PATH],
+    }[stage]
+
+def run_stage(stage, reset_progress=False):
+    """执行单个阶段，成功时返回 True"""
+    if stage == "generate":
+        return generate_training_data(reset_progress)
+    if stage == "augment":
+        return augment_training_samples()
+    if stage == "lstmf":
+        return generate_lstmf_files()
+    if stage == "list":
+        return generate_lstmf_training_list()
+    if stage == "extract":
+        return extract_lstm_from_traineddata()
+    if stage == "train":
+        return train_lstm()
+    if stage == "evaluate":
+        return evaluate_models()
+    raise ValueError(f"未知阶段：{stage}")
+
+def stage_log_snapshot():
+    """阶段开始时的时间与日志计数，供 log_stage_summary 计算增量"""
+    counts = LOG_COUNTER.snapshot() if LOG_COUNTER is not None else None
+    suppressed = SAMPLE_LOG_FILTER.suppressed if SAMPLE_LOG_FILTER is not None else 0
+    return time.monotonic(), counts, suppressed
+
+def log_stage_summary(stage, ok, snapshot):
+    """输出阶段摘要：耗时、警告与错误条数、主进程中被省略的逐样本日志条数"""
+    started, counts, suppressed = snapshot
+    summary = f"阶段 {stage} {'完成' if ok else '失败'}，耗时 {time.monotonic() - started:.1f} 秒"
+    if counts is not None:
+        delta = LOG_COUNTER.snapshot() - counts
+        summary += f"，警告 {delta['WARNING']} 条，错误 {delta['ERROR'] + delta['CRITICAL']} 条"
+    if SAMPLE_LOG_FILTER is not None:
+        summary += f"，省略逐样本日志 {SAMPLE_LOG_FILTER.suppressed - suppressed} 条"
+    logging.info(summary + "。")
+
+def train_model(from_stage=None, only_stage=None, force=False, until_stage=None):
+    """完整的训练流程，可断点续跑
+
+    默认跳过输入指纹未变且输出仍存在的阶段；from_stage 从指定阶段开始重跑（之前的阶段不执行），
+    only_stage 只重跑指定阶段；force 忽略清单与逐样本完成记录，全部重跑；until_stage 执行到该阶段为止。
+    """
+    manifest = PipelineManifest(PIPELINE_MANIFEST_PATH)
+    start = STAGES.index(from_stage) if from_stage else 0
+    end = STAGES.index(until_stage) + 1 if until_stage else len(STAGES)
+    for stage in STAGES[start:end]:
+        if only_stage and stage != only_stage:
+            continue
+        inputs = stage_inputs(stage, manifest)
+        stage_fingerprint = fingerprint(stage, inputs)
+        requested = force or stage in (from_stage, only_stage)
+        if not requested and manifest.is_up_to_date(stage, stage_fingerprint):
+            logging.info(f"阶段 {stage} 已是最新，跳过。")
+            continue
+
+        logging.info(f"开始执行阶段 {stage}...")
+        manifest.invalidate(stage)
+        summary = stage_log_snapshot()
+        with pipeline_metrics.span(stage, "stage", resource_usage=True) as metrics:
+            ok = metrics["ok"] = run_stage(stage, reset_progress=force)
+        log_stage_summary(stage, ok, summary)
+        if not ok:
+            logging.error(f"阶段 {stage} 失败，终止训练流程。修复后可使用 --from-stage {stage} 继续。")
+            return False
+        manifest.record(stage, stage_fingerprint, inputs, stage_outputs(stage))
     # clean_up()  # 根据需要开启或关闭清理
+    return True
+
+def write_metrics_report():
+    """汇总本次运行的计时事件，写出摘要与时间线，并在日志中列出各阶段耗时"""
+    try:
+        summary = pipeline_metrics.write_report(METRICS_DIR, METRICS_SUMMARY_PATH, METRICS_TRACE_PATH)
+    except Exception as e:
+        logging.error(f"写出计时摘要失败，错误信息：{e}")
+        return
+    for key, entry in summary["spans"].items():
+        if key.startswith("stage/"):
+            logging.info(f"{key}：耗时 {entry['total_s']} 秒，CPU {entry['cpu_s']} 秒")
+    logging.info(f"计时摘要：{METRICS_SUMMARY_PATH}，时间线：{METRICS_TRACE_PATH}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="训练定制的 Tesseract OCR 模型")
+    parser.add_argument("--from-stage", choices=STAGES, help="从指定阶段开始重跑，之前的阶段不执行")
+    parser.add_argument("--only-stage", choices=STAGES, help="只重跑指定阶段")
+    parser.add_argument("--force", action="store_true", help="忽略阶段清单与逐样本完成记录，全部重跑")
+    parser.add_argument("--worker", action="store_true", help="以工作节点模式运行：只处理 WORK_QUEUE_DIR 中的样本生成单元")
+    parser.add_argument("--sweep", action="store_true",
+                        help="完成 extract 之前的阶段后，并发运行 SWEEP_CONFIGS 中的各组训练并写出对比表")
+    return parser.parse_args()
 
 def main():
     """主函数"""
+    args = parse_args()
     log_queue = Queue()
     listener = configure_logging(log_queue)
+    if METRICS_ENABLED:
+        pipeline_metrics.configure(METRICS_DIR, reset=True)
     try:
         if not check_dependencies():
             logging.error("依赖检查失败，终止训练。")
             return
-        train_model()
+        if args.worker:
+            run_worker()
+        elif args.sweep:
+            if train_model(args.from_stage, args.only_stage, args.force, until_stage="extract"):
+                sweep_lstmtraining()
+        else:
+            train_model(args.from_stage, args.only_stage, args.force)
     finally:
+        if METRICS_ENABLED:
+            write_metrics_report()
         listener.stop()
 
 if __name__ == "__main__":
@@ -0,0 +1,107 @@
+import csv
+import json
+import re
+import time
+
+# =======================
+# lstmtraining 进度解析与提前停止
+# =======================
+#
+# lstmtraining 每隔一段迭代输出一行进度，例如：
+#   At iteration 1200/1300/1300, mean rms=0.512%, delta=1.203%, BCER train=4.321%, BWER train=12.345%,
+#   skip ratio=0.000%, New best BCER = 4.321 wrote best model:model/my_model_4.321_1200_1300.checkpoint wrote checkpoint.
+# ProgressRecorder 把每行解析为一条记录，实时追加到 CSV，结束时写出包含完整序列与摘要的 JSON；
+# PlateauStopper 在 BCER 长时间没有改善时给出停止信号。
+
+PROGRESS_PATTERN = re.compile(
+    r"At iteration (?P<iteration>\d+)/(?P<training_iteration>\d+)/(?P<sample_iteration>\d+), "
+    r"mean rms=(?P<mean_rms>[\d.]+)%, delta=(?P<delta>[\d.]+)%, "
+    r"BCER train=(?P<bcer>[\d.]+)%, BWER train=(?P<bwer>[\d.]+)%, skip ratio=(?P<skip_ratio>[\d.]+)%")
+BEST_MODEL_PATTERN = re.compile(r"wrote best model:(\S+?\.checkpoint)")
+EVENT_PATTERN = re.compile(r"New (best|worst) BCER")
+LEARNING_RATE_PATTERN = re.compile(r"learning[ _]?rate\s*[=:]\s*([\d.]+(?:e-?\d+)?)", re.IGNORECASE)
+
+FIELDS = ["elapsed_s", "iteration", "training_iteration", "sample_iteration", "mean_rms", "delta", "bcer", "bwer",
+          "skip_ratio", "learning_rate", "best_bcer", "event", "checkpoint"]
+
+
+def parse_progress_line(line):
+    """解析一行进度输出，不是进度行时返回 None"""
+    match = PROGRESS_PATTERN.search(line)
+    if not match:
+        return None
+    record = {key: (int(value) if key.endswith("iteration") else float(value))
+              for key, value in match.groupdict().items()}
+    event = EVENT_PATTERN.search(line)
+    record["event"] = event.group(1) if event else ""
+    best_model = BEST_MODEL_PATTERN.search(line)
+    record["checkpoint"] = best_model.group(1) if best_model else ""
+    return record
+
+
+class ProgressRecorder:
+    """把 lstmtraining 的输出解析为时间序列，逐行写入 CSV，结束时写出 JSON"""
+
+    def __init__(self, csv_path, json_path):
+        self.json_path = json_path
+        self.records = []
+        self.learning_rate = None
+        self.best_bcer = None
+        self.started = time.monotonic()
+        self._file = open(csv_path, 'w', encoding='utf-8', newline='')
+        self._writer = csv.DictWriter(self._file, fieldnames=FIELDS)
+        self._writer.writeheader()
+
+    def feed(self, line):
+        """处理一行输出，是进度行时返回解析出的记录"""
+        learning_rate = LEARNING_RATE_PATTERN.search(line)
+        if learning_rate:
+            self.learning_rate = float(learning_rate.group(1))
+        record = parse_progress_line(line)
+        if record is None:
+            return None
+        if self.best_bcer is None or record["bcer"] < self.best_bcer:
+            self.best_bcer = record["bcer"]
+        record.update(elapsed_s=round(time.monotonic() - self.started, 3), learning_rate=self.learning_rate,
+                      best_bcer=self.best_bcer)
+        self.records.append(record)
+        self._writer.writerow(record)
+        self._file.flush()
+        return record
+
+    def close(self, stop_reason=None):
+        self._file.close()
+        summary = {
+            "records": len(self.records),
+            "last_iteration": self.records[-1]["iteration"] if self.records else None,
+            "best_bcer": self.best_bcer,
+            "best_checkpoint": next((r["checkpoint"] for r in reversed(self.records) if r["checkpoint"]), None),
+            "elapsed_s": round(time.monotonic() - self.started, 3),
+            "stop_reason": stop_reason,
+        }
+        with open(self.json_path, 'w', encoding='utf-8') as f:
+            json.dump({"summary": summary, "series": self.records}, f, ensure_ascii=False, indent=2)
+        return summary
+
+
+class PlateauStopper:
+    """BCER 在 window 次迭代内没有比最优值下降至少 min_delta（百分点）时建议停止
+
+    迭代数达到 min_iterations 之前不会停止。
+    """
+
+    def __init__(self, window, min_delta, min_iterations=0):
+        self.window = window
+        self.min_delta = min_delta
+        self.min_iterations = min_iterations
+        self.best_bcer = None
+        self.best_iteration = 0
+
+    def update(self, record):
+        """输入一条进度记录，返回是否应当停止"""
+        iteration, bcer = record["iteration"], record["bcer"]
+        if self.best_bcer is None or bcer <= self.best_bcer - self.min_delta:
+            self.best_bcer = bcer
+            self.best_iteration = iteration
+            return False
+        return iteration >= self.min_iterations and iteration - self.best_iteration >= self.window
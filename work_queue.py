@@ -0,0 +1,180 @@
+import json
+import os
+import random
+import shutil
+import socket
+import threading
+import time
+import uuid
+from pathlib import Path
+
+# =======================
+# 共享目录工作队列
+# =======================
+#
+# 多台主机（或多个本地进程）通过共享文件系统上的目录分担样本生成，无需额外的队列服务：
+#   queue.json            队列的指纹与工作单元数，所有单元写完后才写出，工作进程据此判断队列已就绪
+#   units/<单元>.json      工作单元：一组已分配好渲染参数的样本
+#   leases/<单元>.lease    租约：以 O_EXCL 创建，持有者定期更新修改时间；超过 lease_seconds 未更新视为过期，
+#                         其他进程可以回收（节点崩溃后其单元会被重新处理）
+#   done/<单元>.json       完成记录：输出已提交到训练数据目录后写出，列出本单元的 .lstmf 文件
+# 过期判断比较本机时间与共享文件的修改时间，各主机的时钟需大致同步。
+
+
+def _write_json(path, data):
+    # 先写临时文件再替换，读取方不会看到写了一半的文件
+    tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+class WorkQueue:
+    def __init__(self, root, lease_seconds=300):
+        self.root = Path(root)
+        self.lease_seconds = lease_seconds
+        self.units_dir = self.root / "units"
+        self.leases_dir = self.root / "leases"
+        self.done_dir = self.root / "done"
+
+    def info(self):
+        """队列信息 {"stamp", "units"}，队列尚未就绪时返回 None"""
+        return _read_json(self.root / "queue.json")
+
+    def reset(self, stamp, units):
+        """清空队列并写入新的工作单元，units 是样本列表的可迭代对象；返回单元数"""
+        shutil.rmtree(self.root, ignore_errors=True)
+        for directory in (self.units_dir, self.leases_dir, self.done_dir):
+            directory.mkdir(parents=True)
+        count = 0
+        for count, samples in enumerate(units, start=1):
+            _write_json(self.units_dir / f"unit_{count:06d}.json", {"stamp": stamp, "samples": samples})
+        _write_json(self.root / "queue.json", {"stamp": stamp, "units": count})
+        return count
+
+    def done_units(self):
+        try:
+            return {name[:-len('.json')] for name in os.listdir(self.done_dir) if name.endswith('.json')}
+        except FileNotFoundError:
+            return set()
+
+    def finished(self):
+        info = self.info()
+        return info is not None and len(self.done_units()) >= info["units"]
+
+    def claim(self):
+        """领取一个未完成且未被租用（或租约已过期）的工作单元，没有时返回 None"""
+        if self.info() is None:
+            return None
+        done = self.done_units()
+        names = [name[:-len('.json')] for name in os.listdir(self.units_dir) if name.endswith('.json')]
+        names = [name for name in names if name not in done]
+        # 各进程从随机位置开始尝试，减少争抢同一个单元
+        random.shuffle(names)
+        for name in names:
+            lease = Lease(self, name)
+            if lease.acquire():
+                if (self.done_dir / f"{name}.json").exists():
+                    lease.release()  # 领取期间被其他进程完成
+                    continue
+                return lease
+        return None
+
+    def results(self):
+        """所有完成记录"""
+        for name in sorted(self.done_units()):
+            record = _read_json(self.done_dir / f"{name}.json")
+            if record is not None:
+                yield record
+
+
+class Lease:
+    """工作单元的租约；作为上下文管理器使用时在后台定期续约"""
+
+    def __init__(self, queue, unit):
+        self.queue = queue
+        self.unit = unit
+        self.path = queue.leases_dir / f"{unit}.lease"
+        self.token = uuid.uuid4().hex
+        self.reclaimed = False
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    def acquire(self):
+        for _ in range(2):
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if not self._break_expired():
+                    return False
+                continue
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({"token": self.token, "host": socket.gethostname(), "pid": os.getpid(),
+                           "claimed_at": time.time()}, f)
+            return True
+        return False
+
+    def _break_expired(self):
+        """租约过期时把它移走，返回是否可以重新尝试创建"""
+        try:
+            if time.time() - self.path.stat().st_mtime < self.queue.lease_seconds:
+                return False
+            stale = self.path.with_name(f"{self.path.name}.{self.token}.stale")
+            os.rename(self.path, stale)
+        except FileNotFoundError:
+            return True  # 租约刚被释放
+        # 检查与改名之间租约可能已被其他进程回收并重新创建，此时把它放回
+        if time.time() - stale.stat().st_mtime < self.queue.lease_seconds:
+            try:
+                os.link(stale, self.path)
+            except FileExistsError:
+                pass
+            stale.unlink(missing_ok=True)
+            return False
+        stale.unlink(missing_ok=True)
+        self.reclaimed = True
+        return True
+
+    def load(self):
+        """工作单元的内容 {"stamp", "samples"}"""
+        return _read_json(self.queue.units_dir / f"{self.unit}.json")
+
+    def renew(self):
+        try:
+            os.utime(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _renew_periodically(self):
+        while not self._stop.wait(self.queue.lease_seconds / 3):
+            self.renew()
+
+    def commit(self, record):
+        """写出完成记录并释放租约"""
+        _write_json(self.queue.done_dir / f"{self.unit}.json",
+                    {"unit": self.unit, "host": socket.gethostname(), "completed_at": time.time(), **record})
+        self.release()
+
+    def release(self):
+        self._stop.set()
+        # 只删除自己持有的租约；租约过期被回收后文件属于新的持有者
+        current = _read_json(self.path)
+        if current is not None and current.get("token") == self.token:
+            self.path.unlink(missing_ok=True)
+
+    def __enter__(self):
+        self._heartbeat = threading.Thread(target=self._renew_periodically, daemon=True)
+        self._heartbeat.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        self._heartbeat.join()